@@ -0,0 +1 @@
+# ScinoPharm Nitrosamine Monitor 共用模組 (可在 Streamlit 以外匯入)
@@ -0,0 +1,7 @@
+import sys
+
+from .cli import main
+
+# PDF 解析子行程 (forkserver / spawn) 會以 __mp_main__ 重新匯入本模組，不可再執行 CLI
+if __name__ == "__main__":
+    sys.exit(main())
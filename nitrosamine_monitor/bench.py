@@ -0,0 +1,191 @@
+import io
+import json
+import platform
+import statistics
+import time
+
+import pandas as pd
+
+from . import synthetic
+from .matching import (build_match_index, collect_ema_matches,
+                       collect_fda_matches)
+from .pdf_parse import parse_product_pdfs
+from .products import parse_uploaded_file
+from .report import build_summary, generate_excel, mark_new_records
+from .sources import parse_ema_workbook, parse_fda_page
+
+# ==========================================
+# 效能基準測試 (Benchmark)
+# ==========================================
+# 全程離線：以 synthetic 產生各規模的輸入，逐階段計時，
+# 輸出 JSON 報告並可與先前的報告比較，找出效能退化。
+
+BENCH_SIZES = [100, 1000]
+BENCH_STAGES = [
+    "pdf_parse", "upload_csv", "upload_xlsx", "fda_parse", "ema_parse",
+    "match_index", "match_fda", "match_ema", "history_diff", "export"
+]
+REGRESSION_THRESHOLD = 0.25
+
+
+def _named_file(data, name):
+    # 模擬 Streamlit UploadedFile (需要 .name 判斷格式)
+    f = io.BytesIO(data)
+    f.name = name
+    return f
+
+
+def build_fixtures(size, seed=0):
+    names = synthetic.product_names(size, seed)
+    # 法規表格中的藥名一半來自產品清單，一半為不相關藥名
+    drugs = names[:max(1, size // 2)] + synthetic.product_names(
+        max(1, size // 2), seed + 1)
+    return {
+        'pdf': synthetic.make_product_pdf(names, seed=seed),
+        'csv': synthetic.make_product_csv(names, seed),
+        'xlsx': synthetic.make_product_xlsx(names, seed),
+        'fda_html': synthetic.make_fda_page(drugs, rows=size, seed=seed),
+        'ema_xlsx': synthetic.make_ema_workbook(drugs, rows=size, seed=seed)
+    }
+
+
+def _time_stage(fn, repeat):
+    runs = []
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        runs.append(time.perf_counter() - t0)
+    return result, runs
+
+
+def run_size(size, repeat=3, match_mode="token", pdf_workers=None, seed=0,
+             stages=None, progress=None):
+    progress = progress or (lambda msg: None)
+    stages = stages or BENCH_STAGES
+    fixtures = build_fixtures(size, seed)
+    results = []
+
+    def record(stage, fn, items):
+        # 下游階段仍需要上游結果，未選取的階段只執行一次且不列入報告
+        if stage not in stages:
+            return fn()
+        value, runs = _time_stage(fn, repeat)
+        count = items(value)
+        results.append({
+            'size': size,
+            'stage': stage,
+            'best': min(runs),
+            'median': statistics.median(runs),
+            'items': count
+        })
+        progress(f"  {stage:<13} {min(runs):8.3f}s  ({count} items)")
+        return value
+
+    # 不使用逐頁快取：重複執行時量測的是解析本身
+    record("pdf_parse",
+           lambda: parse_product_pdfs(
+               [fixtures['pdf']], workers=pdf_workers, use_cache=False),
+           lambda parsed: sum(len(names) for names in parsed[0][0]))
+    record("upload_csv",
+           lambda: parse_uploaded_file(_named_file(fixtures['csv'], "p.csv")),
+           lambda res: len(res[0]))
+    api_list, _ = record(
+        "upload_xlsx",
+        lambda: parse_uploaded_file(_named_file(fixtures['xlsx'], "p.xlsx")),
+        lambda res: len(res[0]))
+    fda_df, fda_date, _ = record("fda_parse",
+                                 lambda: parse_fda_page(fixtures['fda_html']),
+                                 lambda res: len(res[0]))
+    ema_df, _ = record("ema_parse",
+                       lambda: parse_ema_workbook(fixtures['ema_xlsx']),
+                       lambda res: len(res[0]))
+    match_index = record("match_index", lambda: build_match_index(api_list),
+                         lambda index: len(index['products']))
+    fda_matches = record(
+        "match_fda", lambda: collect_fda_matches(fda_df, fda_date, api_list,
+                                                 match_index, match_mode), len)
+    ema_matches = record(
+        "match_ema", lambda: collect_ema_matches(
+            ema_df, synthetic.EMA_DATE, api_list, match_index, match_mode),
+        len)
+
+    summary = build_summary([fda_matches, ema_matches])
+    # 歷史報表：去掉約一成資料，讓比對時有 ★ NEW 可標記
+    history = generate_excel(summary.drop(summary.index[::10]), fda_df,
+                             ema_df)
+    record("history_diff",
+           lambda: mark_new_records(summary.copy(),
+                                    [_named_file(history, "history.xlsx")]),
+           lambda count: count)
+    record("export", lambda: generate_excel(summary, fda_df, ema_df),
+           lambda data: len(summary))
+    return results
+
+
+def run_benchmark(sizes=None, repeat=3, match_mode="token", pdf_workers=None,
+                  seed=0, stages=None, progress=None):
+    progress = progress or (lambda msg: None)
+    results = []
+    for size in sizes or BENCH_SIZES:
+        progress(f"--- size {size} ---")
+        results.extend(
+            run_size(size, repeat, match_mode, pdf_workers, seed, stages,
+                     progress))
+    return {
+        'meta': {
+            'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'repeat': repeat,
+            'match_mode': match_mode,
+            'pdf_workers': pdf_workers,
+            'seed': seed
+        },
+        'results': results
+    }
+
+
+def format_report(report):
+    sizes = sorted({r['size'] for r in report['results']})
+    stages = [s for s in BENCH_STAGES
+              if any(r['stage'] == s for r in report['results'])]
+    best = {(r['size'], r['stage']): r['best'] for r in report['results']}
+    lines = [f"{'stage':<13}" + "".join(f"{size:>12}" for size in sizes)]
+    for stage in stages:
+        cells = [best.get((size, stage)) for size in sizes]
+        lines.append(f"{stage:<13}" + "".join(
+            f"{c:>11.3f}s" if c is not None else f"{'-':>12}" for c in cells))
+    return "\n".join(lines)
+
+
+def compare_reports(report, baseline, threshold=REGRESSION_THRESHOLD):
+    # 以最佳時間 (best) 比較；同 size/stage 才比，變慢超過門檻視為退化
+    old = {(r['size'], r['stage']): r['best'] for r in baseline['results']}
+    lines = []
+    regressions = []
+    for r in report['results']:
+        key = (r['size'], r['stage'])
+        if key not in old or old[key] <= 0:
+            continue
+        ratio = r['best'] / old[key]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  ⚠️ REGRESSION"
+            regressions.append(key)
+        elif ratio < 1 / (1 + threshold):
+            flag = "  ✅ faster"
+        lines.append(f"{r['stage']:<13} {r['size']:>8} {old[key]:9.3f}s -> "
+                     f"{r['best']:9.3f}s  x{ratio:5.2f}{flag}")
+    return lines, regressions
+
+
+def load_report(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_report(report, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
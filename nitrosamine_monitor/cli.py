@@ -0,0 +1,514 @@
+import argparse
+import os
+import sys
+import time
+
+# 啟動計時起點：重型套件 (pandas / pdfplumber / bs4 / openpyxl) 皆於各階段才匯入
+_T_START = time.perf_counter()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m nitrosamine_monitor",
+        description="ScinoPharm Nitrosamine Monitor (headless / batch)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    analyze = sub.add_parser("analyze",
+                             help="比對產品清單並輸出 Excel 報表 (Analysis)")
+    source = analyze.add_mutually_exclusive_group(required=True)
+    source.add_argument("--products",
+                        metavar="FILE",
+                        help="產品清單 .xlsx / .csv (支援 SPT 欄位)")
+    source.add_argument("--scrape",
+                        action="store_true",
+                        help="自動爬取神隆官網產品清單 (Auto-Scrape)")
+    analyze.add_argument("-o",
+                         "--output",
+                         metavar="FILE",
+                         help="報表輸出路徑 (預設為 UI 下載的檔名)")
+    analyze.add_argument("--format",
+                         choices=["xlsx", "xlsx_stream", "csv_zip",
+                                  "parquet_zip", "summary_only"],
+                         default="xlsx",
+                         help="報表格式 (預設 xlsx；xlsx_stream 為低記憶體串流寫入)")
+    analyze.add_argument("--measure-memory",
+                         action="store_true",
+                         help="以 tracemalloc 精確量測匯出記憶體峰值 (較慢；"
+                         "預設只回報 RSS 高水位)")
+    analyze.add_argument("--history",
+                         metavar="XLSX",
+                         action="append",
+                         help="先前的結果，用於標記 ★ NEW (可重複指定多份)")
+    analyze.add_argument("--delta",
+                         action="store_true",
+                         help="只比對 FDA/EMA 自上次執行以來新增/變動的列 (快照差異)")
+    analyze.add_argument("--match-mode",
+                         choices=["token", "regex", "fuzzy"],
+                         default="token",
+                         help="比對引擎 (預設 token)")
+    analyze.add_argument("--fuzzy-threshold",
+                         type=float,
+                         metavar="T",
+                         help="fuzzy 模式的相似度門檻 0-1 (預設 0.85，可用 SPT_FUZZY_THRESHOLD 設定)")
+    analyze.add_argument("--pdf-workers",
+                         type=int,
+                         metavar="N",
+                         help="PDF 解析 process 數 (0 = CPU 數, 1 = 單執行緒)")
+    analyze.add_argument("--timings",
+                         action="store_true",
+                         help="輸出各階段耗時 (含啟動時間)")
+    analyze.add_argument("--metrics",
+                         metavar="JSON",
+                         help="輸出本次執行的量測資料 (階段耗時、計數器) 為 JSON")
+    analyze.add_argument("-v",
+                         "--verbose",
+                         action="store_true",
+                         help="顯示進度與 Debug Logs")
+    analyze.set_defaults(func=cmd_analyze)
+
+    batch = sub.add_parser("batch",
+                           help="多份產品清單共用一次下載與比對，各自輸出報表 (Batch)")
+    batch.add_argument("products",
+                       nargs="+",
+                       metavar="FILE",
+                       help="產品清單 .xlsx / .csv (每份輸出一個報表)")
+    batch.add_argument("--out-dir",
+                       default=".",
+                       metavar="DIR",
+                       help="報表輸出資料夾 (預設目前目錄)")
+    batch.add_argument("--format",
+                       choices=["xlsx", "xlsx_stream", "csv_zip",
+                                "parquet_zip", "summary_only"],
+                       default="xlsx",
+                       help="報表格式 (預設 xlsx)")
+    batch.add_argument("--match-mode",
+                       choices=["token", "regex", "fuzzy"],
+                       default="token",
+                       help="比對引擎 (預設 token)")
+    batch.add_argument("--fuzzy-threshold",
+                       type=float,
+                       metavar="T",
+                       help="fuzzy 模式的相似度門檻 0-1 (預設 0.85，可用 SPT_FUZZY_THRESHOLD 設定)")
+    batch.add_argument("--metrics",
+                       metavar="JSON",
+                       help="輸出本次執行的量測資料為 JSON")
+    batch.add_argument("-v",
+                       "--verbose",
+                       action="store_true",
+                       help="顯示進度與 Debug Logs")
+    batch.set_defaults(func=cmd_batch)
+
+    bench = sub.add_parser("bench",
+                           help="以合成資料離線量測各階段耗時 (Benchmark)")
+    bench.add_argument("--sizes",
+                       default="100,1000",
+                       help="資料規模 (產品數 / 法規列數)，逗號分隔 (預設 100,1000)")
+    bench.add_argument("--repeat",
+                       type=int,
+                       default=3,
+                       help="每階段重複次數，取最佳值 (預設 3)")
+    bench.add_argument("--stages",
+                       help="只量測指定階段，逗號分隔 (預設全部)")
+    bench.add_argument("--match-mode",
+                       choices=["token", "regex", "fuzzy"],
+                       default="token",
+                       help="比對引擎 (預設 token)")
+    bench.add_argument("--pdf-workers",
+                       type=int,
+                       metavar="N",
+                       help="PDF 解析 process 數 (0 = CPU 數, 1 = 單執行緒)")
+    bench.add_argument("--seed", type=int, default=0, help="合成資料亂數種子")
+    bench.add_argument("-o",
+                       "--output",
+                       metavar="JSON",
+                       help="儲存報告 (JSON)，可作為之後的 --baseline")
+    bench.add_argument("--baseline",
+                       metavar="JSON",
+                       help="與先前的報告比較並標示效能退化")
+    bench.add_argument("--threshold",
+                       type=float,
+                       default=0.25,
+                       help="變慢超過此比例視為退化 (預設 0.25)")
+    bench.add_argument("--fail-on-regression",
+                       action="store_true",
+                       help="有退化時以 exit code 1 結束")
+    bench.set_defaults(func=cmd_bench)
+
+    standin = sub.add_parser(
+        "standin", help="啟動本機替身伺服器，模擬 FDA / EMA / 神隆官網 (Stand-in)")
+    standin.add_argument("--host", default="127.0.0.1", help="監聽位址")
+    standin.add_argument("--port", type=int, default=8765, help="監聽埠 (預設 8765)")
+    standin.add_argument("--size",
+                         type=int,
+                         default=300,
+                         help="合成資料規模 (產品數 / 法規列數，預設 300)")
+    standin.add_argument("--seed", type=int, default=0, help="合成資料亂數種子")
+    standin.add_argument("--recorded",
+                         metavar="DIR",
+                         help="以 HTTP 磁碟快取中實際抓取過的回應取代合成內容")
+    add_fault_arguments(standin)
+    standin.set_defaults(func=cmd_standin)
+
+    loadtest = sub.add_parser("loadtest",
+                              help="對替身伺服器模擬多個同時分析的 session (Load Test)")
+    loadtest.add_argument("--sessions",
+                          type=int,
+                          default=20,
+                          help="分析 session 總數 (預設 20)")
+    loadtest.add_argument("--concurrency",
+                          type=int,
+                          default=8,
+                          help="同時執行的 session 數 (預設 8)")
+    loadtest.add_argument("--size",
+                          type=int,
+                          default=300,
+                          help="合成資料規模 (預設 300)")
+    loadtest.add_argument("--seed", type=int, default=0, help="合成資料亂數種子")
+    loadtest.add_argument("--recorded",
+                          metavar="DIR",
+                          help="以 HTTP 磁碟快取中實際抓取過的回應取代合成內容")
+    loadtest.add_argument("--scrape",
+                          action="store_true",
+                          help="每個 session 都爬取 (替身) 官網產品清單，而非讀取上傳檔")
+    loadtest.add_argument("--shared",
+                          action="store_true",
+                          help="與 UI 相同：FDA / EMA 由背景更新提供，所有 session 共用同一份快照")
+    loadtest.add_argument("--cold-cache",
+                          action="store_true",
+                          help="停用磁碟快取 (HTTP / 解析後表格 / PDF 逐頁)，每個 session 都完整下載與解析")
+    loadtest.add_argument("--match-mode",
+                          choices=["token", "regex", "fuzzy"],
+                          default="token",
+                          help="比對引擎 (預設 token)")
+    loadtest.add_argument("--format",
+                          choices=["xlsx", "xlsx_stream", "csv_zip",
+                                   "parquet_zip", "summary_only"],
+                          default="xlsx",
+                          help="報表格式 (預設 xlsx)")
+    add_fault_arguments(loadtest)
+    loadtest.add_argument("-o",
+                          "--output",
+                          metavar="JSON",
+                          help="儲存報告 (JSON，含每個 session 的明細)")
+    loadtest.set_defaults(func=cmd_loadtest)
+
+    return parser
+
+
+def add_fault_arguments(parser):
+    faults = parser.add_argument_group("故障注入 (Fault Injection)")
+    faults.add_argument("--latency",
+                        type=float,
+                        default=0.0,
+                        help="每個回應的固定延遲 (秒)")
+    faults.add_argument("--jitter",
+                        type=float,
+                        default=0.0,
+                        help="額外隨機延遲上限 (秒)")
+    faults.add_argument("--error-rate",
+                        type=float,
+                        default=0.0,
+                        help="回傳 503 的機率 (0-1)")
+    faults.add_argument("--reset-rate",
+                        type=float,
+                        default=0.0,
+                        help="直接中斷連線的機率 (0-1)")
+    faults.add_argument("--stall-rate",
+                        type=float,
+                        default=0.0,
+                        help="停頓 --stall 秒才回應的機率 (0-1)")
+    faults.add_argument("--stall",
+                        type=float,
+                        default=30.0,
+                        help="停頓秒數 (預設 30)")
+
+
+def fault_options(args):
+    return {
+        'latency': args.latency,
+        'jitter': args.jitter,
+        'error_rate': args.error_rate,
+        'reset_rate': args.reset_rate,
+        'stall_rate': args.stall_rate,
+        'stall': args.stall
+    }
+
+
+def print_timings(timings):
+    print("--- Timings (s) ---")
+    for stage, seconds in timings.items():
+        print(f"{stage:<10} {seconds:8.3f}")
+
+
+def cmd_analyze(args):
+    verbose = print if args.verbose else (lambda msg: None)
+
+    from .metrics import collect, metrics_to_json, stage, stage_wall_times
+    from .names import format_name_memo_stats
+    from .pipeline import run_analysis
+    from .products import get_scinopharm_apis_auto, parse_uploaded_file
+    startup = time.perf_counter() - _T_START
+
+    exit_code = 0
+    with collect() as run:
+        with stage("products"):
+            if args.scrape:
+                api_list, logs = get_scinopharm_apis_auto(
+                    pdf_workers=args.pdf_workers)
+            else:
+                with open(args.products, "rb") as f:
+                    api_list, logs = parse_uploaded_file(f)
+
+        for msg in logs:
+            verbose(msg)
+
+        if not api_list:
+            print("❌ 未找到產品，請檢查連線或產品清單格式。", file=sys.stderr)
+            exit_code = 1
+        else:
+            print(f"目前監控清單: {len(api_list)} 項產品")
+            result = run_analysis(api_list,
+                                  history_files=args.history,
+                                  match_mode=args.match_mode,
+                                  fuzzy_threshold=args.fuzzy_threshold,
+                                  delta_only=args.delta,
+                                  progress=verbose)
+            write_report(args, result, verbose)
+        verbose(format_name_memo_stats())
+
+    if args.metrics:
+        with open(args.metrics, "w", encoding="utf-8") as f:
+            f.write(metrics_to_json(run))
+    if args.timings:
+        timings = {'startup': startup}
+        timings.update(stage_wall_times(run))
+        timings['total'] = time.perf_counter() - _T_START
+        print_timings(timings)
+    return exit_code
+
+
+def write_report(args, result, verbose):
+    from .export import EXPORT_FILES, export_report, format_export_memory
+
+    if args.delta:
+        from .snapshots import format_delta
+        for delta in result['deltas'].values():
+            print(format_delta(delta))
+        for source, reason in result['delta_fallbacks'].items():
+            print(f"⚠️ {source} {reason}，已改為完整比對 (未標記 ★ NEW / ★ CHANGED)",
+                  file=sys.stderr)
+    for msg in result['fda_logs'] + result['ema_logs']:
+        verbose(msg)
+
+    summary = result['summary']
+    if summary is None:
+        print("⚠️ 沒有比對到結果。")
+        return
+
+    if result['history_error']:
+        print(f"歷史檔案比對失敗: {result['history_error']}", file=sys.stderr)
+    elif result['new_count'] is not None:
+        print(f"🔔 新資料 (★ NEW): {result['new_count']} 筆")
+
+    refs = None
+    if args.format == "summary_only":
+        from .snapshots import snapshot_refs
+        refs = snapshot_refs(result['deltas'], result['delta_fallbacks'])
+
+    output = args.output or EXPORT_FILES[args.format][0]
+    export = export_report(summary,
+                           result['fda_df'],
+                           result['ema_df'],
+                           fmt=args.format,
+                           output=output,
+                           snapshot_refs=refs,
+                           measure_memory=args.measure_memory)
+    print(f"📊 比對結果 {len(summary)} 筆 -> {output}")
+    memory = format_export_memory(export)
+    if memory:
+        print(f"匯出{memory}")
+
+
+def portfolio_names(paths):
+    # 以檔名 (不含副檔名) 作為清單名稱，重複時加上序號
+    names = []
+    for path in paths:
+        base = os.path.splitext(os.path.basename(path))[0]
+        name = base
+        n = 2
+        while name in names:
+            name = f"{base}_{n}"
+            n += 1
+        names.append(name)
+    return names
+
+
+def cmd_batch(args):
+    verbose = print if args.verbose else (lambda msg: None)
+
+    from .export import EXPORT_FILES, export_report
+    from .metrics import collect, metrics_to_json, stage
+    from .pipeline import run_batch
+    from .products import parse_uploaded_file
+
+    with collect() as run:
+        portfolios = {}
+        with stage("products"):
+            for name, path in zip(portfolio_names(args.products),
+                                  args.products):
+                with open(path, "rb") as f:
+                    api_list, logs = parse_uploaded_file(f)
+                for msg in logs:
+                    verbose(f"[{name}] {msg}")
+                if not api_list:
+                    print(f"⚠️ {path}: 未讀取到產品，略過", file=sys.stderr)
+                    continue
+                portfolios[name] = api_list
+
+        if not portfolios:
+            print("❌ 沒有可用的產品清單。", file=sys.stderr)
+            return 1
+
+        result = run_batch(portfolios,
+                           match_mode=args.match_mode,
+                           fuzzy_threshold=args.fuzzy_threshold,
+                           progress=verbose)
+        for msg in result['fda_logs'] + result['ema_logs']:
+            verbose(msg)
+
+        refs = None
+        if args.format == "summary_only":
+            from .snapshots import snapshot_refs
+            refs = snapshot_refs(result['deltas'])
+
+        os.makedirs(args.out_dir, exist_ok=True)
+        rows = []
+        for name, item in result['portfolios'].items():
+            output = None
+            export_seconds = 0.0
+            if item['summary'] is not None:
+                output = os.path.join(
+                    args.out_dir, f"{name}_{EXPORT_FILES[args.format][0]}")
+                export = export_report(item['summary'],
+                                       result['fda_df'],
+                                       result['ema_df'],
+                                       fmt=args.format,
+                                       output=output,
+                                       snapshot_refs=refs)
+                export_seconds = export['seconds']
+            rows.append((name, item['products'], item['matches'],
+                         item['seconds'], export_seconds, output or "-"))
+
+    print(f"--- Batch: {len(rows)} 份清單 ---")
+    print(f"{'portfolio':<20} {'products':>8} {'matches':>8} "
+          f"{'collect':>8} {'export':>8}  report")
+    for name, products, matches, seconds, export_seconds, output in rows:
+        print(f"{name:<20} {products:>8} {matches:>8} {seconds:8.3f} "
+              f"{export_seconds:8.3f}  {output}")
+    print_timings({
+        stage_name: entry['wall']
+        for stage_name, entry in run['stages'].items()
+        if stage_name in ("products", "fetch", "snapshot", "match", "export")
+    })
+
+    if args.metrics:
+        with open(args.metrics, "w", encoding="utf-8") as f:
+            f.write(metrics_to_json(run))
+    return 0
+
+
+def cmd_bench(args):
+    from .bench import (BENCH_STAGES, compare_reports, format_report,
+                        load_report, run_benchmark, save_report)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    stages = None
+    if args.stages:
+        stages = [stage.strip() for stage in args.stages.split(",")]
+        unknown = [stage for stage in stages if stage not in BENCH_STAGES]
+        if unknown:
+            print(f"❌ 未知的階段: {', '.join(unknown)} "
+                  f"(可用: {', '.join(BENCH_STAGES)})",
+                  file=sys.stderr)
+            return 2
+
+    report = run_benchmark(sizes,
+                           repeat=args.repeat,
+                           match_mode=args.match_mode,
+                           pdf_workers=args.pdf_workers,
+                           seed=args.seed,
+                           stages=stages,
+                           progress=print)
+    print("--- Best of %d (s) ---" % args.repeat)
+    print(format_report(report))
+
+    if args.output:
+        save_report(report, args.output)
+        print(f"📄 報告已儲存: {args.output}")
+
+    if args.baseline:
+        lines, regressions = compare_reports(report,
+                                             load_report(args.baseline),
+                                             args.threshold)
+        print(f"--- vs {args.baseline} ---")
+        for line in lines:
+            print(line)
+        if regressions:
+            print(f"⚠️ {len(regressions)} 個階段變慢超過 "
+                  f"{args.threshold:.0%}")
+            if args.fail_on_regression:
+                return 1
+    return 0
+
+
+def cmd_standin(args):
+    from .standin import (recorded_site, standin_stats, start_standin,
+                          stop_standin, synthetic_site)
+
+    site, _ = synthetic_site(args.size, args.seed)
+    if args.recorded:
+        site.update(recorded_site(args.recorded))
+    standin = start_standin(site,
+                            fault_options(args),
+                            host=args.host,
+                            port=args.port)
+    print(f"🧪 替身伺服器: {standin['base_url']} ({len(site)} 個路徑)")
+    print(f"   SPT_SOURCE_BASE_URL={standin['base_url']} 讓 UI / CLI 改連此伺服器")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_standin(standin)
+        print(standin_stats(standin))
+    return 0
+
+
+def cmd_loadtest(args):
+    from .loadtest import format_load_report, run_load_test, save_load_report
+
+    report = run_load_test(sessions=args.sessions,
+                           concurrency=args.concurrency,
+                           size=args.size,
+                           seed=args.seed,
+                           faults=fault_options(args),
+                           match_mode=args.match_mode,
+                           export_format=args.format,
+                           scrape=args.scrape,
+                           recorded=args.recorded,
+                           shared=args.shared,
+                           cold_cache=args.cold_cache,
+                           progress=print)
+    print("--- Load test (s) ---")
+    print(format_load_report(report))
+
+    if args.output:
+        save_load_report(report, args.output)
+        print(f"📄 報告已儲存: {args.output}")
+    return 0 if report['failed'] == 0 else 1
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
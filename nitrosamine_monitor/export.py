@@ -0,0 +1,254 @@
+import datetime
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from .metrics import count_metric, peak_metric, peak_rss_bytes, stage
+from .report import REPORT_FILE_NAME, REPORT_MIME, generate_excel
+
+# ==========================================
+# 報表匯出模式 (Export Formats)
+# ==========================================
+# xlsx        : 原本的 generate_excel (pandas + BytesIO)
+# xlsx_stream : xlsxwriter constant_memory，依欄陣列逐列寫入暫存檔
+# csv_zip     : Summary / FDA / EMA 各一個 CSV 壓縮成 zip
+# parquet_zip : 同上，改為 Parquet (需要 pyarrow)
+# summary_only: 只輸出 Summary_Match，原始資料以快照編號引用
+EXPORT_FORMATS = {
+    "xlsx": "Excel (完整)",
+    "xlsx_stream": "Excel 串流 (低記憶體)",
+    "csv_zip": "CSV 壓縮包 (.zip)",
+    "parquet_zip": "Parquet 壓縮包 (.zip)",
+    "summary_only": "僅 Summary (原始資料以快照引用)"
+}
+
+_BASE_NAME = os.path.splitext(REPORT_FILE_NAME)[0]
+EXPORT_FILES = {
+    "xlsx": (REPORT_FILE_NAME, REPORT_MIME),
+    "xlsx_stream": (REPORT_FILE_NAME, REPORT_MIME),
+    "csv_zip": (f"{_BASE_NAME}_csv.zip", "application/zip"),
+    "parquet_zip": (f"{_BASE_NAME}_parquet.zip", "application/zip"),
+    "summary_only": (f"{_BASE_NAME}_summary.xlsx", REPORT_MIME)
+}
+
+SHEET_NAMES = ["Summary_Match", "Raw_FDA_Data", "Raw_EMA_Data"]
+BUNDLE_NAMES = ["summary", "raw_fda", "raw_ema"]
+
+# 與 pandas to_excel 相同的表頭樣式
+_HEADER_FORMAT = {
+    'bold': True,
+    'border': 1,
+    'align': 'center',
+    'valign': 'top'
+}
+
+
+def _excel_value(val):
+    # 與 pandas ExcelWriter 相同的儲存格轉換；缺值回傳 None (不寫入)
+    if pd.api.types.is_scalar(val) and pd.isna(val):
+        return None, None
+    if isinstance(val, (bool, np.bool_)):
+        return bool(val), None
+    if isinstance(val, (int, np.integer)):
+        return int(val), None
+    if isinstance(val, (float, np.floating)):
+        val = float(val)
+        if np.isinf(val):
+            return ("inf" if val > 0 else "-inf"), None
+        return val, None
+    if isinstance(val, datetime.datetime):
+        return val, 'datetime'
+    if isinstance(val, datetime.date):
+        return val, 'date'
+    if isinstance(val, datetime.timedelta):
+        return val.total_seconds() / 86400, 'timedelta'
+    if isinstance(val, str):
+        return val, None
+    return str(val), None
+
+
+def _write_sheet_stream(workbook, formats, sheet_name, df):
+    worksheet = workbook.add_worksheet(sheet_name)
+    worksheet.set_column(0, 9, 20)
+    if df.shape[1] == 0:
+        return
+
+    for j, name in enumerate(df.columns):
+        value, _ = _excel_value(name)
+        worksheet.write(0, j, value if value is not None else "",
+                        formats['header'])
+
+    # 一次取一欄的 object 陣列，逐列寫出 (constant_memory 必須依列序寫入)
+    columns = [df.iloc[:, j].to_numpy(dtype=object) for j in range(df.shape[1])]
+    for i in range(len(df)):
+        for j, column in enumerate(columns):
+            value, kind = _excel_value(column[i])
+            if value is None:
+                continue
+            if kind:
+                worksheet.write(i + 1, j, value, formats[kind])
+            else:
+                worksheet.write(i + 1, j, value)
+
+
+def write_xlsx_stream(fh, frames):
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(fh, {'constant_memory': True})
+    formats = {
+        'header': workbook.add_format(_HEADER_FORMAT),
+        'datetime': workbook.add_format({'num_format': 'YYYY-MM-DD HH:MM:SS'}),
+        'date': workbook.add_format({'num_format': 'YYYY-MM-DD'}),
+        'timedelta': workbook.add_format({'num_format': '0'})
+    }
+    for sheet_name, df in frames:
+        _write_sheet_stream(workbook, formats, sheet_name, df)
+    workbook.close()
+
+
+def _unique_columns(df):
+    # Parquet 需要唯一的字串欄名 (EMA 表頭可能重複或為 nan)
+    seen = {}
+    names = []
+    for c in df.columns:
+        name = str(c)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}_{seen[name]}"
+        seen.setdefault(name, 0)
+        names.append(name)
+    return names
+
+
+def _parquet_frame(df):
+    # 混合型別的 object 欄位 (數字 + 文字) 無法直接寫入 Parquet，統一轉成字串
+    out = df.copy()
+    out.columns = _unique_columns(df)
+    for j in range(out.shape[1]):
+        if out.iloc[:, j].dtype == object:
+            out.isetitem(j, out.iloc[:, j].astype("string"))
+    return out
+
+
+def write_bundle(fh, frames, kind):
+    with zipfile.ZipFile(fh, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, df in frames:
+            if kind == "csv":
+                with zf.open(f"{name}.csv", "w") as raw:
+                    with io.TextIOWrapper(raw, encoding="utf-8-sig",
+                                          newline="") as text:
+                        df.to_csv(text, index=False)
+            else:
+                with zf.open(f"{name}.parquet", "w") as raw:
+                    _parquet_frame(df).to_parquet(raw, index=False)
+
+
+def snapshot_ref_frame(snapshot_refs):
+    columns = ["Source", "Snapshot ID", "Rows", "Source date", "Fetched at",
+               "Delta", "Snapshot DB"]
+    if not snapshot_refs:
+        return pd.DataFrame(
+            [["N/A", "快照未啟用或無資料，請改用完整匯出", None, None, None, None,
+              None]],
+            columns=columns)
+    return pd.DataFrame(snapshot_refs, columns=columns)
+
+
+def export_report(match_df,
+                  fda_raw,
+                  ema_raw,
+                  fmt="xlsx",
+                  output=None,
+                  snapshot_refs=None,
+                  measure_memory=False):
+    # output 為路徑時直接寫檔 (不在記憶體中保留整份報表)，否則回傳 bytes
+    # 回傳 {'data', 'file_name', 'mime', 'seconds', 'output_bytes',
+    #       'peak_rss_bytes', 'rss_growth_bytes', 'peak_bytes'}
+    # 預設只讀取行程的 RSS 高水位 (匯出前後各一次，幾乎無成本)：rss_growth_bytes
+    # 為匯出使高水位上升的量 (未超過先前峰值時為 0)
+    # measure_memory: 另以 tracemalloc 精確量測 Python 記憶體峰值 (會慢數倍)
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    tracing = tracemalloc.is_tracing()
+    if measure_memory:
+        if tracing:
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.start()
+    peak = None
+    rss_before = peak_rss_bytes()
+    t0 = time.perf_counter()
+
+    try:
+        data = None
+        if fmt == "xlsx":
+            data = generate_excel(match_df, fda_raw, ema_raw)
+            output_bytes = len(data)
+            if output is not None:
+                with open(output, "wb") as f:
+                    f.write(data)
+                data = None
+        else:
+            with stage("export"):
+                fh = (open(output, "wb")
+                      if output is not None else tempfile.TemporaryFile())
+                with fh:
+                    if fmt == "xlsx_stream":
+                        write_xlsx_stream(
+                            fh, zip(SHEET_NAMES, [match_df, fda_raw, ema_raw]))
+                    elif fmt == "summary_only":
+                        write_xlsx_stream(
+                            fh, [("Summary_Match", match_df),
+                                 ("Raw_Data_Ref",
+                                  snapshot_ref_frame(snapshot_refs))])
+                    else:
+                        write_bundle(
+                            fh, zip(BUNDLE_NAMES, [match_df, fda_raw, ema_raw]),
+                            "csv" if fmt == "csv_zip" else "parquet")
+                    output_bytes = fh.tell()
+                    count_metric("export.bytes", output_bytes)
+                    if output is None:
+                        fh.seek(0)
+                        data = fh.read()
+        if measure_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        if measure_memory and not tracing:
+            tracemalloc.stop()
+
+    seconds = time.perf_counter() - t0
+    rss_after = peak_rss_bytes()
+    rss_growth = rss_after - rss_before if rss_after is not None else None
+    if rss_after is not None:
+        peak_metric("export.peak_rss_bytes", rss_after)
+        count_metric("export.rss_growth_bytes", rss_growth)
+    if peak is not None:
+        peak_metric("export.peak_bytes", peak)
+    file_name, mime = EXPORT_FILES[fmt]
+    return {
+        'data': data,
+        'file_name': file_name,
+        'mime': mime,
+        'seconds': seconds,
+        'output_bytes': output_bytes,
+        'peak_rss_bytes': rss_after,
+        'rss_growth_bytes': rss_growth,
+        'peak_bytes': peak
+    }
+
+
+def format_export_memory(export):
+    # CLI / UI 顯示用：有 tracemalloc 峰值時優先顯示，否則顯示 RSS 高水位
+    if export['peak_bytes'] is not None:
+        return f"記憶體峰值 {export['peak_bytes'] / 1e6:.1f} MB (tracemalloc)"
+    if export['peak_rss_bytes'] is not None:
+        return (f"行程記憶體高水位 {export['peak_rss_bytes'] / 1e6:.1f} MB "
+                f"(匯出 +{export['rss_growth_bytes'] / 1e6:.1f} MB)")
+    return None
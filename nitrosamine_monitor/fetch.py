@@ -0,0 +1,97 @@
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from .http_client import describe_error, format_error, request_deadline
+from .metrics import stage
+
+# ==========================================
+# 並行下載排程 (Fetch Scheduler)
+# ==========================================
+# 各來源從排程開始起算的期限 (秒)：來源內的 HTTP 請求 (含重試、退避) 都受此期限限制
+# (http_client.request_deadline)，逾時的工作會自行結束，不會在背景累積
+SOURCE_TIMEOUTS = {"ScinoPharm": 120, "FDA": 60, "EMA": 120}
+# 期限到時正在讀取的回應最多再等一個 chunk；排程多等這段時間才回報逾時
+FETCH_GRACE = 5
+
+
+def run_fetch_jobs(jobs, timeouts=None, initializer=None):
+    # jobs: {來源名稱: 無參數函數}，全部同時執行；回傳 (結果, 狀態)
+    # 狀態: {'ok', 'elapsed', 'message', 'error'}；error 為 describe_error 的結構
+    timeouts = timeouts or SOURCE_TIMEOUTS
+    results = {}
+    statuses = {}
+    elapsed = {}
+
+    def timed(name, fn):
+        t0 = time.monotonic()
+        limit = timeouts.get(name, 60)
+        try:
+            with stage(f"fetch/{name}"):
+                with request_deadline(started + limit - t0):
+                    return fn()
+        finally:
+            elapsed[name] = time.monotonic() - t0
+
+    executor = ThreadPoolExecutor(max_workers=max(1, len(jobs)),
+                                  thread_name_prefix="spt-fetch",
+                                  initializer=initializer)
+    started = time.monotonic()
+    # 每個工作複製一份 context，量測才會記到呼叫端的 run
+    futures = {
+        name: executor.submit(contextvars.copy_context().run, timed, name, fn)
+        for name, fn in jobs.items()
+    }
+
+    for name, future in futures.items():
+        limit = timeouts.get(name, 60)
+        remaining = max(0.0,
+                        started + limit + FETCH_GRACE - time.monotonic())
+        try:
+            results[name] = future.result(timeout=remaining)
+            statuses[name] = {
+                'ok': True,
+                'elapsed': elapsed.get(name, time.monotonic() - started),
+                'message': "",
+                'error': None
+            }
+        except FutureTimeoutError:
+            results[name] = None
+            error = {
+                'kind': "timeout",
+                'type': "FutureTimeoutError",
+                'message': f"Timeout after {limit}s",
+                'url': None,
+                'status_code': None
+            }
+            statuses[name] = {
+                'ok': False,
+                'elapsed': time.monotonic() - started,
+                'message': error['message'],
+                'error': error
+            }
+        except Exception as e:
+            results[name] = None
+            error = describe_error(e)
+            statuses[name] = {
+                'ok': False,
+                'elapsed': elapsed.get(name, time.monotonic() - started),
+                'message': format_error(error),
+                'error': error
+            }
+
+    # 逾時的工作不再等待 (請求已受期限限制，執行緒會自行結束)
+    executor.shutdown(wait=False, cancel_futures=True)
+    return results, statuses
+
+
+def format_fetch_status(statuses):
+    parts = []
+    for name, status in statuses.items():
+        icon = "✅" if status['ok'] else "❌"
+        text = f"{icon} {name} {status['elapsed']:.1f}s"
+        if status['message']:
+            text += f" ({status['message']})"
+        parts.append(text)
+    return " | ".join(parts)
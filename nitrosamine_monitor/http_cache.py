@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import urllib3
+
+from .http_client import http_get
+from .metrics import count_metric
+from .settings import CACHE_DIR
+
+# 來源網站皆以 verify=False 連線，忽略 SSL 警告
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# 磁碟快取位置與容量上限 (重啟後仍保留)
+HTTP_CACHE_DIR = os.path.join(CACHE_DIR, "http")
+HTTP_CACHE_MAX_BYTES = int(os.environ.get("SPT_HTTP_CACHE_MB", "256")) * 1024 * 1024
+HTTP_CACHE_ENABLED = os.environ.get("SPT_HTTP_CACHE", "1") != "0"
+
+_lock = threading.Lock()
+
+
+def _entry_paths(url):
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return (os.path.join(HTTP_CACHE_DIR, key + ".body"),
+            os.path.join(HTTP_CACHE_DIR, key + ".json"))
+
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _load_entry(url):
+    body_path, meta_path = _entry_paths(url)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("url") != url or not os.path.exists(body_path):
+            return None
+        return meta
+    except (OSError, ValueError):
+        return None
+
+
+def _touch_entry(url, meta):
+    meta["last_used"] = time.time()
+    _, meta_path = _entry_paths(url)
+    _write_atomic(meta_path, json.dumps(meta).encode("utf-8"))
+
+
+def _store_entry(url, resp):
+    body_path, meta_path = _entry_paths(url)
+    meta = {
+        "url": url,
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+        "encoding": resp.encoding or resp.apparent_encoding,
+        "size": len(resp.content),
+        "last_used": time.time()
+    }
+    os.makedirs(HTTP_CACHE_DIR, exist_ok=True)
+    _write_atomic(body_path, resp.content)
+    _write_atomic(meta_path, json.dumps(meta).encode("utf-8"))
+    return meta
+
+
+def evict_http_cache(max_bytes=None):
+    # 超過容量上限時依最後使用時間 (LRU) 刪除
+    max_bytes = HTTP_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    try:
+        names = os.listdir(HTTP_CACHE_DIR)
+    except OSError:
+        return 0
+
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        meta_path = os.path.join(HTTP_CACHE_DIR, name)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            entries.append((meta.get("last_used", 0), meta.get("size", 0),
+                            meta_path))
+        except (OSError, ValueError):
+            continue
+
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, meta_path in sorted(entries):
+        if total <= max_bytes:
+            break
+        for path in (meta_path, meta_path[:-len(".json")] + ".body"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        total -= size
+        removed += 1
+    return removed
+
+
+def _read_body(url, meta):
+    # 304 時讀取本地內容；已被刪除 (evict_http_cache / 其他行程) 時回傳 None
+    body_path, _ = _entry_paths(url)
+    with _lock:
+        try:
+            with open(body_path, "rb") as f:
+                content = f.read()
+        except OSError:
+            return None
+        try:
+            _touch_entry(url, meta)
+        except OSError:
+            pass
+    return content
+
+
+def _decode(content, encoding):
+    return str(content, encoding or "utf-8", errors="replace")
+
+
+def cached_get(url,
+               headers=None,
+               timeout=30,
+               verify=False,
+               raise_for_status=True,
+               session=None,
+               max_bytes=None):
+    # 條件式 GET：帶上 If-None-Match / If-Modified-Since，304 時直接回傳磁碟內容
+    # 連線走共用 Session (http_client)；timeout 為讀取逾時，max_bytes 為下載上限
+    request_headers = dict(headers or {})
+
+    meta = None
+    if HTTP_CACHE_ENABLED:
+        with _lock:
+            meta = _load_entry(url)
+        if meta:
+            if meta.get("etag"):
+                request_headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                request_headers["If-Modified-Since"] = meta["last_modified"]
+
+    count_metric("http.requests")
+    resp = http_get(url,
+                    headers=request_headers,
+                    timeout=timeout,
+                    verify=verify,
+                    max_bytes=max_bytes,
+                    session=session)
+
+    if resp.status_code == 304 and meta:
+        content = _read_body(url, meta)
+        if content is not None:
+            count_metric("http_cache.hits")
+            return {
+                "url": url,
+                "status": 200,
+                "content": content,
+                "text": _decode(content, meta.get("encoding")),
+                "from_cache": True
+            }
+        # 查詢後本地內容才被刪除：視為未命中，不帶條件重新下載
+        count_metric("http_cache.lost")
+        count_metric("http.requests")
+        resp = http_get(url,
+                        headers=headers,
+                        timeout=timeout,
+                        verify=verify,
+                        max_bytes=max_bytes,
+                        session=session)
+
+    count_metric("http.bytes_downloaded", len(resp.content))
+    if HTTP_CACHE_ENABLED:
+        count_metric("http_cache.misses")
+
+    if raise_for_status:
+        resp.raise_for_status()
+
+    if HTTP_CACHE_ENABLED and resp.status_code == 200:
+        # 寫入快取失敗 (磁碟已滿、唯讀目錄、其他行程同時刪除) 不影響這次下載
+        try:
+            with _lock:
+                _store_entry(url, resp)
+                evict_http_cache()
+        except OSError:
+            count_metric("http_cache.store_failed")
+
+    return {
+        "url": url,
+        "status": resp.status_code,
+        "content": resp.content,
+        "text": resp.text,
+        "from_cache": False
+    }
@@ -0,0 +1,245 @@
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError
+from urllib3.util import Timeout
+from urllib3.util.retry import Retry
+
+from .metrics import count_metric
+
+# ==========================================
+# 共用 HTTP 連線 (Pooled HTTP Client)
+# ==========================================
+# 所有來源共用一個 requests.Session：keep-alive、每個 host 的連線數上限、
+# 5xx / 連線中斷時以帶 jitter 的指數退避重試，並限制單次下載大小。
+# Session 只做無狀態的 GET，由各來源的執行緒共用。
+
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("SPT_HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_POOL_HOSTS = 8
+HTTP_POOL_PER_HOST = int(os.environ.get("SPT_HTTP_POOL", "4"))
+HTTP_RETRIES = int(os.environ.get("SPT_HTTP_RETRIES", "3"))
+# 讀取階段的錯誤 (連線被重設、讀取逾時) 只重試一次，避免停滯的伺服器拖上數倍的 read timeout
+HTTP_READ_RETRIES = 1
+HTTP_BACKOFF = 0.5
+HTTP_BACKOFF_JITTER = 0.5
+HTTP_RETRY_STATUS = (500, 502, 503, 504)
+HTTP_MAX_BYTES = int(os.environ.get("SPT_HTTP_MAX_MB", "64")) * 1024 * 1024
+HTTP_CHUNK_SIZE = 64 * 1024
+
+_session = None
+_session_lock = threading.Lock()
+
+# 整體期限 (run_fetch_jobs 依來源逾時設定，monotonic 時間)：期限內的請求
+#   - 每次嘗試 (含重試) 的連線 + 讀取總時間不超過剩餘時間
+#   - 退避 / Retry-After 的等待會超過期限時不再重試
+#   - 串流讀取到期即中斷
+_deadline = contextvars.ContextVar("spt_http_deadline", default=None)
+
+
+class ResponseTooLarge(requests.exceptions.RequestException):
+    pass
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    pass
+
+
+@contextmanager
+def request_deadline(seconds):
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def deadline_remaining():
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+class DeadlineTimeout(Timeout):
+    # urllib3 每次嘗試前 clone 一份：total 取當下離期限的剩餘時間
+    def __init__(self, connect, read, deadline):
+        super().__init__(connect=connect,
+                         read=read,
+                         total=max(0.001, deadline - time.monotonic()))
+        self.deadline = deadline
+
+    def clone(self):
+        return DeadlineTimeout(self._connect, self._read, self.deadline)
+
+
+class DeadlineRetry(Retry):
+    # 與 Retry.sleep 相同的等待時間；等待後已超過期限就不再重試
+    def increment(self,
+                  method=None,
+                  url=None,
+                  response=None,
+                  error=None,
+                  _pool=None,
+                  _stacktrace=None):
+        retry = super().increment(method, url, response, error, _pool,
+                                  _stacktrace)
+        remaining = deadline_remaining()
+        if remaining is None:
+            return retry
+        wait = None
+        if retry.respect_retry_after_header and response is not None:
+            wait = retry.get_retry_after(response)
+        if not wait:
+            wait = retry.get_backoff_time()
+        if wait >= remaining:
+            count_metric("http.deadline_exceeded")
+            raise MaxRetryError(
+                _pool, url,
+                urllib3.exceptions.TimeoutError(
+                    f"deadline reached before retry (last error: {error})"))
+        return retry
+
+
+def build_session():
+    retry = DeadlineRetry(total=HTTP_RETRIES,
+                          connect=HTTP_RETRIES,
+                          read=HTTP_READ_RETRIES,
+                          status=HTTP_RETRIES,
+                          status_forcelist=HTTP_RETRY_STATUS,
+                          allowed_methods=frozenset({"GET", "HEAD"}),
+                          backoff_factor=HTTP_BACKOFF,
+                          backoff_jitter=HTTP_BACKOFF_JITTER,
+                          respect_retry_after_header=True,
+                          raise_on_status=False)
+    # pool_block: 同一 host 超過上限時等待空出的連線，而不是另開新連線
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_HOSTS,
+                          pool_maxsize=HTTP_POOL_PER_HOST,
+                          pool_block=True,
+                          max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = build_session()
+    return _session
+
+
+def http_timeout(read_timeout):
+    # 數字視為讀取逾時，連線逾時另以 HTTP_CONNECT_TIMEOUT 限制
+    if isinstance(read_timeout, tuple):
+        return read_timeout
+    return (min(HTTP_CONNECT_TIMEOUT, read_timeout), read_timeout)
+
+
+def read_capped(resp, max_bytes=None):
+    # 串流讀取回應內容，超過上限即中斷 (Content-Length 已超過時不下載)
+    max_bytes = HTTP_MAX_BYTES if max_bytes is None else max_bytes
+    length = resp.headers.get("Content-Length")
+    if length and length.isdigit() and int(length) > max_bytes:
+        raise ResponseTooLarge(
+            f"{resp.url}: Content-Length {int(length)} exceeds "
+            f"{max_bytes} bytes",
+            response=resp)
+
+    chunks = []
+    size = 0
+    deadline = _deadline.get()
+    for chunk in resp.iter_content(HTTP_CHUNK_SIZE):
+        if deadline is not None and time.monotonic() >= deadline:
+            count_metric("http.deadline_exceeded")
+            raise DeadlineExceeded(f"{resp.url}: deadline reached while reading",
+                                   response=resp)
+        size += len(chunk)
+        if size > max_bytes:
+            raise ResponseTooLarge(
+                f"{resp.url}: body exceeds {max_bytes} bytes", response=resp)
+        chunks.append(chunk)
+    content = b"".join(chunks)
+    # 讓 resp.content / resp.text 照常可用
+    resp._content = content
+    resp._content_consumed = True
+    return content
+
+
+def http_get(url,
+             headers=None,
+             timeout=30,
+             verify=False,
+             max_bytes=None,
+             session=None):
+    # 以共用 Session 串流下載；回傳已讀完內容的 Response
+    http = session or get_session()
+    timeout = http_timeout(timeout)
+    deadline = _deadline.get()
+    if deadline is not None:
+        if time.monotonic() >= deadline:
+            count_metric("http.deadline_exceeded")
+            raise DeadlineExceeded(f"{url}: deadline reached before request")
+        timeout = DeadlineTimeout(*timeout, deadline)
+    resp = http.get(url,
+                    headers=headers,
+                    verify=verify,
+                    timeout=timeout,
+                    stream=True)
+    try:
+        retries = getattr(resp.raw, "retries", None)
+        if retries is not None and retries.history:
+            count_metric("http.retries", len(retries.history))
+        read_capped(resp, max_bytes)
+    finally:
+        resp.close()
+    return resp
+
+
+def describe_error(e):
+    # 將例外轉為結構化的狀態 (kind / message / url / status_code)
+    response = getattr(e, "response", None)
+    request = getattr(e, "request", None)
+    url = getattr(response, "url", None) or getattr(request, "url", None)
+    status_code = getattr(response, "status_code", None)
+    # 重試用盡時 requests 只拋 ConnectionError，實際原因在 MaxRetryError.reason
+    reason = getattr(e.args[0], "reason", None) if e.args else None
+
+    if isinstance(e, ResponseTooLarge):
+        kind = "too_large"
+    elif isinstance(e, requests.exceptions.Timeout) or isinstance(
+            reason, urllib3.exceptions.TimeoutError):
+        kind = "timeout"
+    elif isinstance(e, requests.exceptions.RetryError):
+        kind = "retries_exhausted"
+    elif isinstance(e, requests.exceptions.ConnectionError):
+        kind = "connection"
+    elif isinstance(e, requests.exceptions.HTTPError):
+        kind = "http_status"
+    elif isinstance(e, requests.exceptions.RequestException):
+        kind = "network"
+    elif isinstance(e, TimeoutError):
+        kind = "timeout"
+    else:
+        kind = "error"
+
+    return {
+        'kind': kind,
+        'type': type(e).__name__,
+        'message': str(e),
+        'url': url,
+        'status_code': status_code
+    }
+
+
+def format_error(error):
+    text = error['kind']
+    if error['status_code']:
+        text += f" {error['status_code']}"
+    return f"{text}: {error['message']}"
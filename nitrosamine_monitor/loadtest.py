@@ -0,0 +1,294 @@
+import contextvars
+import io
+import json
+import os
+import platform
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+
+from . import (http_cache, names, page_cache, settings, snapshots, synthetic,
+               table_cache)
+from .export import export_report
+from .metrics import collect, peak_rss_bytes, stage, stage_wall_times
+from .pipeline import run_analysis
+from .products import get_scinopharm_apis_auto, parse_uploaded_file
+from .refresher import refresher_fetchers, start_refresher, stop_refresher
+from .shared import new_shared_cache, session_bytes, shared_bytes
+from .sources import get_ema_data, get_fda_data
+from .standin import (recorded_site, standin_stats, start_standin,
+                      stop_standin, synthetic_site)
+
+# ==========================================
+# 負載測試 (Concurrent-Session Load Test)
+# ==========================================
+# 啟動本機替身伺服器，將來源網址指向它，再以執行緒池模擬多個同時執行的
+# 分析 session (與 Streamlit 每個 session 一個執行緒相同)。每個 session 跑完整流程：
+# 讀取產品清單 (或爬取替身官網) -> 下載 / 解析 FDA、EMA -> 比對 -> 匯出報表。
+# 磁碟快取 (HTTP、解析後表格、PDF 逐頁、名稱) 與來源快照一律寫到暫存目錄，
+# 不會混入實際的 .spt_cache (否則下次 --delta 會把合成資料當成來源變動)。
+# 暫存目錄一開始是空的：預設只有最先的 session 真正下載 / 解析，其餘與實際部署
+# 相同由磁碟快取 (304 + 解析後表格) 提供；cold_cache=True 時停用磁碟快取，
+# 每個 session 都完整下載與解析 (最差情況)。預設不經過 Streamlit 快取與背景更新；
+# shared=True 時與 UI 相同：FDA / EMA 由背景更新提供，所有 session 共用同一份快照。
+# 每個 session 另記錄自己持有的記憶體 (產品清單 + 結果 + 匯出檔，共用快照不計入)。
+
+LOADTEST_PERCENTILES = (50, 90, 99)
+
+
+@contextmanager
+def isolated_caches(cold_cache=False):
+    # 將各模組的快取路徑暫時指向新的暫存目錄，結束後還原並刪除
+    with tempfile.TemporaryDirectory(prefix="spt_loadtest_") as cache_dir:
+        overrides = [
+            (http_cache, "HTTP_CACHE_DIR", os.path.join(cache_dir, "http")),
+            (table_cache, "TABLE_CACHE_DIR", os.path.join(cache_dir,
+                                                          "tables")),
+            (page_cache, "PAGE_CACHE_DB",
+             os.path.join(cache_dir, "pdf_pages.sqlite")),
+            (snapshots, "SNAPSHOT_DB",
+             os.path.join(cache_dir, "snapshots.sqlite")),
+            (names, "NAME_MEMO_PATH", os.path.join(cache_dir, "names.json"))
+        ]
+        if cold_cache:
+            overrides += [(http_cache, "HTTP_CACHE_ENABLED", False),
+                          (table_cache, "TABLE_CACHE_ENABLED", False),
+                          (page_cache, "PAGE_CACHE_ENABLED", False)]
+        previous = [(module, attr, getattr(module, attr))
+                    for module, attr, _ in overrides]
+        for module, attr, value in overrides:
+            setattr(module, attr, value)
+        try:
+            yield cache_dir
+        finally:
+            for module, attr, value in previous:
+                setattr(module, attr, value)
+
+
+def _run_session(session_id, products_file, match_mode, export_format,
+                 scrape, fetchers, shared):
+    t0 = time.perf_counter()
+    export = None
+    with collect() as run:
+        with stage("products"):
+            if scrape:
+                api_list, _ = get_scinopharm_apis_auto(pdf_workers=1)
+            else:
+                f = io.BytesIO(products_file)
+                f.name = "products.csv"
+                api_list, _ = parse_uploaded_file(f)
+
+        result = run_analysis(api_list,
+                              match_mode=match_mode,
+                              fetchers=fetchers,
+                              shared=shared)
+        if result['summary'] is not None:
+            export = export_report(result['summary'],
+                                   result['fda_df'],
+                                   result['ema_df'],
+                                   fmt=export_format)
+
+    errors = [
+        f"{source}: {status['error']['kind']}"
+        for source, status in result['fetch_status'].items()
+        if not status['ok']
+    ]
+    if not api_list:
+        errors.append("products: empty")
+    return {
+        'session': session_id,
+        'seconds': time.perf_counter() - t0,
+        'ok': not errors and result['summary'] is not None,
+        'products': len(api_list),
+        'matches': 0 if result['summary'] is None else len(result['summary']),
+        'errors': errors,
+        'stages': stage_wall_times(run),
+        'session_bytes': session_bytes(
+            [api_list, result, export],
+            [shared['snapshot']] if shared is not None else [])
+    }
+
+
+def run_load_test(sessions=20,
+                  concurrency=8,
+                  size=300,
+                  seed=0,
+                  faults=None,
+                  match_mode="token",
+                  export_format="xlsx",
+                  scrape=False,
+                  recorded=None,
+                  shared=False,
+                  cold_cache=False,
+                  progress=None):
+    progress = progress or (lambda msg: None)
+    site, product_names = synthetic_site(size, seed)
+    if recorded:
+        # 實際抓取過的回應覆蓋合成內容 (產品清單仍用合成名稱，除非 scrape)
+        site.update(recorded_site(recorded))
+    products_file = synthetic.make_product_csv(product_names, seed)
+
+    with isolated_caches(cold_cache):
+        standin = start_standin(site, faults)
+        previous_base_url = settings.SOURCE_BASE_URL
+        settings.SOURCE_BASE_URL = standin['base_url']
+        progress(f"🧪 替身伺服器: {standin['base_url']} "
+                 f"({sessions} sessions, concurrency {concurrency})")
+
+        fetchers = None
+        shared_cache = None
+        refresher = None
+        if shared:
+            refresher = start_refresher({
+                "FDA": get_fda_data,
+                "EMA": get_ema_data
+            })
+            fetchers = refresher_fetchers(refresher)
+            shared_cache = new_shared_cache()
+
+        rss_before = peak_rss_bytes()
+        t0 = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency,
+                                    thread_name_prefix="spt-load") as pool:
+                # 每個 session 使用全新的 context，量測各自獨立
+                futures = [
+                    pool.submit(contextvars.Context().run, _run_session, i,
+                                products_file, match_mode, export_format,
+                                scrape, fetchers, shared_cache)
+                    for i in range(sessions)
+                ]
+                results = []
+                for future in futures:
+                    try:
+                        results.append(future.result())
+                    except Exception as e:
+                        results.append({
+                            'session': len(results),
+                            'seconds': None,
+                            'ok': False,
+                            'products': 0,
+                            'matches': 0,
+                            'errors': [f"crash: {type(e).__name__}: {e}"],
+                            'stages': {},
+                            'session_bytes': None
+                        })
+                    item = results[-1]
+                    seconds = ("-" if item['seconds'] is None else
+                               f"{item['seconds']:.2f}s")
+                    progress(f"  session {item['session']:>3}: {seconds}" +
+                             ("" if item['ok'] else
+                              f" ❌ {item['errors']}"))
+            wall = time.perf_counter() - t0
+        finally:
+            if refresher is not None:
+                stop_refresher(refresher, timeout=5)
+            settings.SOURCE_BASE_URL = previous_base_url
+            server_stats = standin_stats(standin)
+            stop_standin(standin)
+    rss_after = peak_rss_bytes()
+
+    return {
+        'meta': {
+            'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'sessions': sessions,
+            'concurrency': concurrency,
+            'size': size,
+            'seed': seed,
+            'faults': standin['faults'],
+            'match_mode': match_mode,
+            'export_format': export_format,
+            'scrape': scrape,
+            'recorded': recorded,
+            'shared': shared,
+            'cold_cache': cold_cache
+        },
+        'wall': wall,
+        'throughput': sessions / wall if wall else None,
+        'latency': latency_summary(
+            [r['seconds'] for r in results if r['seconds'] is not None]),
+        'stages': {
+            name: latency_summary([
+                r['stages'][name] for r in results if name in r['stages']
+            ])
+            for name in dict.fromkeys(
+                name for r in results for name in r['stages'])
+        },
+        'ok': sum(r['ok'] for r in results),
+        'failed': sum(not r['ok'] for r in results),
+        'errors': dict(Counter(e for r in results for e in r['errors'])),
+        'peak_rss_bytes': rss_after,
+        'rss_growth_bytes': (rss_after - rss_before
+                             if rss_after is not None else None),
+        'session_memory': latency_summary([
+            r['session_bytes'] for r in results
+            if r['session_bytes'] is not None
+        ]),
+        'shared_bytes': (shared_bytes(shared_cache)
+                         if shared_cache is not None else None),
+        'server': server_stats,
+        'sessions': results
+    }
+
+
+def latency_summary(values):
+    if not values:
+        return None
+    summary = {
+        f"p{p}": float(v)
+        for p, v in zip(LOADTEST_PERCENTILES,
+                        np.percentile(values, LOADTEST_PERCENTILES))
+    }
+    summary['mean'] = float(np.mean(values))
+    summary['max'] = float(np.max(values))
+    return summary
+
+
+def format_load_report(report):
+    meta = report['meta']
+    lines = [
+        f"sessions {meta['sessions']} | concurrency {meta['concurrency']} | "
+        f"size {meta['size']} | ok {report['ok']} | failed {report['failed']}",
+        f"wall {report['wall']:.2f}s | throughput "
+        f"{report['throughput']:.2f} sessions/s"
+    ]
+    header = f"{'':<12}" + "".join(f"{k:>9}" for k in ("p50", "p90", "p99",
+                                                       "mean", "max"))
+    lines.append(header)
+    rows = [("session", report['latency'])] + list(report['stages'].items())
+    for name, summary in rows:
+        if summary is None:
+            continue
+        lines.append(f"{name:<12}" + "".join(
+            f"{summary[k]:>8.2f}s"
+            for k in ("p50", "p90", "p99", "mean", "max")))
+    if report['peak_rss_bytes'] is not None:
+        lines.append(f"peak RSS {report['peak_rss_bytes'] / 1e6:.1f} MB "
+                     f"(+{report['rss_growth_bytes'] / 1e6:.1f} MB during test)")
+    memory = report['session_memory']
+    if memory is not None:
+        line = (f"session memory p50 {memory['p50'] / 1e6:.1f} MB, "
+                f"max {memory['max'] / 1e6:.1f} MB")
+        if report['shared_bytes'] is not None:
+            line += f" | shared snapshot {report['shared_bytes'] / 1e6:.1f} MB"
+        lines.append(line)
+    server = report['server']
+    lines.append(f"server: {server['requests']} requests, "
+                 f"{server['not_modified']} not modified, "
+                 f"{server['errors']} injected 503, "
+                 f"{server['resets']} resets, "
+                 f"{server['bytes'] / 1e6:.1f} MB sent")
+    for error, n in sorted(report['errors'].items()):
+        lines.append(f"❌ {error} x{n}")
+    return "\n".join(lines)
+
+
+def save_load_report(report, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,809 @@
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from .metrics import count_metric
+from .names import memoized
+
+# ==========================================
+# 0. 定義通用字與雜訊 (Stop Words)
+# ==========================================
+STOP_WORDS = {
+    "ACID", "SODIUM", "POTASSIUM", "CALCIUM", "MAGNESIUM", "HYDROCHLORIDE",
+    "HCL", "HYDROBROMIDE", "HBR", "ACETATE", "TARTRATE", "CITRATE", "MALEATE",
+    "FUMARATE", "MESYLATE", "SUCCINATE", "PHOSPHATE", "SULFATE", "BASE",
+    "BENZOATE", "PAMOATE", "ESTOLATE", "GLUCEPTATE", "GLUCONATE", "LACTATE",
+    "STEARATE", "ETHYL", "METHYL", "PROPYL", "BUTYL", "PHENYL", "BENZYL",
+    "ESTER", "USP", "EP", "BP", "JP", "TABLETS", "CAPSULES", "INJECTION",
+    "SOLUTION", "ORAL", "EXTENDED", "RELEASE", "API", "NAME", "PRODUCT",
+    "DRUG", "SUBSTANCE", "UNKNOWN", "AND", "WITH", "FORM", "TYPE", "CLASS",
+    "GRADE", "GROUP", "PART", "COMPOUND", "IMPURITY", "NEW", "NAB",
+    "CHAIN", "SIDE", "FULL", "PROTECTED", "FRAGMENT"
+}
+
+
+# ==========================================
+# 3. 核心比對邏輯 (Smart Match)
+# ==========================================
+def get_core_tokens(scino_api):
+    # 同一產品名稱只計算一次 (名稱正規化快取)；回傳 frozenset，呼叫端不可修改
+    return memoized("tokens", scino_api, _core_tokens)
+
+
+def _core_tokens(scino_api):
+    scino_clean = scino_api.upper().replace("-", " ").strip()
+    scino_tokens = set(scino_clean.split())
+    core_tokens = {
+        t
+        for t in scino_tokens if t not in STOP_WORDS and len(t) > 2
+    }
+
+    if not core_tokens:
+        # 純 "COMPOUND" 類名稱不參與比對
+        if "COMPOUND" in scino_clean:
+            return frozenset()
+        core_tokens = {scino_clean}
+
+    return frozenset(core_tokens)
+
+
+def build_row_text(values):
+    return " ".join([str(val).upper() for val in values if pd.notna(val)])
+
+
+@lru_cache(maxsize=4096)
+def token_pattern(token):
+    # \bTOKEN\b (預先編譯，每個 token 只編譯一次)
+    return re.compile(r'\b' + re.escape(token) + r'\b')
+
+
+def smart_match(scino_api, row_series):
+    core_tokens = get_core_tokens(scino_api)
+    if not core_tokens:
+        return False, ""
+
+    row_text = build_row_text(row_series.values)
+
+    for token in core_tokens:
+        if token_pattern(token).search(row_text):
+            return True, row_text
+
+    return False, ""
+
+
+# --- 反向索引 (Token -> 產品) ---
+# 純單字 token 的 \bTOKEN\b 等同於「列文字中某個完整 \w+ 片段 == TOKEN」，
+# 因此可改用集合查詢；含符號或空白的 token (片語) 則合併成一個 alternation 掃描。
+WORD_TOKEN_RE = re.compile(r'\w+')
+WORD_CHAR_RE = re.compile(r'\w')
+
+MATCH_MODES = {
+    "token": "Token 索引 (Token Index)",
+    "regex": "單次掃描 (Compiled Alternation)",
+    "fuzzy": "模糊比對 (Trigram + Edit Distance)"
+}
+
+# --- 模糊比對 (fuzzy) ---
+# 相似度 = 1 - 編輯距離 / 較長字長；低於門檻不列入。短字 (< FUZZY_MIN_LENGTH)
+# 只做完全比對，避免 "ALPHA" / "ALPHA1" 之類大量誤判。
+FUZZY_THRESHOLD = float(os.environ.get("SPT_FUZZY_THRESHOLD", "0.85"))
+FUZZY_MIN_LENGTH = 5
+NGRAM_SIZE = 3
+# 共享 n-gram 上限 (逐 bucket 取較小的個數) 的 bucket 數；每批查詢的字數
+FUZZY_BUCKETS = 64
+FUZZY_BATCH = 5000
+
+# \b 以 lookaround 表示：字元 c 前的 \b = c 為 \w 時前一字元不是 \w，否則前一字元是 \w
+START_BOUNDARY = {True: r'(?<!\w)', False: r'(?<=\w)'}
+END_BOUNDARY = {True: r'(?!\w)', False: r'(?=\w)'}
+
+
+def is_word_char(ch):
+    return WORD_CHAR_RE.match(ch) is not None
+
+
+def build_alternation(tokens):
+    # 將 token 依前綴建成 trie 再轉為巢狀 alternation，避免 re 對數千個選項逐一嘗試。
+    # 每個 token 帶自己的邊界 (與 \bTOKEN\b 相同)，同一位置取最長且邊界成立的 token。
+    # 沒有 token 時回傳 None
+    trie = {}
+    for token in tokens:
+        node = trie
+        for ch in token:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def join(alternatives):
+        if len(alternatives) == 1:
+            return alternatives[0]
+        return '(?:' + '|'.join(alternatives) + ')'
+
+    def branches(node):
+        # [(是否以 \w 開頭, regex)]；之後沒有其他字元的子節點依字元類型合併為字元集合
+        result = []
+        leaves = {True: [], False: []}
+        for ch in sorted(k for k in node if k != ''):
+            word = is_word_char(ch)
+            if list(node[ch]) == ['']:
+                leaves[word].append(re.escape(ch))
+            else:
+                result.append((word, re.escape(ch) + to_regex(node[ch], word)))
+        for word, chars in leaves.items():
+            if chars:
+                char_set = chars[0] if len(chars) == 1 else '[' + ''.join(
+                    chars) + ']'
+                result.append((word, char_set + END_BOUNDARY[word]))
+        return result
+
+    def to_regex(node, word):
+        # word: 進入此節點的字元是否為 \w；較長的 token 都不成立時才在此結束
+        alternatives = [regex for _, regex in branches(node)]
+        if '' in node:
+            alternatives.append(END_BOUNDARY[word])
+        return join(alternatives)
+
+    starts = {True: [], False: []}
+    for word, regex in branches(trie):
+        starts[word].append(regex)
+    alternatives = [
+        START_BOUNDARY[word] + join(regexes)
+        for word, regexes in starts.items() if regexes
+    ]
+    if '' in trie:
+        alternatives.append(r'\b')
+    return join(alternatives) if alternatives else None
+
+
+def compile_alternation(tokens):
+    # 以 lookahead 擷取：每個位置都嘗試 (不跳過已命中的字元)，重疊的 token 也不會漏掉
+    alternation = build_alternation(tokens)
+    if alternation is None:
+        return None
+    return re.compile('(?=(' + alternation + '))')
+
+
+def expand_match(text, tokens):
+    # text: alternation 在某位置取得的最長 token；回傳同一位置也成立的所有 token。
+    # 較短的前綴 token 起點邊界與 text 相同，結尾邊界由 text 的下一字元判斷
+    # (空字串 token 的 \b 即 text 的起點邊界，必定成立)
+    found = [text]
+    for end in range(len(text)):
+        prefix = text[:end]
+        if prefix in tokens and (end == 0 or is_word_char(prefix[-1]) !=
+                                 is_word_char(text[end])):
+            found.append(prefix)
+    return found
+
+
+def build_phrase_index(phrase_map):
+    # 片語命中時，其中每個 \w+ 片段在列文字中都是完整的 \w+ 字 (兩側為片語內的符號或邊界)，
+    # 因此以最長片段為鍵，只有含這些字的列才需要以 alternation 確認；
+    # 沒有 \w 片段的片語 (如 "...") 需掃描所有列
+    if not phrase_map:
+        return None
+    keys = set()
+    scan_all = False
+    for phrase in phrase_map:
+        fragments = WORD_TOKEN_RE.findall(phrase)
+        if fragments:
+            keys.add(max(fragments, key=len))
+        else:
+            scan_all = True
+    return {
+        'keys': list(keys),
+        'scan_all': scan_all,
+        'pattern': compile_alternation(phrase_map)
+    }
+
+
+def find_alternation_matches(pattern, token_ids, row_texts):
+    # 回傳 (row, product) 配對；token_ids: token -> 產品 id
+    found = row_texts.str.findall(pattern).explode().dropna()
+    ids = {
+        text: [idx for token in expand_match(text, token_ids)
+               for idx in token_ids[token]]
+        for text in found.unique()
+    }
+    hits = found.map(ids).explode().dropna()
+    return pd.DataFrame({'row': hits.index, 'product': hits.values})
+
+
+def find_phrase_matches(match_index, row_index):
+    phrases = match_index['phrases']
+    if phrases is None:
+        return pd.DataFrame({'row': [], 'product': []})
+
+    row_texts = row_index['row_texts']
+    if not phrases['scan_all']:
+        tokens = row_index['tokens']
+        rows = tokens.index[tokens.isin(phrases['keys'])].unique()
+        row_texts = row_texts.loc[rows]
+    count_metric("match.phrase_rows", len(row_texts))
+    return find_alternation_matches(phrases['pattern'],
+                                    match_index['phrase_map'], row_texts)
+
+
+def edit_distance(a, b, limit):
+    # Levenshtein 距離 (bit-parallel，Myers / Hyyrö)；超過 limit 時回傳 limit + 1
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if not a or not b:
+        dist = len(a) or len(b)
+        return dist if dist <= limit else limit + 1
+    peq = {}
+    for i, ch in enumerate(a):
+        peq[ch] = peq.get(ch, 0) | (1 << i)
+    mask = (1 << len(a)) - 1
+    high = 1 << (len(a) - 1)
+    pv, mv, dist = mask, 0, len(a)
+    for ch in b:
+        eq = peq.get(ch, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        if ph & high:
+            dist += 1
+        elif mh & high:
+            dist -= 1
+        ph = (ph << 1) | 1
+        pv = ((mh << 1) | ~(xv | ph)) & mask
+        mv = ph & xv & mask
+    return dist if dist <= limit else limit + 1
+
+
+def product_joins(scino_api):
+    # 相鄰兩字合併 ("SITA GLIPTIN" -> "SITAGLIPTIN")，供模糊模式比對連字號 / 空白差異
+    words = [
+        w for w in scino_api.upper().replace("-", " ").split()
+        if w not in STOP_WORDS
+    ]
+    return {
+        a + b
+        for a, b in zip(words, words[1:]) if WORD_TOKEN_RE.fullmatch(a + b)
+    }
+
+
+def build_fuzzy_map(api_list):
+    # token + 相鄰字合併 -> 產品 id (依產品順序，不重複)
+    fuzzy_map = {}
+    for idx, api_obj in enumerate(api_list):
+        for token in get_core_tokens(api_obj['name']):
+            if WORD_TOKEN_RE.fullmatch(token):
+                fuzzy_map.setdefault(token, []).append(idx)
+        for token in product_joins(api_obj['name']):
+            ids = fuzzy_map.setdefault(token, [])
+            if idx not in ids:
+                ids.append(idx)
+    return fuzzy_map
+
+
+def fuzzy_limit(longest, threshold):
+    # 相似度 >= threshold 時容許的最大編輯距離
+    return int((1 - threshold) * longest + 1e-9)
+
+
+def partner_lengths(length, threshold):
+    # 可能與字長 length 配對的字長 (字長差 <= 較長者的容許距離)
+    shorter = range(length - fuzzy_limit(length, threshold), length + 1)
+    longer = []
+    other = length + 1
+    while other - length <= fuzzy_limit(other, threshold):
+        longer.append(other)
+        other += 1
+    return [n for n in shorter if n >= FUZZY_MIN_LENGTH] + longer
+
+
+def prefix_length(length, threshold):
+    # 字長 length 與任何可配對的字至少共享 longest + q - 1 - q * limit 個 n-gram；
+    # 取最寬鬆的要求 need，依全域順序排序後的前 n - need + 1 個 n-gram 中
+    # 必有一個兩邊共有 (prefix filter)
+    count = length + NGRAM_SIZE - 1
+    need = min(
+        max(length, other) + NGRAM_SIZE - 1 -
+        NGRAM_SIZE * fuzzy_limit(max(length, other), threshold)
+        for other in partner_lengths(length, threshold) + [length])
+    return count - max(need, 1) + 1
+
+
+def sorted_unique(values):
+    # 排序後的不重複值與各值個數 (np.unique 的整數排序版)
+    values = np.sort(values)
+    starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+    starts = starts[starts < len(values)]
+    return values[starts], np.diff(np.r_[starts, len(values)])
+
+
+def group_ranks(order, *keys):
+    # order 依 (keys..., 其他欄位) 排序；回傳每個元素在相同 keys 群組內的名次
+    new = np.zeros(len(order), dtype=bool)
+    new[:1] = True
+    for key in keys:
+        sorted_key = key[order]
+        new[1:] |= sorted_key[1:] != sorted_key[:-1]
+    starts = np.flatnonzero(new)
+    ranks = np.empty(len(order), dtype='int64')
+    ranks[order] = np.arange(len(order)) - np.repeat(
+        starts, np.diff(np.r_[starts, len(order)]))
+    return ranks
+
+
+def expand_ranges(starts, counts):
+    # 串接 [start, start + count) 的所有索引
+    offsets = np.arange(counts.sum()) - np.repeat(
+        np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + offsets
+
+
+def gram_elements(strings):
+    # 所有字串 (前後各補 NGRAM_SIZE - 1 個 '#') 的 n-gram，整批計算；
+    # 回傳 (字串編號, n-gram, 序號)。n-gram 由各字元的 code point (21 bits) 組成，
+    # 同一字串內重複的 n-gram 依出現順序編號，讓集合交集等於 multiset 交集
+    pad = "#" * (NGRAM_SIZE - 1)
+    padded = [pad + s + pad for s in strings]
+    lengths = np.array([len(p) for p in padded], dtype='int64')
+    chars = np.frombuffer("".join(padded).encode("utf-32-le"),
+                          dtype=np.uint32).astype('int64')
+    counts = lengths - NGRAM_SIZE + 1
+    ids = np.repeat(np.arange(len(strings)), counts)
+    positions = expand_ranges(np.cumsum(lengths) - lengths, counts)
+    grams = np.zeros(len(ids), dtype='int64')
+    for k in range(NGRAM_SIZE):
+        grams = (grams << 21) | chars[positions + k]
+    # lexsort 為穩定排序：同一字串的相同 n-gram 依出現位置排列
+    seq = group_ranks(np.lexsort((grams, ids)), ids, grams)
+    return ids, grams, seq
+
+
+def bucket_counts(ids, elements, size):
+    # 每個字串各 bucket 的 element 數；兩字串共享數 <= 逐 bucket 取較小值的總和
+    counts = np.bincount(ids * FUZZY_BUCKETS + elements % FUZZY_BUCKETS,
+                         minlength=size * FUZZY_BUCKETS)
+    return counts.reshape(size, FUZZY_BUCKETS).astype(np.uint16)
+
+
+def prefix_mask(ids, elements, frequency, lengths, threshold):
+    # 各字串依全域順序 (出現次數少者優先) 排序後，前 prefix_length 個 element
+    table = np.array([
+        prefix_length(n, threshold) if n >= FUZZY_MIN_LENGTH else 0
+        for n in range(lengths.max() + 1)
+    ])
+    order_key = frequency * (elements.max() + 2) + elements + 1
+    ranks = group_ranks(np.lexsort((order_key, ids)), ids)
+    return ranks < table[lengths[ids]]
+
+
+def build_fuzzy_index(fuzzy_map, threshold):
+    # 產品字彙 (token + 相鄰字合併，字長 >= FUZZY_MIN_LENGTH) 的 n-gram 索引：
+    #   element: n-gram (含序號) 的整數編碼；keys / frequency 決定全域順序
+    #   postings: 各 token 前綴的 element -> token (依 element 排序)
+    #   owned: token 編號 * 編碼範圍 + element (計算共享數)
+    #   buckets: 各 token 每個 bucket 的 element 數 (共享數上限)
+    if threshold <= 0:
+        raise ValueError(f"Fuzzy threshold must be > 0: {threshold}")
+    tokens = [t for t in fuzzy_map if len(t) >= FUZZY_MIN_LENGTH]
+    lengths = np.array([len(t) for t in tokens], dtype='int64')
+    if not tokens:
+        return {'tokens': tokens, 'lengths': lengths}
+    ids, grams, seq = gram_elements(tokens)
+    vocab, _ = sorted_unique(grams)
+    span = int(seq.max()) + 1
+    elements = np.searchsorted(vocab, grams) * span + seq
+    keys, counts = sorted_unique(elements)
+    frequency = counts[np.searchsorted(keys, elements)]
+
+    head = prefix_mask(ids, elements, frequency, lengths, threshold)
+    order = np.argsort(elements[head], kind='stable')
+    buckets = bucket_counts(ids, elements, len(tokens))
+    feasible = {
+        other
+        for n in set(lengths.tolist())
+        for other in partner_lengths(n, threshold) + [n]
+    }
+    return {
+        'tokens': tokens,
+        'lengths': lengths,
+        'feasible': np.array(sorted(feasible), dtype='int64'),
+        'vocab': vocab,
+        'span': span,
+        'keys': keys,
+        'counts': counts,
+        'postings': (elements[head][order], ids[head][order]),
+        'owned': np.sort(ids * (len(vocab) * span) + elements),
+        'buckets': buckets
+    }
+
+
+def fuzzy_candidates(index, words, threshold):
+    # 回傳 (word 編號, token 編號) 候選，依序排除：
+    #   字長不可能配對的字 (不計算 n-gram)、前綴沒有共同 element 的配對 (prefix filter)、
+    #   字長差超過容許距離、bucket 上限或實際共享數低於 count filter 下界的配對
+    lengths = np.array([len(w) for w in words], dtype='int64')
+    keep = np.flatnonzero(np.isin(lengths, index.get('feasible', [])))
+    if not len(keep):
+        return np.empty(0, dtype='int64'), np.empty(0, dtype='int64')
+    words = [words[i] for i in keep]
+    lengths = lengths[keep]
+
+    ids, grams, seq = gram_elements(words)
+    vocab, span = index['vocab'], index['span']
+    gram_ids = np.minimum(np.searchsorted(vocab, grams), len(vocab) - 1)
+    known = (vocab[gram_ids] == grams) & (seq < span)
+    # 產品字彙中沒有的 n-gram 不可能共享，編為 -1
+    elements = np.where(known, gram_ids * span + seq, -1)
+    keys, counts = index['keys'], index['counts']
+    slots = np.minimum(np.searchsorted(keys, elements), len(keys) - 1)
+    frequency = np.where(keys[slots] == elements, counts[slots], 0)
+
+    head = prefix_mask(ids, elements, frequency, lengths, threshold) & known
+    post_elements, post_tokens = index['postings']
+    lo = np.searchsorted(post_elements, elements[head], 'left')
+    hi = np.searchsorted(post_elements, elements[head], 'right')
+    n_tokens = len(index['tokens'])
+    pairs, _ = sorted_unique(
+        np.repeat(ids[head], hi - lo) * n_tokens +
+        post_tokens[expand_ranges(lo, hi - lo)])
+    word_ids, token_ids = pairs // n_tokens, pairs % n_tokens
+
+    longest = np.maximum(lengths[word_ids], index['lengths'][token_ids])
+    limit = np.floor((1 - threshold) * longest + 1e-9).astype('int64')
+    need = longest + NGRAM_SIZE - 1 - NGRAM_SIZE * limit
+    ok = np.abs(lengths[word_ids] - index['lengths'][token_ids]) <= limit
+    word_ids, token_ids, need = word_ids[ok], token_ids[ok], need[ok]
+
+    buckets = bucket_counts(ids[known], elements[known], len(words))
+    bound = np.minimum(buckets[word_ids],
+                       index['buckets'][token_ids]).sum(axis=1)
+    ok = bound >= need
+    word_ids, token_ids, need = word_ids[ok], token_ids[ok], need[ok]
+
+    # 實際共享數：展開每個配對的 word element，查詢是否為該 token 所有
+    starts = np.searchsorted(ids, word_ids, 'left')
+    sizes = np.searchsorted(ids, word_ids, 'right') - starts
+    positions = expand_ranges(starts, sizes)
+    owner = np.repeat(token_ids, sizes) * (len(vocab) * span)
+    probe = np.where(elements[positions] >= 0, owner + elements[positions],
+                     -1)
+    owned = index['owned']
+    slots = np.minimum(np.searchsorted(owned, probe), len(owned) - 1)
+    shared = np.bincount(np.repeat(np.arange(len(word_ids)), sizes),
+                         weights=owned[slots] == probe,
+                         minlength=len(word_ids))
+    ok = shared >= need
+    return keep[word_ids[ok]], token_ids[ok]
+
+
+def fuzzy_index(match_index):
+    # 模糊模式的對照表與 n-gram 索引只在第一次使用時建立
+    if match_index['fuzzy_map'] is None:
+        fuzzy_map = build_fuzzy_map(match_index['products'])
+        match_index['ngram_index'] = build_fuzzy_index(
+            fuzzy_map, match_index['fuzzy_threshold'])
+        match_index['fuzzy_map'] = fuzzy_map
+    return match_index['fuzzy_map'], match_index['ngram_index']
+
+
+def fuzzy_lookups(match_index, words):
+    # 查詢結果存入 match_index['fuzzy_cache']：{word: [(product_id, score)]}，
+    # 完全相同 = 1.0。未查詢過的字整批 (每 FUZZY_BATCH 個) 過濾候選，
+    # 只對剩下的配對計算編輯距離
+    cache = match_index['fuzzy_cache']
+    fuzzy_map, index = fuzzy_index(match_index)
+    threshold = match_index['fuzzy_threshold']
+    pending = [w for w in words if w not in cache]
+    scores = {w: ({w: 1.0} if w in fuzzy_map else {}) for w in pending}
+
+    if threshold < 1:
+        tokens = index['tokens']
+        longer = [w for w in pending if len(w) >= FUZZY_MIN_LENGTH]
+        for i in range(0, len(longer), FUZZY_BATCH):
+            batch = longer[i:i + FUZZY_BATCH]
+            word_ids, token_ids = fuzzy_candidates(index, batch, threshold)
+            count_metric("match.fuzzy_candidates", len(word_ids))
+            for w, t in zip(word_ids.tolist(), token_ids.tolist()):
+                word, token = batch[w], tokens[t]
+                if token in scores[word]:
+                    continue
+                longest = max(len(word), len(token))
+                limit = fuzzy_limit(longest, threshold)
+                dist = edit_distance(word, token, limit)
+                if dist <= limit:
+                    scores[word][token] = round(1 - dist / longest, 3)
+
+    for word, matched in scores.items():
+        cache[word] = [(idx, score) for token, score in matched.items()
+                       for idx in fuzzy_map[token]] if matched else []
+    return cache
+
+
+def build_match_index(api_list, fuzzy_threshold=None):
+    token_map = {}
+    phrase_map = {}
+
+    for idx, api_obj in enumerate(api_list):
+        for token in get_core_tokens(api_obj['name']):
+            if WORD_TOKEN_RE.fullmatch(token):
+                token_map.setdefault(token, []).append(idx)
+            else:
+                phrase_map.setdefault(token, []).append(idx)
+
+    return {
+        'products': api_list,
+        'token_map': token_map,
+        'phrase_map': phrase_map,
+        'phrases': build_phrase_index(phrase_map),
+        # regex 模式：所有 token (含片語) 的單一 alternation，第一次使用時才建立
+        'pattern': None,
+        # 模糊模式：token + 相鄰字合併的對照表與 n-gram 索引 (fuzzy_index 第一次
+        # 使用時才建立)，查詢結果依字快取
+        'fuzzy_map': None,
+        'ngram_index': None,
+        'fuzzy_threshold': (FUZZY_THRESHOLD if fuzzy_threshold is None else
+                            fuzzy_threshold),
+        'fuzzy_cache': {}
+    }
+
+
+def build_row_texts(df):
+    # 與 smart_match 相同的整列文字 (取 df.values，與 iterrows 一致)，整欄一次處理
+    values = df.values
+    texts = pd.Series([""] * len(df), dtype=object)
+
+    for j in range(values.shape[1]):
+        col = pd.Series(values[:, j], dtype=object)
+        present = col.notna()
+        if present.any():
+            texts[present] = texts[present] + (
+                col[present].map(str).str.upper() + " ")
+
+    # 去掉最後一個分隔空白，等同 " ".join(...)
+    return texts.str[:-1].astype(object)
+
+
+def build_row_index(df):
+    # 法規表格端的前處理 (與產品清單無關)：整列文字、字詞 (token 模式)、
+    # 字詞 + 相鄰兩字合併 (fuzzy 模式)。可由共用快照預先建立，供所有 session 重複使用
+    row_texts = build_row_texts(df)
+    words = row_texts.str.findall(WORD_TOKEN_RE)
+    joins = words.map(lambda ws: [a + b for a, b in zip(ws, ws[1:])])
+    return {
+        'row_texts': row_texts,
+        'tokens': words.explode().dropna(),
+        'fuzzy_tokens': (words + joins).explode().dropna()
+    }
+
+
+def find_fuzzy_matches(match_index, row_index):
+    # 每列的字 + 相鄰兩字合併，依「不重複的字」查詢一次 n-gram 索引
+    row_texts = row_index['row_texts']
+    tokens = row_index['fuzzy_tokens']
+
+    lookup = fuzzy_lookups(match_index, tokens.unique().tolist())
+    hits = tokens.map(lookup).explode().dropna()
+    frames = [
+        pd.DataFrame({
+            'row': hits.index,
+            'product': [hit[0] for hit in hits.values],
+            'score': [hit[1] for hit in hits.values]
+        })
+    ]
+
+    frames.append(find_phrase_matches(match_index, row_index).assign(score=1.0))
+
+    pairs = pd.concat(frames, ignore_index=True).astype({
+        'row': 'int64',
+        'product': 'int64',
+        'score': 'float64'
+    })
+    # 同一 (列, 產品) 保留最高分
+    pairs = pairs.sort_values('score', ascending=False).drop_duplicates(
+        ['row', 'product']).sort_values(['row', 'product'])
+    return pairs.reset_index(drop=True)
+
+
+def regex_pattern(match_index, token_ids):
+    if match_index['pattern'] is None and token_ids:
+        match_index['pattern'] = compile_alternation(token_ids)
+    return match_index['pattern']
+
+
+def find_matches(match_index, df, mode="token", row_index=None):
+    # 回傳 (row, product) 配對；fuzzy 模式另有 score 欄
+    # row_index: build_row_index(df) 的結果 (共用快照已預先建立時傳入)
+    if row_index is None:
+        row_index = build_row_index(df)
+    row_texts = row_index['row_texts']
+
+    if mode == "fuzzy":
+        return find_fuzzy_matches(match_index, row_index)
+
+    if mode == "regex":
+        # 單次掃描：單字與片語同在一個 alternation
+        token_ids = {**match_index['token_map'], **match_index['phrase_map']}
+        pattern = regex_pattern(match_index, token_ids)
+        frames = [] if pattern is None else [
+            find_alternation_matches(pattern, token_ids, row_texts)
+        ]
+    else:
+        tokens = row_index['tokens']
+        hits = tokens.map(match_index['token_map']).dropna().explode()
+        frames = [
+            pd.DataFrame({'row': hits.index, 'product': hits.values}),
+            find_phrase_matches(match_index, row_index)
+        ]
+
+    pairs = pd.concat(frames, ignore_index=True).astype('int64')
+    pairs = pairs.drop_duplicates().sort_values(['row', 'product'])
+    return pairs.reset_index(drop=True)
+
+
+def get_display_col(df_columns, keyword_list):
+    if isinstance(keyword_list, str):
+        keyword_list = [keyword_list]
+
+    cols = {c.lower(): c for c in df_columns}
+
+    for kw in keyword_list:
+        kw = kw.lower()
+        if kw == 'name':
+            for c_lower, c_orig in cols.items():
+                if c_lower == 'name':
+                    return c_orig
+
+        for c_lower, c_orig in cols.items():
+            if kw in c_lower:
+                return c_orig
+    return None
+
+
+# ==========================================
+# 比對結果整理 (Match Results)
+# ==========================================
+# 命中結果以欄式 DataFrame 表示：(row, product) 整數配對一次從來源表格 / 產品清單
+# 取值 (vectorized gather)，不再逐筆建立 dict。Source / Updated date /
+# Matched in Column 每個來源只有一個值，以 categorical 儲存。
+# _key 為「來源列內容代碼 x 產品代碼」的整數，build_summary 以它去重，
+# 結果與逐欄比較內容的 drop_duplicates 相同。
+MATCH_CONSTANT_COLUMNS = ["Source", "Updated date", "Matched in Column"]
+
+
+def _column_values(df, col):
+    # 同名欄位取第一個 (與 get_display_col 相同)
+    return df.iloc[:, list(df.columns).index(col)].to_numpy(dtype=object)
+
+
+def _group_codes(arrays, size):
+    # 每列內容相同者同一代碼 (NaN 視為相同，與 drop_duplicates 一致)
+    if not arrays:
+        return np.zeros(size, dtype='int64')
+    keys = pd.DataFrame({i: pd.Series(a, dtype=object)
+                         for i, a in enumerate(arrays)})
+    return keys.groupby(list(keys.columns), dropna=False,
+                        sort=False).ngroup().to_numpy(dtype='int64')
+
+
+def build_match_frame(df, pairs, api_list, source, date, fields, ref_col):
+    # fields: [(輸出欄名, 來源欄名或 None, 無此欄時的值, 缺值時的替代值或 None)]
+    rows = pairs['row'].to_numpy(dtype='int64')
+    product_ids = pairs['product'].to_numpy(dtype='int64')
+    size = len(rows)
+
+    names = np.array([p['name'] for p in api_list], dtype=object)
+    spts = np.array([p['spt'] for p in api_list], dtype=object)
+
+    def constant(value):
+        return pd.Categorical.from_codes(np.zeros(size, dtype='int8'),
+                                         categories=[value])
+
+    def filled(value):
+        return pd.Series(np.full(size, value, dtype=object), dtype=object)
+
+    columns = {
+        "Source": constant(source),
+        "ScinoPharm Product": pd.Series(names[product_ids], dtype=object),
+        "SPT Project num": pd.Series(spts[product_ids], dtype=object)
+    }
+
+    source_cols = {}
+    for out, col, default, na_value in fields:
+        if not col:
+            columns[out] = filled(default)
+            continue
+        if col not in source_cols:
+            source_cols[col] = _column_values(df, col)
+        values = source_cols[col][rows]
+        if na_value is not None:
+            values = np.where(pd.isna(values), na_value, values)
+        columns[out] = pd.Series(values, dtype=object)
+
+    columns["Updated date"] = constant(date)
+    columns["Matched in Column"] = constant(
+        ref_col if ref_col else "Full Row Match")
+    if ref_col:
+        if ref_col not in source_cols:
+            source_cols[ref_col] = _column_values(df, ref_col)
+        columns["Reference Value"] = pd.Series(source_cols[ref_col][rows],
+                                               dtype=object)
+    else:
+        columns["Reference Value"] = filled("See Raw Data")
+    if 'score' in pairs:
+        columns["Match Score"] = pairs['score'].to_numpy(dtype='float64')
+
+    # 去重鍵：顯示內容取自哪些來源欄 (整表一次編碼) x 產品 (名稱, SPT) 編碼
+    row_codes = _group_codes(list(source_cols.values()), len(df))
+    product_codes = _group_codes([names, spts], len(api_list))
+    n_products = int(product_codes.max()) + 1 if len(api_list) else 1
+    columns["_key"] = row_codes[rows] * n_products + product_codes[product_ids]
+    return pd.DataFrame(columns)
+
+
+def collect_fda_matches(fda_df,
+                        fda_date,
+                        api_list,
+                        match_index,
+                        mode="token",
+                        pairs=None,
+                        row_index=None):
+    if fda_df.empty:
+        return pd.DataFrame()
+
+    nitro_col = get_display_col(fda_df.columns,
+                                ['Nitrosamine', 'nitrosamine', 'impurity'])
+    limit_col = get_display_col(fda_df.columns, ['Limit', 'limit', 'ai'])
+    iupac_col = get_display_col(fda_df.columns, ['IUPAC', 'iupac'])
+    source_col = get_display_col(fda_df.columns, ['Source', 'source'])
+    note_col = get_display_col(fda_df.columns, ['Notes', 'note', 'comment'])
+
+    ref_col = source_col
+
+    # pairs: 預先算好的 (row, product) 配對 (批次模式共用一次比對)
+    fda_pairs = pairs if pairs is not None else find_matches(
+        match_index, fda_df, mode=mode, row_index=row_index)
+    # comparisons: 逐列 x 逐產品的等價比對次數 (索引實際只查 token)
+    count_metric("match.comparisons/FDA", len(fda_df) * len(api_list))
+    count_metric("match.pairs/FDA", len(fda_pairs))
+
+    return build_match_frame(fda_df, fda_pairs, api_list, "USFDA", fda_date, [
+        ("Nitrosamine Impurity", nitro_col, "Check Row", None),
+        ("IUPAC Name", iupac_col, "N/A", None),
+        ("Limit (AI)", limit_col, "N/A", None),
+        ("Notes", note_col, "N/A", None)
+    ], ref_col)
+
+
+def collect_ema_matches(ema_df,
+                        ema_date,
+                        api_list,
+                        match_index,
+                        mode="token",
+                        pairs=None,
+                        row_index=None):
+    if ema_df.empty:
+        return pd.DataFrame()
+
+    nitro_col = get_display_col(ema_df.columns,
+                                ['name', 'nitrosamine', 'impurity'])
+    limit_col = get_display_col(ema_df.columns,
+                                ['ai (ng/day)', 'limit', 'intake', 'ai'])
+    iupac_col = get_display_col(ema_df.columns, ['iupac', 'chemical name'])
+    source_col = get_display_col(ema_df.columns, ['source'])
+    drug_col = get_display_col(ema_df.columns,
+                               ['substance', 'api', 'product', 'active'])
+    note_col = get_display_col(ema_df.columns, ['note', 'comment', 'remark'])
+    ref_col = source_col if source_col else drug_col
+
+    ema_pairs = pairs if pairs is not None else find_matches(
+        match_index, ema_df, mode=mode, row_index=row_index)
+    count_metric("match.comparisons/EMA", len(ema_df) * len(api_list))
+    count_metric("match.pairs/EMA", len(ema_pairs))
+
+    # EMA 表格缺值多，缺值時顯示替代文字
+    return build_match_frame(ema_df, ema_pairs, api_list, "EMA", ema_date, [
+        ("Nitrosamine Impurity", nitro_col, "Check Row", "Check Row"),
+        ("IUPAC Name", iupac_col, "N/A", "N/A"),
+        ("Limit (AI)", limit_col, "N/A", None),
+        ("Notes", note_col, "N/A", "N/A")
+    ], ref_col)
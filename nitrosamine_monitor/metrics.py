@@ -0,0 +1,145 @@
+import contextvars
+import json
+import platform
+import threading
+import time
+from contextlib import contextmanager
+
+# ==========================================
+# 執行量測 (Instrumentation)
+# ==========================================
+# 每次分析為一個 run：stages 記錄各階段 wall / CPU 時間，counters 記錄
+# 下載位元組、解析列數、比對次數與快取命中。run 存在 contextvar 中，
+# 排程到執行緒池的工作需以 contextvars.copy_context().run 執行才會記到同一個 run。
+#
+# JSON 格式 (METRICS_SCHEMA = 1):
+#   {"schema": 1, "started": ISO 時間, "finished": ISO 時間,
+#    "stages": [{"stage": 名稱, "wall": 秒, "cpu": 秒, "calls": 次數}],
+#    "counters": {名稱: 數值}}
+# 以 peak_metric 記錄的計數器 (名稱含 peak) 保留最大值，其餘為累加。
+# 階段名稱以 "/" 分層，例如 fetch/FDA、parse/EMA、match/FDA。
+# cpu 為執行該階段的執行緒 CPU 時間 (thread_time)，不含 PDF 子行程。
+
+METRICS_SCHEMA = 1
+
+_current_run = contextvars.ContextVar("spt_metrics_run", default=None)
+_lock = threading.Lock()
+
+
+def _now():
+    return time.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def current_run():
+    return _current_run.get()
+
+
+@contextmanager
+def collect():
+    # 已在 run 之中時沿用同一個 run (例如 UI 包住 run_analysis + 匯出)
+    run = _current_run.get()
+    if run is not None:
+        yield run
+        return
+
+    run = {'started': _now(), 'finished': None, 'stages': {}, 'counters': {}}
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        run['finished'] = _now()
+        _current_run.reset(token)
+
+
+@contextmanager
+def stage(name):
+    run = _current_run.get()
+    wall0 = time.perf_counter()
+    cpu0 = time.thread_time()
+    try:
+        yield
+    finally:
+        if run is not None:
+            wall = time.perf_counter() - wall0
+            cpu = time.thread_time() - cpu0
+            with _lock:
+                entry = run['stages'].setdefault(name, {
+                    'wall': 0.0,
+                    'cpu': 0.0,
+                    'calls': 0
+                })
+                entry['wall'] += wall
+                entry['cpu'] += cpu
+                entry['calls'] += 1
+
+
+def count_metric(name, value=1):
+    run = _current_run.get()
+    if run is None:
+        return
+    with _lock:
+        run['counters'][name] = run['counters'].get(name, 0) + value
+
+
+def peak_metric(name, value):
+    # 峰值類計數器 (例如記憶體峰值)：同一個 run 多次記錄時保留最大值
+    run = _current_run.get()
+    if run is None:
+        return
+    with _lock:
+        run['counters'][name] = max(run['counters'].get(name, value), value)
+
+
+def peak_rss_bytes():
+    # 行程的最大常駐記憶體 (Linux: KB, macOS: bytes)；Windows 無 resource 模組
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if platform.system() == "Darwin" else peak * 1024
+
+
+def stage_wall_times(run, top_level=True):
+    # 給 CLI --timings 使用：{階段: wall 秒}
+    return {
+        name: entry['wall']
+        for name, entry in run['stages'].items()
+        if not top_level or "/" not in name
+    }
+
+
+def metrics_rows(run):
+    # UI 表格用：階段在前、計數器在後
+    rows = [{
+        'Metric': name,
+        'Wall (s)': round(entry['wall'], 3),
+        'CPU (s)': round(entry['cpu'], 3),
+        'Calls / Value': entry['calls']
+    } for name, entry in run['stages'].items()]
+    rows += [{
+        'Metric': name,
+        'Wall (s)': None,
+        'CPU (s)': None,
+        'Calls / Value': value
+    } for name, value in sorted(run['counters'].items())]
+    return rows
+
+
+def metrics_to_dict(run):
+    return {
+        'schema': METRICS_SCHEMA,
+        'started': run['started'],
+        'finished': run['finished'],
+        'stages': [{
+            'stage': name,
+            'wall': entry['wall'],
+            'cpu': entry['cpu'],
+            'calls': entry['calls']
+        } for name, entry in run['stages'].items()],
+        'counters': dict(run['counters'])
+    }
+
+
+def metrics_to_json(run):
+    return json.dumps(metrics_to_dict(run), ensure_ascii=False, indent=2)
@@ -0,0 +1,246 @@
+import json
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from .metrics import count_metric
+from .settings import CACHE_DIR
+
+# ==========================================
+# 名稱正規化 (Name Normalization)
+# ==========================================
+# PDF、上傳清單與比對 (core tokens) 共用：同一原始字串只計算一次。
+# 每種正規化 (kind) 各一個有界 LRU；可存到磁碟，下次執行同樣的產品清單直接命中。
+# 清理規則或 STOP_WORDS 有變動時遞增 NAME_MEMO_VERSION，舊檔即失效。
+NAME_MEMO_SIZE = int(os.environ.get("SPT_NAME_MEMO_SIZE", "50000"))
+NAME_MEMO_PERSIST = os.environ.get("SPT_NAME_MEMO", "1") != "0"
+NAME_MEMO_PATH = os.path.join(CACHE_DIR, "names.json")
+NAME_MEMO_VERSION = 1
+
+IGNORE_WORDS = ("api name", "regulatory", "therapeutic", "page", "scinopharm",
+                "download", "date", "status", "product")
+IGNORE_RE = re.compile("|".join(re.escape(w) for w in IGNORE_WORDS))
+LETTER_RE = re.compile(r'[a-zA-Z]')
+PARENS_RE = re.compile(r'\s*\(.*?\)')
+MARKS = ('®', '™', '*')
+
+_memo = {
+    'lock': threading.Lock(),
+    'tables': {},
+    'loaded': False,
+    'dirty': False,
+    'hits': Counter(),
+    'misses': Counter(),
+    # 子行程記錄新增項目 (record_new_entries)：{kind: {raw: 值}}；None = 不記錄
+    'added': None
+}
+
+
+def _load_memo():
+    # 第一次使用時載入磁碟上的快取 (呼叫端持有 lock)
+    _memo['loaded'] = True
+    if not NAME_MEMO_PERSIST:
+        return
+    try:
+        with open(NAME_MEMO_PATH, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return
+    if saved.get('version') != NAME_MEMO_VERSION:
+        return
+    for kind, entries in saved.get('tables', {}).items():
+        table = _memo['tables'].setdefault(kind, OrderedDict())
+        for raw, value in entries.items():
+            table[raw] = frozenset(value) if isinstance(value, list) else value
+        while len(table) > NAME_MEMO_SIZE:
+            table.popitem(last=False)
+
+
+def _table(kind):
+    if not _memo['loaded']:
+        _load_memo()
+    return _memo['tables'].setdefault(kind, OrderedDict())
+
+
+def memoized(kind, raw, fn):
+    # raw -> fn(raw)；只快取字串 (值需為 str / bool / frozenset 才能存檔)
+    if not isinstance(raw, str):
+        return fn(raw)
+    with _memo['lock']:
+        table = _table(kind)
+        if raw in table:
+            table.move_to_end(raw)
+            _memo['hits'][kind] += 1
+            value = table[raw]
+            hit = True
+        else:
+            hit = False
+    count_metric(f"name_memo.{'hits' if hit else 'misses'}/{kind}")
+    if hit:
+        return value
+
+    value = fn(raw)
+    with _memo['lock']:
+        _memo['misses'][kind] += 1
+        _store(kind, table, raw, value)
+    return value
+
+
+def memoized_many(kind, raws, fn_many):
+    # 整批版本：只把未命中的字串交給 fn_many (回傳等長 list)；回傳 {raw: 值}
+    found = {}
+    missing = []
+    with _memo['lock']:
+        table = _table(kind)
+        for raw in raws:
+            if raw in table:
+                table.move_to_end(raw)
+                found[raw] = table[raw]
+            else:
+                missing.append(raw)
+        _memo['hits'][kind] += len(found)
+    count_metric(f"name_memo.hits/{kind}", len(found))
+    count_metric(f"name_memo.misses/{kind}", len(missing))
+
+    if missing:
+        values = fn_many(missing)
+        with _memo['lock']:
+            _memo['misses'][kind] += len(missing)
+            for raw, value in zip(missing, values):
+                _store(kind, table, raw, value)
+                found[raw] = value
+    return found
+
+
+def _store(kind, table, raw, value):
+    table[raw] = value
+    while len(table) > NAME_MEMO_SIZE:
+        table.popitem(last=False)
+    _memo['dirty'] = True
+    if _memo['added'] is not None:
+        _memo['added'].setdefault(kind, {})[raw] = value
+
+
+# --- 跨行程合併 (PDF 解析子行程 -> 主行程) ---
+def record_new_entries():
+    # 子行程的 initializer：之後新增的項目另外記錄，由 take_new_entries 取回
+    with _memo['lock']:
+        if _memo['added'] is None:
+            _memo['added'] = {}
+
+
+def take_new_entries():
+    # 回傳並清空上次取回後新增的 {kind: {raw: 值}}
+    with _memo['lock']:
+        added = _memo['added'] or {}
+        if _memo['added'] is not None:
+            _memo['added'] = {}
+        return added
+
+
+def merge_name_memo(entries):
+    # 併入其他行程算好的項目 (不計入命中率)；之後由 save_name_memo 一併存檔
+    with _memo['lock']:
+        for kind, items in entries.items():
+            table = _table(kind)
+            for raw, value in items.items():
+                if raw not in table:
+                    _store(kind, table, raw, value)
+
+
+def save_name_memo(path=None):
+    # 有新項目時寫回磁碟 (先寫暫存檔再替換)；回傳是否有寫入
+    if not NAME_MEMO_PERSIST:
+        return False
+    path = path or NAME_MEMO_PATH
+    with _memo['lock']:
+        if not _memo['dirty']:
+            return False
+        saved = {
+            'version': NAME_MEMO_VERSION,
+            'tables': {
+                kind: {
+                    raw: sorted(value) if isinstance(value, frozenset) else
+                    value
+                    for raw, value in table.items()
+                }
+                for kind, table in _memo['tables'].items()
+            }
+        }
+        _memo['dirty'] = False
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(saved, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError:
+        _memo['dirty'] = True
+        return False
+    return True
+
+
+def name_memo_stats():
+    # {kind: {'size', 'hits', 'misses', 'hit_rate'}} (行程啟動以來)
+    with _memo['lock']:
+        stats = {}
+        for kind in sorted(set(_memo['tables']) | set(_memo['hits'])):
+            hits = _memo['hits'][kind]
+            misses = _memo['misses'][kind]
+            stats[kind] = {
+                'size': len(_memo['tables'].get(kind, ())),
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': hits / (hits + misses) if hits + misses else None
+            }
+        return stats
+
+
+def format_name_memo_stats(stats=None):
+    stats = name_memo_stats() if stats is None else stats
+    parts = []
+    for kind, item in stats.items():
+        rate = "-" if item['hit_rate'] is None else f"{item['hit_rate']:.0%}"
+        total = item['hits'] + item['misses']
+        parts.append(f"{kind} {rate} ({item['hits']}/{total})")
+    return "🔤 名稱正規化快取命中率: " + (" | ".join(parts) or "尚未使用")
+
+
+# --- 正規化函數 ---
+def _is_valid_api_name(text):
+    if not text: return False
+    text = text.lower()
+    if IGNORE_RE.search(text): return False
+    if len(text) < 3: return False
+    if not LETTER_RE.search(text): return False
+    return True
+
+
+def _clean_api_name(text):
+    text = PARENS_RE.sub('', text)
+    for mark in MARKS:
+        text = text.replace(mark, '')
+    return text.strip()
+
+
+def is_valid_api_name(text):
+    return memoized("valid", text, _is_valid_api_name)
+
+
+def clean_api_name(text):
+    return memoized("clean", text, _clean_api_name)
+
+
+def clean_api_names(names):
+    # clean_api_name 的整欄版本：不重複的字串查快取，未命中的以 pandas 字串運算一次清理
+    import pandas as pd
+
+    def clean_many(raws):
+        missing = pd.Series(raws, dtype=object)
+        missing = missing.str.replace(PARENS_RE, '', regex=True)
+        missing = missing.str.replace('[®™*]', '', regex=True)
+        return missing.str.strip().tolist()
+
+    mapping = memoized_many("clean", names.unique(), clean_many)
+    return names.map(mapping).astype(object)
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+from .settings import CACHE_DIR
+
+# ==========================================
+# PDF 逐頁結果快取 (Per-page PDF Cache)
+# ==========================================
+# 產品 PDF 每頁解析出的名稱存在 SQLite：
+#   - 以 (PDF 內容 hash, 頁碼) 為鍵：重新下載但內容相同的 PDF 完全不需解析
+#   - 另存每頁的內容指紋 (內容串流 + 字型等資源)：只改了一頁的新 PDF，
+#     其他頁以指紋命中，只重新解析有變動的頁面
+# 解析邏輯 (extract_page_names / 名稱清理) 有變動時遞增 PAGE_CACHE_VERSION，舊快取即失效。
+PAGE_CACHE_DB = os.environ.get("SPT_PDF_PAGE_CACHE_DB",
+                               os.path.join(CACHE_DIR, "pdf_pages.sqlite"))
+PAGE_CACHE_ENABLED = os.environ.get("SPT_PDF_PAGE_CACHE", "1") != "0"
+# 保留最近使用的 PDF 數
+PAGE_CACHE_KEEP = int(os.environ.get("SPT_PDF_PAGE_CACHE_KEEP", "20"))
+PAGE_CACHE_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pdf_docs (
+    pdf_hash TEXT PRIMARY KEY,
+    page_count INTEGER,
+    used_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pdf_pages (
+    pdf_hash TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    fingerprint TEXT,
+    names TEXT NOT NULL,
+    PRIMARY KEY (pdf_hash, page)
+);
+CREATE INDEX IF NOT EXISTS idx_pdf_pages_fingerprint ON pdf_pages (fingerprint);
+"""
+
+
+def _connect():
+    os.makedirs(os.path.dirname(PAGE_CACHE_DB) or ".", exist_ok=True)
+    conn = sqlite3.connect(PAGE_CACHE_DB, timeout=30)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def pdf_digest(pdf_bytes):
+    h = hashlib.sha256(f"pdf:v{PAGE_CACHE_VERSION}:".encode())
+    h.update(pdf_bytes)
+    return h.hexdigest()
+
+
+def _object_digest(obj, memo):
+    # 遞迴 hash PDF 物件 (參照解開、串流取解碼後內容)；memo: objid -> digest (同一份 PDF 內共用)
+    from pdfminer.pdftypes import PDFObjRef, PDFStream
+
+    if isinstance(obj, PDFObjRef):
+        if obj.objid in memo:
+            return memo[obj.objid]
+        memo[obj.objid] = b"cycle"
+        digest = _object_digest(obj.resolve(), memo)
+        memo[obj.objid] = digest
+        return digest
+
+    h = hashlib.sha256()
+    if isinstance(obj, PDFStream):
+        h.update(b"S")
+        h.update(_object_digest(obj.attrs, memo))
+        h.update(obj.get_data())
+    elif isinstance(obj, dict):
+        h.update(b"D")
+        for key in sorted(obj, key=str):
+            h.update(repr(key).encode())
+            h.update(_object_digest(obj[key], memo))
+    elif isinstance(obj, (list, tuple)):
+        h.update(b"L")
+        for value in obj:
+            h.update(_object_digest(value, memo))
+    else:
+        h.update(repr(obj).encode())
+    return h.digest()
+
+
+def page_fingerprint(page, memo):
+    # 影響文字與格線的部分：內容串流、資源 (字型 / XObject)、頁面框與旋轉；無法計算時回傳 None
+    page_obj = page.page_obj
+    try:
+        h = hashlib.sha256(f"page:v{PAGE_CACHE_VERSION}:".encode())
+        h.update(repr((page_obj.mediabox, page_obj.cropbox,
+                       page_obj.rotate)).encode())
+        for key in ("Contents", "Resources"):
+            h.update(_object_digest(page_obj.attrs.get(key), memo))
+    except Exception:
+        return None
+    return h.hexdigest()
+
+
+def load_document(digest):
+    # 整份 PDF 都已快取時回傳每頁名稱清單，否則 None
+    if not PAGE_CACHE_ENABLED:
+        return None
+    try:
+        with closing(_connect()) as conn:
+            row = conn.execute(
+                "SELECT page_count FROM pdf_docs WHERE pdf_hash = ?",
+                (digest, )).fetchone()
+            if row is None or row[0] is None:
+                return None
+            rows = conn.execute(
+                "SELECT page, names FROM pdf_pages WHERE pdf_hash = ? "
+                "ORDER BY page", (digest, )).fetchall()
+            if [page for page, _ in rows] != list(range(row[0])):
+                return None
+            with conn:
+                conn.execute(
+                    "UPDATE pdf_docs SET used_at = ? WHERE pdf_hash = ?",
+                    (time.time(), digest))
+    except (sqlite3.Error, OSError):
+        return None
+    return [json.loads(names) for _, names in rows]
+
+
+def open_page_lookup():
+    # 解析用的唯讀連線 (子行程各自開啟)；快取停用或無法開啟時回傳 None
+    if not PAGE_CACHE_ENABLED or not os.path.exists(PAGE_CACHE_DB):
+        return None
+    try:
+        return sqlite3.connect(f"file:{PAGE_CACHE_DB}?mode=ro",
+                               uri=True,
+                               timeout=30)
+    except sqlite3.Error:
+        return None
+
+
+def lookup_page(conn, fingerprint):
+    if conn is None or fingerprint is None:
+        return None
+    try:
+        row = conn.execute(
+            "SELECT names FROM pdf_pages WHERE fingerprint = ? LIMIT 1",
+            (fingerprint, )).fetchone()
+    except sqlite3.Error:
+        return None
+    return None if row is None else json.loads(row[0])
+
+
+def store_document(digest, pages, fingerprints, complete):
+    # complete=False (解析中途出錯) 時仍保存已解析頁面的指紋，但不視為整份命中
+    if not PAGE_CACHE_ENABLED:
+        return False
+    try:
+        with closing(_connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO pdf_docs (pdf_hash, page_count, used_at) "
+                "VALUES (?, ?, ?)",
+                (digest, len(pages) if complete else None, time.time()))
+            conn.executemany(
+                "INSERT OR REPLACE INTO pdf_pages "
+                "(pdf_hash, page, fingerprint, names) VALUES (?, ?, ?, ?)",
+                [(digest, page, fingerprint, json.dumps(names))
+                 for page, (names, fingerprint) in enumerate(
+                     zip(pages, fingerprints))])
+            # 只保留最近使用的 PAGE_CACHE_KEEP 份
+            stale = [
+                row[0] for row in conn.execute(
+                    "SELECT pdf_hash FROM pdf_docs ORDER BY used_at DESC "
+                    "LIMIT -1 OFFSET ?", (PAGE_CACHE_KEEP, ))
+            ]
+            conn.executemany("DELETE FROM pdf_pages WHERE pdf_hash = ?",
+                             [(h, ) for h in stale])
+            conn.executemany("DELETE FROM pdf_docs WHERE pdf_hash = ?",
+                             [(h, ) for h in stale])
+    except (sqlite3.Error, OSError):
+        return False
+    return True
@@ -0,0 +1,256 @@
+import io
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .metrics import count_metric
+from .names import (clean_api_name, is_valid_api_name, merge_name_memo,
+                    record_new_entries, take_new_entries)
+from .page_cache import (load_document, lookup_page, open_page_lookup,
+                         page_fingerprint, pdf_digest, store_document)
+
+# PDF 解析的 process 數: 0 = 依 CPU 數自動決定, 1 = 單執行緒 (小型容器)
+PDF_PARSE_WORKERS = int(os.environ.get("SPT_PDF_WORKERS", "0") or 0)
+# 快速路徑：沒有格線的頁面不找表格；有表格時只擷取第一欄的文字 (結果與 extract_tables 相同)
+PDF_FAST_PATH = os.environ.get("SPT_PDF_FAST_PATH", "1") != "0"
+
+
+def page_has_rulings(page):
+    # 預設的表格偵測 (lines 策略) 只由 line / rect / curve 構成的格線找表格，
+    # 沒有這些物件的頁面 extract_tables() 必為空
+    return bool(page.lines or page.rects or page.curves)
+
+
+def first_column_cells(page):
+    # 等同 [row[0] for table in page.extract_tables() for row in table if row]，
+    # 但每列只取第一格的字元 (Table.extract 會為每一格掃描整列字元)
+    import numpy as np
+    from pdfplumber.table import TableSettings
+    from pdfplumber.utils import extract_text
+
+    settings = TableSettings.resolve(None)
+    text_settings = settings.text_settings or {}
+    chars = page.chars
+    # 與 Table.extract 相同的字元中心點判斷
+    h_mid = np.array([(c["x0"] + c["x1"]) / 2 for c in chars], dtype=float)
+    v_mid = np.array([(c["top"] + c["bottom"]) / 2 for c in chars],
+                     dtype=float)
+
+    cells = []
+    for table in page.find_tables(settings):
+        for row in table.rows:
+            if not row.cells:
+                continue
+            cell = row.cells[0]
+            if cell is None:
+                cells.append(None)
+                continue
+            x0, top, x1, bottom = cell
+            inside = np.flatnonzero((h_mid >= x0) & (h_mid < x1) &
+                                    (v_mid >= top) & (v_mid < bottom))
+            cells.append(
+                extract_text([chars[i] for i in inside], **text_settings)
+                if len(inside) else "")
+    return cells
+
+
+def extract_page_names(page, fast=None):
+    names = []
+    found_in_table = False
+
+    if PDF_FAST_PATH if fast is None else fast:
+        cells = first_column_cells(page) if page_has_rulings(page) else []
+    else:
+        cells = [
+            row[0] for table in page.extract_tables() for row in table
+            if row and len(row) > 0
+        ]
+
+    for cell in cells:
+        val = str(cell).strip()
+        if is_valid_api_name(val):
+            names.append(clean_api_name(val))
+            found_in_table = True
+
+    if not found_in_table:
+        text = page.extract_text()
+        if text:
+            lines = text.split('\n')
+            for line in lines:
+                parts = re.split(r'\s{2,}', line.strip())
+                if parts:
+                    candidate = parts[0]
+                    if is_valid_api_name(candidate):
+                        names.append(clean_api_name(candidate))
+
+    return names
+
+
+def parse_pdf_pages(pdf_bytes, start, stop, use_cache=True):
+    # 回傳 (每頁名稱清單, 錯誤訊息, 每頁指紋, 統計)；出錯時保留已解析的頁面，與逐頁解析行為一致
+    # 頁面指紋命中快取 (其他 PDF / 舊版本中內容相同的頁面) 時不需解析
+    import pdfplumber
+
+    pages = []
+    fingerprints = []
+    stats = _empty_stats()
+    lookup = open_page_lookup() if use_cache else None
+    try:
+        with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+            memo = {}
+            for page in pdf.pages[start:stop]:
+                fingerprint = page_fingerprint(page, memo)
+                names = lookup_page(lookup, fingerprint)
+                if names is not None:
+                    stats['page_hits'] += 1
+                else:
+                    if PDF_FAST_PATH and not page_has_rulings(page):
+                        stats['tables_skipped'] += 1
+                    names = extract_page_names(page)
+                pages.append(names)
+                fingerprints.append(fingerprint)
+                # 釋放已解析頁面的版面物件
+                page.close()
+    except Exception as e:
+        return pages, str(e), fingerprints, stats
+    finally:
+        if lookup is not None:
+            lookup.close()
+    return pages, None, fingerprints, stats
+
+
+def count_pdf_pages(pdf_bytes):
+    import pdfplumber
+
+    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+        return len(pdf.pages)
+
+
+def pool_context():
+    # 主行程有多個執行緒 (Streamlit、背景更新、HTTP 連線池)，fork 可能複製到被鎖住的 lock；
+    # 子行程改由 forkserver (不支援時 spawn) 建立
+    # forkserver 預先載入解析模組 (server 本身單執行緒)，每個子行程不必重新 import pdfplumber
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload([__name__, "pdfplumber"])
+    return context
+
+
+def _parse_pages_task(pdf_bytes, start, stop, use_cache):
+    # 子行程執行：一併回傳這段解析新增的名稱正規化項目，由主行程合併
+    return parse_pdf_pages(pdf_bytes, start, stop,
+                           use_cache), take_new_entries()
+
+
+def resolve_workers(workers=None):
+    if workers is None:
+        workers = PDF_PARSE_WORKERS
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return max(1, workers)
+
+
+def parse_product_pdfs(pdf_blobs, workers=None, use_cache=True):
+    # 回傳每個 PDF 的 (每頁名稱清單, 錯誤訊息)，順序與輸入相同
+    # 內容相同的 PDF 直接取逐頁快取；其餘解析 (頁面指紋命中者除外) 後寫回快取
+    # use_cache=False：不讀也不寫快取 (量測解析本身，如 bench)
+    workers = resolve_workers(workers)
+    digests = [pdf_digest(blob) for blob in pdf_blobs]
+
+    results = [None] * len(pdf_blobs)
+    todo = []
+    for pdf_idx, digest in enumerate(digests):
+        cached = load_document(digest) if use_cache else None
+        if cached is None:
+            todo.append(pdf_idx)
+            continue
+        count_metric("pdf_cache.hits/document")
+        count_metric("pdf_cache.hits/page", len(cached))
+        results[pdf_idx] = (cached, None)
+
+    parsed = _parse_blobs([pdf_blobs[i] for i in todo], workers, use_cache)
+    for pdf_idx, (pages, error, fingerprints, stats) in zip(todo, parsed):
+        count_metric("pdf_cache.hits/page", stats['page_hits'])
+        count_metric("pdf_cache.misses/page", len(pages) - stats['page_hits'])
+        count_metric("pdf.tables_skipped", stats['tables_skipped'])
+        if use_cache and (pages or error is None):
+            store_document(digests[pdf_idx],
+                           pages,
+                           fingerprints,
+                           complete=error is None)
+        results[pdf_idx] = (pages, error)
+    return results
+
+
+def _empty_stats():
+    return {'page_hits': 0, 'tables_skipped': 0}
+
+
+def _parse_blobs(pdf_blobs, workers, use_cache=True):
+    # 回傳每個 PDF 的 (每頁名稱清單, 錯誤訊息, 每頁指紋, 統計)
+    if workers == 1:
+        return [
+            parse_pdf_pages(blob, 0, None, use_cache) for blob in pdf_blobs
+        ]
+
+    results = []
+    tasks = []
+    for pdf_idx, blob in enumerate(pdf_blobs):
+        try:
+            page_count = count_pdf_pages(blob)
+        except Exception as e:
+            results.append(([], str(e), [], _empty_stats()))
+            continue
+        results.append(None)
+
+        # 每個 PDF 切成連續頁段，避免每頁都重新開檔
+        chunk = max(1, -(-page_count // workers))
+        for start in range(0, page_count, chunk):
+            tasks.append((pdf_idx, blob, start, min(start + chunk,
+                                                     page_count)))
+
+    chunks = {}
+    try:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=pool_context(),
+                                 initializer=record_new_entries) as pool:
+            futures = [(pdf_idx,
+                        pool.submit(_parse_pages_task, blob, start, stop,
+                                    use_cache))
+                       for pdf_idx, blob, start, stop in tasks]
+
+            for pdf_idx, future in futures:
+                result, name_entries = future.result()
+                merge_name_memo(name_entries)
+                chunks.setdefault(pdf_idx, []).append(result)
+    except (OSError, BrokenProcessPool):
+        # 無法建立子行程 (受限容器) 時退回單執行緒
+        return [
+            parse_pdf_pages(blob, 0, None, use_cache) for blob in pdf_blobs
+        ]
+
+    # 依 PDF、頁碼固定順序合併；遇到錯誤即停止該 PDF 後續頁段
+    for pdf_idx, pdf_chunks in chunks.items():
+        pages = []
+        fingerprints = []
+        stats = _empty_stats()
+        error = None
+        for (chunk_pages, chunk_error, chunk_fingerprints,
+             chunk_stats) in pdf_chunks:
+            pages.extend(chunk_pages)
+            fingerprints.extend(chunk_fingerprints)
+            for key, value in chunk_stats.items():
+                stats[key] += value
+            if chunk_error:
+                error = chunk_error
+                break
+        results[pdf_idx] = (pages, error, fingerprints, stats)
+
+    for pdf_idx, result in enumerate(results):
+        if result is None:
+            results[pdf_idx] = ([], None, [], _empty_stats())
+
+    return results
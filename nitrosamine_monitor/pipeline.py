@@ -0,0 +1,287 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from .fetch import format_fetch_status, run_fetch_jobs
+from .matching import (build_match_index, collect_ema_matches,
+                       collect_fda_matches, find_matches)
+from .metrics import collect, stage, stage_wall_times
+from .names import save_name_memo
+from .report import arrange_summary, build_summary, mark_new_records
+from .shared import share_snapshot
+from .snapshots import SNAPSHOTS_ENABLED, format_delta, update_snapshot
+from .sources import get_ema_data, get_fda_data
+
+
+# ==========================================
+# 分析流程 (UI 與 CLI 共用)
+# ==========================================
+def fetch_regulatory_data(fetchers=None, initializer=None):
+    fetchers = fetchers or {"FDA": get_fda_data, "EMA": get_ema_data}
+    results, fetch_status = run_fetch_jobs(fetchers, initializer=initializer)
+
+    fda_df, fda_date, fda_logs = results["FDA"] or (
+        pd.DataFrame(), "N/A", [fetch_status["FDA"]['message']])
+    ema_df, ema_date, ema_logs = results["EMA"] or (
+        pd.DataFrame(), "N/A", [fetch_status["EMA"]['message']])
+
+    return {
+        'fda_df': fda_df,
+        'fda_date': fda_date,
+        'fda_logs': fda_logs,
+        'ema_df': ema_df,
+        'ema_date': ema_date,
+        'ema_logs': ema_logs,
+        'fetch_status': fetch_status
+    }
+
+
+def collect_delta_matches(collect_fn,
+                          df,
+                          date,
+                          api_list,
+                          match_index,
+                          mode,
+                          delta,
+                          row_index=None):
+    # 只比對快照差異中的新增 / 變動列，並直接標記狀態；回傳欄式結果的 list
+    # row_index 對應整張表，只用於非差異模式
+    if delta is None:
+        return [
+            collect_fn(df, date, api_list, match_index, mode,
+                       row_index=row_index)
+        ]
+
+    match_frames = []
+    for positions, status in ((delta['added'], "★ NEW"),
+                              (delta['changed'], "★ CHANGED")):
+        if not positions:
+            continue
+        subset = df.iloc[positions].reset_index(drop=True)
+        frame = collect_fn(subset, date, api_list, match_index, mode)
+        if len(frame):
+            frame['Status'] = status
+            match_frames.append(frame)
+    return match_frames
+
+
+def update_snapshots(data, progress):
+    deltas = {}
+    if not SNAPSHOTS_ENABLED:
+        return deltas
+    with stage("snapshot"):
+        for source, df, date in (("FDA", data['fda_df'], data['fda_date']),
+                                 ("EMA", data['ema_df'], data['ema_date'])):
+            if df.empty:
+                continue
+            try:
+                deltas[source] = update_snapshot(source, df, date)
+                progress(format_delta(deltas[source]))
+            except (sqlite3.Error, OSError) as e:
+                progress(f"⚠️ {source} 快照儲存失敗: {e}")
+    return deltas
+
+
+def delta_fallbacks(data, deltas, progress):
+    # 要求只比對差異、但來源沒有快照差異 (快照停用 / 儲存失敗) 時改為完整比對並提示；
+    # 來源內容與上次執行相同時提示本次沒有 ★ NEW / ★ CHANGED
+    fallbacks = {}
+    for source, df in (("FDA", data['fda_df']), ("EMA", data['ema_df'])):
+        if df.empty:
+            continue
+        delta = deltas.get(source)
+        if delta is None:
+            fallbacks[source] = ("快照未啟用 (SPT_SNAPSHOTS=0)"
+                                 if not SNAPSHOTS_ENABLED else "快照儲存失敗")
+            progress(f"⚠️ {source} {fallbacks[source]}，改為完整比對 "
+                     "(不標記 ★ NEW / ★ CHANGED)")
+        elif delta['unchanged']:
+            progress(f"ℹ️ {source} 來源與上次執行相同 (快照 "
+                     f"#{delta['snapshot_id']})：沒有 ★ NEW / ★ CHANGED")
+    return fallbacks
+
+
+def run_analysis(api_list,
+                 history_files=None,
+                 match_mode="token",
+                 fuzzy_threshold=None,
+                 delta_only=False,
+                 fetchers=None,
+                 initializer=None,
+                 progress=None,
+                 shared=None):
+    # shared: new_shared_cache() 的共用快照 (UI 所有 session 共用)；None 時每次自行前處理
+    # 量測記到呼叫端的 run (若有)，否則自成一個 run
+    with collect() as run:
+        data = _analyze(api_list, history_files, match_mode, fuzzy_threshold,
+                        delta_only, fetchers, initializer, progress
+                        or (lambda msg: None), shared)
+    save_name_memo()
+    data['metrics'] = run
+    data['timings'] = stage_wall_times(run)
+    return data
+
+
+def _analyze(api_list, history_files, match_mode, fuzzy_threshold, delta_only,
+             fetchers, initializer, progress, shared):
+    progress("🌍 下載 FDA / EMA 資料庫...")
+    with stage("fetch"):
+        data = fetch_regulatory_data(fetchers, initializer)
+    progress(format_fetch_status(data['fetch_status']))
+    if shared is not None:
+        data = share_snapshot(shared, data)
+    row_index = data.get('row_index') or {}
+
+    fda_df = data['fda_df']
+    ema_df = data['ema_df']
+    if not fda_df.empty:
+        progress(
+            f"✅ FDA: {len(fda_df)} 筆 (已過濾僅 Table 1 & 2), EMA: {len(ema_df)} 筆")
+    else:
+        progress(f"⚠️ FDA: 0 筆 (抓取失敗), EMA: {len(ema_df)} 筆")
+
+    deltas = update_snapshots(data, progress)
+    fallbacks = delta_fallbacks(data, deltas, progress) if delta_only else {}
+
+    progress("🔍 執行比對..." if not delta_only else "🔍 執行比對 (僅快照差異)...")
+    with stage("match"):
+        match_index = build_match_index(api_list, fuzzy_threshold)
+        with stage("match/FDA"):
+            match_frames = collect_delta_matches(
+                collect_fda_matches, fda_df, data['fda_date'], api_list,
+                match_index, match_mode,
+                deltas.get("FDA") if delta_only else None,
+                row_index.get("FDA"))
+        with stage("match/EMA"):
+            match_frames += collect_delta_matches(
+                collect_ema_matches, ema_df, data['ema_date'], api_list,
+                match_index, match_mode,
+                deltas.get("EMA") if delta_only else None,
+                row_index.get("EMA"))
+
+    summary = None
+    new_count = None
+    history_error = None
+    if any(len(frame) for frame in match_frames):
+        summary = build_summary(match_frames)
+
+        if history_files:
+            with stage("history"):
+                try:
+                    new_count = mark_new_records(summary, history_files)
+                except Exception as e:
+                    history_error = str(e)
+
+        summary = arrange_summary(summary)
+
+    data.update({
+        'summary': summary,
+        'new_count': new_count,
+        'history_error': history_error,
+        'deltas': deltas,
+        'delta_fallbacks': fallbacks
+    })
+    return data
+
+
+# ==========================================
+# 批次分析 (多份產品清單共用一次下載與比對)
+# ==========================================
+def merge_portfolios(portfolios):
+    # 合併所有清單的產品名稱 (去重)；回傳 (合併清單, 各清單 local id -> 合併 id)
+    merged = []
+    merged_ids = {}
+    id_maps = {}
+    for name, api_list in portfolios.items():
+        ids = []
+        for api_obj in api_list:
+            key = api_obj['name']
+            if key not in merged_ids:
+                merged_ids[key] = len(merged)
+                merged.append({'name': key, 'spt': "N/A"})
+            ids.append(merged_ids[key])
+        id_maps[name] = np.array(ids, dtype='int64')
+    return merged, id_maps
+
+
+def portfolio_pairs(pairs, merged_to_local):
+    # 合併索引的配對轉成單一清單的 local id；順序與單獨比對時相同
+    local = merged_to_local[pairs['product'].to_numpy()]
+    keep = local >= 0
+    out = pairs[keep].assign(product=local[keep])
+    return out.sort_values(['row', 'product']).reset_index(drop=True)
+
+
+def run_batch(portfolios,
+              match_mode="token",
+              fuzzy_threshold=None,
+              fetchers=None,
+              initializer=None,
+              progress=None,
+              shared=None):
+    # portfolios: {名稱: api_list}；回傳 {'portfolios': {名稱: 結果}, ...}
+    progress = progress or (lambda msg: None)
+    with collect() as run:
+        progress("🌍 下載 FDA / EMA 資料庫...")
+        with stage("fetch"):
+            data = fetch_regulatory_data(fetchers, initializer)
+        progress(format_fetch_status(data['fetch_status']))
+        if shared is not None:
+            data = share_snapshot(shared, data)
+        row_index = data.get('row_index') or {}
+        data['deltas'] = update_snapshots(data, progress)
+
+        merged, id_maps = merge_portfolios(portfolios)
+        progress(f"🔍 合併 {len(portfolios)} 份清單 ({len(merged)} 項產品) 一次比對...")
+        with stage("match"):
+            match_index = build_match_index(merged, fuzzy_threshold)
+            source_pairs = {
+                source: find_matches(match_index,
+                                     df,
+                                     mode=match_mode,
+                                     row_index=row_index.get(source))
+                for source, df in (("FDA", data['fda_df']),
+                                   ("EMA", data['ema_df'])) if not df.empty
+            }
+
+        results = {}
+        for name, api_list in portfolios.items():
+            with stage(f"portfolio/{name}"):
+                merged_to_local = np.full(len(merged), -1, dtype='int64')
+                merged_to_local[id_maps[name]] = np.arange(len(api_list))
+
+                match_frames = []
+                for source, collect_fn, df, date in (
+                    ("FDA", collect_fda_matches, data['fda_df'],
+                     data['fda_date']),
+                    ("EMA", collect_ema_matches, data['ema_df'],
+                     data['ema_date'])):
+                    if source in source_pairs:
+                        match_frames.append(collect_fn(
+                            df,
+                            date,
+                            api_list,
+                            None,
+                            match_mode,
+                            pairs=portfolio_pairs(source_pairs[source],
+                                                  merged_to_local)))
+
+                summary = None
+                if any(len(frame) for frame in match_frames):
+                    summary = arrange_summary(build_summary(match_frames))
+                results[name] = {
+                    'products': len(api_list),
+                    'summary': summary,
+                    'matches': 0 if summary is None else len(summary)
+                }
+            results[name]['seconds'] = run['stages'][f"portfolio/{name}"][
+                'wall']
+            progress(f"📊 {name}: {len(api_list)} 項產品, "
+                     f"{results[name]['matches']} 筆結果")
+
+    save_name_memo()
+    data['portfolios'] = results
+    data['metrics'] = run
+    data['timings'] = stage_wall_times(run)
+    return data
@@ -0,0 +1,308 @@
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import requests
+
+from .http_cache import cached_get
+from .http_client import describe_error, format_error
+from .metrics import count_metric, stage
+from .names import clean_api_names, save_name_memo
+from .pdf_parse import parse_product_pdfs
+from .settings import source_url
+
+# ==========================================
+# 1. 核心函數: 產品清單來源
+# ==========================================
+SCINOPHARM_BASE_URL = "https://www.scinopharm.com"
+SCINOPHARM_PRODUCTS_URL = "https://www.scinopharm.com/tw/products-detail/commercialAPI/"
+SCINOPHARM_DEFAULT_PDF_URL = "https://www.scinopharm.com/tw/download/43/"
+
+
+def get_scinopharm_apis_auto(pdf_workers=None):
+    base_url = SCINOPHARM_BASE_URL
+    target_url = SCINOPHARM_PRODUCTS_URL
+
+    REAL_HEADERS = {
+        "User-Agent":
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+        "Accept":
+        "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
+        "Referer": "https://www.scinopharm.com/"
+    }
+
+    product_dict = {}
+    debug_logs = []
+
+    try:
+        r = cached_get(source_url(target_url),
+                       headers=REAL_HEADERS,
+                       timeout=15,
+                       raise_for_status=False)
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(r['text'], 'html.parser')
+
+        target_keywords = ["下載產品清單", "下載藥物主檔申請列表"]
+        pdf_links = []
+
+        for a in soup.find_all('a', href=True):
+            if any(k in a.get_text(strip=True) for k in target_keywords):
+                full_link = a['href']
+                if not full_link.startswith("http"):
+                    full_link = base_url + full_link if full_link.startswith(
+                        "/") else base_url + "/" + full_link
+                pdf_links.append(full_link)
+
+        if not pdf_links:
+            pdf_links.append(SCINOPHARM_DEFAULT_PDF_URL)
+            debug_logs.append("⚠️ 未在頁面找到連結，使用預設 ID 43 進行嘗試。")
+
+        def download_pdf(link):
+            return cached_get(source_url(link),
+                              headers=REAL_HEADERS,
+                              timeout=15)
+
+        # 同時下載所有 PDF，再依連結順序解析
+        with ThreadPoolExecutor(max_workers=min(4, len(pdf_links))) as pool:
+            downloads = [
+                pool.submit(contextvars.copy_context().run, download_pdf, link)
+                for link in pdf_links
+            ]
+
+        link_logs = []
+        pdf_blobs = []
+        for link, download in zip(pdf_links, downloads):
+            logs = [f"處理連結: {link}"]
+            blob_idx = None
+            try:
+                pdf_resp = download.result()
+
+                if not pdf_resp['content'].startswith(b'%PDF-'):
+                    logs.append(f"❌ 略過: 下載內容不是 PDF (可能是 HTML 錯誤頁面)。")
+                else:
+                    logs.append("✅ 格式驗證成功，開始解析...")
+                    blob_idx = len(pdf_blobs)
+                    pdf_blobs.append(pdf_resp['content'])
+
+            except requests.exceptions.RequestException as e:
+                logs.append(f"❌ 網路請求失敗: {format_error(describe_error(e))}")
+            except Exception as e:
+                logs.append(f"❌ 解析過程錯誤: {e}")
+            link_logs.append((logs, blob_idx))
+
+        # 所有 PDF 的頁面一起分散到多個 process 解析，再依固定順序合併
+        with stage("parse/ScinoPharm"):
+            parsed = parse_product_pdfs(pdf_blobs, workers=pdf_workers)
+
+        for logs, blob_idx in link_logs:
+            debug_logs.extend(logs)
+            if blob_idx is None:
+                continue
+            pages, error = parsed[blob_idx]
+            count_metric("pdf.pages", len(pages))
+            for names in pages:
+                for name in names:
+                    if name not in product_dict:
+                        product_dict[name] = "N/A"
+            if error:
+                debug_logs.append(f"❌ 解析過程錯誤: {error}")
+
+    except Exception as e:
+        debug_logs.append(f"❌ 初始連線失敗: {format_error(describe_error(e))}")
+
+    save_name_memo()
+    result_list = [{'name': k, 'spt': v} for k, v in product_dict.items()]
+    return sorted(result_list, key=lambda x: x['name']), debug_logs
+
+
+# --- 上傳清單 (Upload Ingestion) ---
+# 整欄以 pandas 字串運算處理 (不逐列 iterrows)；CSV 分批讀取，只保留需要的欄位。
+# 結果與逐列處理相同：欄值的字串化依 iterrows 的規則 (全為數值欄時整列升為共同型別)。
+UPLOAD_CHUNK_ROWS = int(os.environ.get("SPT_UPLOAD_CHUNK_ROWS", "100000"))
+GENERIC_COMPOUND_RE = r'[a-z0-9\s\-\.]*'
+PRODUCT_COLUMN_NAMES = [
+    'product', 'api', 'name', 'drug', 'item', 'substance', '產品', '藥名', '品項'
+]
+
+
+def detect_upload_columns(columns):
+    # 回傳 (SPT 欄, 主產品欄, 副產品欄)；找不到主產品欄時為 None
+    spt_col = None
+    for col in columns:
+        if "spt" in str(col).lower():
+            spt_col = col
+            break
+
+    target_col = None
+    target_col_2 = None
+    for col in columns:
+        if any(p == str(col).lower() for p in PRODUCT_COLUMN_NAMES):
+            target_col = col
+            break
+    if not target_col:
+        for col in columns:
+            if any(p in str(col).lower() for p in PRODUCT_COLUMN_NAMES):
+                target_col = col
+                break
+
+    if target_col and "product" in str(target_col).lower():
+        for col in columns:
+            if str(col) != str(target_col) and "product" in str(
+                    col).lower() and ("1" in str(col) or "2" in str(col)):
+                target_col_2 = col
+                break
+    return spt_col, target_col, target_col_2
+
+
+def _upload_columns(columns):
+    spt_col, target_col, target_col_2 = detect_upload_columns(columns)
+    picked = [target_col or columns[0], target_col_2, spt_col]
+    return list(dict.fromkeys(c for c in picked if c is not None))
+
+
+def _numeric_row_dtype(dtypes, row_dtype=None):
+    # iterrows 以 df.values 取列：全為 int / float 欄時整列升為共同型別，否則為 object (None)
+    dtypes = list(dtypes)
+    if not all(isinstance(d, np.dtype) and d.kind in "iuf" for d in dtypes):
+        return None
+    if row_dtype is not None:
+        dtypes.append(row_dtype)
+    return np.result_type(*dtypes) if dtypes else None
+
+
+def _merge_dtype(dtype, other):
+    # 分批推斷的欄位型別合併為整個檔案一次讀取時的型別：各批相同時不變，
+    # 皆為數值時取共同型別，其餘 (含某批為文字) 為 object，保留原始字串
+    if dtype is None or dtype == other:
+        return other
+    if all(isinstance(d, np.dtype) and d.kind in "iuf" for d in (dtype, other)):
+        return np.result_type(dtype, other)
+    return np.dtype(object)
+
+
+def _read_upload_csv(uploaded_file, encoding):
+    # 分批讀取兩次：第一次只推斷各欄在整個檔案的型別 (不保留資料)，
+    # 第二次以固定型別讀取需要的欄位，結果不受分批位置影響；
+    # 回傳 (全部欄名, 資料, 整列共同型別)
+    uploaded_file.seek(0)
+    columns = list(pd.read_csv(uploaded_file, encoding=encoding, nrows=0).columns)
+    keep = _upload_columns(columns) if columns else []
+
+    uploaded_file.seek(0)
+    dtypes = dict.fromkeys(columns)
+    for chunk in pd.read_csv(uploaded_file,
+                             encoding=encoding,
+                             chunksize=UPLOAD_CHUNK_ROWS):
+        for col, dtype in chunk.dtypes.items():
+            dtypes[col] = _merge_dtype(dtypes[col], dtype)
+
+    uploaded_file.seek(0)
+    parts = [
+        chunk[keep] for chunk in pd.read_csv(
+            uploaded_file,
+            encoding=encoding,
+            usecols=keep,
+            dtype={c: dtypes[c]
+                   for c in keep if dtypes[c] is not None},
+            chunksize=UPLOAD_CHUNK_ROWS)
+    ]
+
+    df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(
+        columns=keep)
+    # 沒有資料列時型別未知 (None)，與讀出空表相同，逐欄處理
+    known = all(dtype is not None for dtype in dtypes.values())
+    row_dtype = _numeric_row_dtype(dtypes.values()) if known else None
+    return columns, df, row_dtype
+
+
+def _row_values(df, col, row_dtype):
+    # 與 iterrows 的 row[col] 相同的值 (object Series)
+    values = df[col]
+    if row_dtype is not None:
+        values = values.astype(row_dtype)
+    return pd.Series(values.to_numpy(dtype=object), dtype=object)
+
+
+def _text(values):
+    # str(值).strip()：缺值為 'nan'，與 str(NaN) 相同
+    return values.map(str).str.strip()
+
+
+def upload_products(df, target_col, target_col_2, spt_col, row_dtype=None):
+    # 整欄處理：合併主 / 副產品欄 -> 清理名稱 -> 排除泛稱 compound -> 依首次出現去重
+    # 回傳 DataFrame ['name', 'spt']
+    name = _text(_row_values(df, target_col, row_dtype))
+    if target_col_2:
+        raw_2 = _row_values(df, target_col_2, row_dtype)
+        val_2 = _text(raw_2)
+        use_2 = raw_2.notna() & (val_2 != '') & (val_2.str.lower() != 'nan')
+        name = name.where(~use_2, name + " " + val_2)
+
+    keep = (name.str.lower() != 'nan') & (name != '')
+    cleaned = clean_api_names(name[keep])
+
+    lower = cleaned.str.lower()
+    remain = lower.str.replace("compound", "", regex=False).str.strip()
+    generic = lower.str.contains("compound", regex=False) & remain.str.fullmatch(
+        GENERIC_COMPOUND_RE)
+    cleaned = cleaned[~generic & (cleaned.str.len() > 2)]
+
+    if spt_col:
+        raw_spt = _row_values(df, spt_col, row_dtype)[cleaned.index]
+        spt = _text(raw_spt).where(raw_spt.notna(), "N/A")
+    else:
+        spt = pd.Series("N/A", index=cleaned.index, dtype=object)
+
+    products = pd.DataFrame({'name': cleaned, 'spt': spt})
+    return products.drop_duplicates('name', keep='first')
+
+
+def parse_uploaded_file(uploaded_file):
+    product_dict = {}
+    logs = []
+
+    try:
+        if uploaded_file.name.endswith('.csv'):
+            try:
+                columns, df, row_dtype = _read_upload_csv(uploaded_file, None)
+            except:
+                columns, df, row_dtype = _read_upload_csv(
+                    uploaded_file, 'cp1252')
+        else:
+            df = pd.read_excel(uploaded_file)
+            columns = list(df.columns)
+            row_dtype = _numeric_row_dtype(df.dtypes)
+
+        count_metric("rows/upload", len(df))
+        logs.append(f"📄 讀取欄位: {columns}")
+
+        spt_col, target_col, target_col_2 = detect_upload_columns(columns)
+
+        if spt_col:
+            logs.append(f"✅ 找到 SPT 欄位: '{spt_col}'")
+        else:
+            logs.append("⚠️ 未找到含有 'SPT' 的欄位，將顯示為 N/A")
+
+        if not target_col:
+            target_col = columns[0]
+            logs.append(f"⚠️ 未找到明確的產品欄位，使用第一欄: '{target_col}'")
+        else:
+            logs.append(f"✅ 找到主產品欄位: '{target_col}'")
+            if target_col_2:
+                logs.append(f"✅ 找到副產品欄位 (將合併): '{target_col_2}'")
+
+        products = upload_products(df, target_col, target_col_2, spt_col,
+                                   row_dtype)
+        product_dict = dict(zip(products['name'], products['spt']))
+
+        logs.append(f"✅ 成功處理 {len(product_dict)} 筆產品資料。")
+
+    except Exception as e:
+        logs.append(f"❌ 檔案讀取失敗: {str(e)}")
+
+    save_name_memo()
+    result_list = [{'name': k, 'spt': v} for k, v in product_dict.items()]
+    return sorted(result_list, key=lambda x: x['name']), logs
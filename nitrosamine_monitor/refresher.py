@@ -0,0 +1,166 @@
+import os
+import threading
+import time
+
+from .fetch import run_fetch_jobs
+
+# ==========================================
+# 背景更新 (Background Refresher)
+# ==========================================
+# 由一個常駐執行緒依各來源的排程重新下載 + 解析，完成後整份替換 (atomic swap)；
+# 失敗或結果為空時保留上一份，並在 REFRESH_RETRY 秒後重試。
+# 使用者執行比對時直接取用目前的快照，不需等待網路 (僅冷啟動時等第一次載入)。
+# 快照由所有 session 共用，取用端不可修改其中的 DataFrame / list。
+
+REFRESH_ENABLED = os.environ.get("SPT_REFRESH", "1") != "0"
+# 更新週期 (秒)：與原本 st.cache_data 的 ttl 相同
+REFRESH_INTERVALS = {"ScinoPharm": 3600, "FDA": 86400, "EMA": 86400}
+REFRESH_RETRY = int(os.environ.get("SPT_REFRESH_RETRY", "300"))
+# 冷啟動時等待第一次載入的上限 (秒)
+REFRESH_WAIT = 180
+
+
+def start_refresher(fetchers, intervals=None, retry=None, initializer=None):
+    # fetchers: {來源名稱: 無參數函數}；回傳 refresher 狀態 (供 get_snapshot 等使用)
+    state = {
+        'fetchers': dict(fetchers),
+        'intervals': {
+            name: (intervals or REFRESH_INTERVALS).get(name, 3600)
+            for name in fetchers
+        },
+        'retry': REFRESH_RETRY if retry is None else retry,
+        'initializer': initializer,
+        'snapshots': {},
+        'status': {
+            name: {
+                'ok': None,
+                'fetched_at': None,
+                'attempted_at': None,
+                'elapsed': None,
+                'message': "",
+                'refreshes': 0,
+                'failures': 0
+            }
+            for name in fetchers
+        },
+        'due': {name: 0.0 for name in fetchers},
+        'ready': {name: threading.Event() for name in fetchers},
+        'wake': threading.Event(),
+        'stop': threading.Event()
+    }
+    state['thread'] = threading.Thread(target=_refresh_loop,
+                                       args=(state, ),
+                                       name="spt-refresher",
+                                       daemon=True)
+    state['thread'].start()
+    return state
+
+
+def stop_refresher(state, timeout=None):
+    state['stop'].set()
+    state['wake'].set()
+    state['thread'].join(timeout)
+
+
+def request_refresh(state, names=None):
+    # 手動觸發：指定來源立即排入下一輪更新
+    for name in names or state['fetchers']:
+        state['due'][name] = 0.0
+    state['wake'].set()
+
+
+def _usable(result):
+    # 各來源回傳 (資料, ..., logs)；資料為空視同失敗 (來源在錯誤時回傳空表)
+    return result is not None and len(result[0]) > 0
+
+
+def _refresh_once(state, names):
+    results, statuses = run_fetch_jobs(
+        {name: state['fetchers'][name]
+         for name in names},
+        initializer=state['initializer'])
+    now = time.time()
+    for name in names:
+        status = dict(state['status'][name])
+        status['attempted_at'] = now
+        status['elapsed'] = statuses[name]['elapsed']
+        if _usable(results[name]):
+            # 整份替換：讀取端拿到的一定是完整的舊快照或新快照
+            state['snapshots'][name] = results[name]
+            status.update(ok=True, fetched_at=now, message="")
+            status['refreshes'] += 1
+            state['due'][name] = time.monotonic() + state['intervals'][name]
+        else:
+            message = statuses[name]['message']
+            if not message and results[name] is not None:
+                message = "; ".join(str(m) for m in results[name][-1][-3:])
+            status.update(ok=False, message=message or "empty result")
+            status['failures'] += 1
+            state['due'][name] = time.monotonic() + state['retry']
+        state['status'][name] = status
+        state['ready'][name].set()
+
+
+def _refresh_loop(state):
+    while not state['stop'].is_set():
+        now = time.monotonic()
+        due = [name for name, at in state['due'].items() if at <= now]
+        if due:
+            try:
+                _refresh_once(state, due)
+            except Exception as e:
+                # 排程本身出錯也不能讓執行緒結束
+                for name in due:
+                    state['status'][name] = dict(state['status'][name],
+                                                 ok=False,
+                                                 message=str(e))
+                    state['due'][name] = time.monotonic() + state['retry']
+                    state['ready'][name].set()
+            continue
+
+        state['wake'].wait(max(0.0, min(state['due'].values()) - now))
+        state['wake'].clear()
+
+
+def get_snapshot(state, name, wait=REFRESH_WAIT):
+    # 回傳目前的快照；冷啟動尚未載入時等待第一次更新完成
+    if name not in state['snapshots']:
+        state['ready'][name].wait(wait)
+    snapshot = state['snapshots'].get(name)
+    if snapshot is None:
+        message = state['status'][name]['message'] or "尚未載入"
+        raise RuntimeError(f"{name} 背景更新尚無可用資料: {message}")
+    return snapshot
+
+
+def refresher_fetchers(state):
+    # 給 run_analysis / run_fetch_jobs 使用的 fetchers (直接取快照)
+    return {
+        name: (lambda name=name: get_snapshot(state, name))
+        for name in state['fetchers']
+    }
+
+
+def refresher_status(state):
+    # UI 表格用：每個來源一列
+    now = time.time()
+    rows = []
+    for name, status in state['status'].items():
+        next_in = max(0.0, state['due'][name] - time.monotonic())
+        rows.append({
+            'Source': name,
+            'Status': {
+                True: "✅",
+                False: "❌",
+                None: "⏳"
+            }[status['ok']],
+            'Age (min)': None if status['fetched_at'] is None else round(
+                (now - status['fetched_at']) / 60, 1),
+            'Next refresh (min)': round(next_in / 60, 1),
+            'Last fetch (s)': None if status['elapsed'] is None else round(
+                status['elapsed'], 1),
+            'Refreshes': status['refreshes'],
+            'Failures': status['failures'],
+            'Message': status['message']
+        })
+    return rows
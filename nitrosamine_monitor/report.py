@@ -0,0 +1,138 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from .matching import MATCH_CONSTANT_COLUMNS
+from .metrics import count_metric, stage
+
+REPORT_FILE_NAME = 'ScinoPharm_Nitrosamine_Analysis_v7.8.xlsx'
+REPORT_MIME = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+SUMMARY_COLUMNS = [
+    "Status", "Source", "ScinoPharm Product", "SPT Project num",
+    "Nitrosamine Impurity", "IUPAC Name", "Limit (AI)", "Notes",
+    "Updated date", "Reference Value", "Match Score"
+]
+
+
+# ==========================================
+# 結果彙整與歷史比對 (History Tracking)
+# ==========================================
+def build_summary(match_frames):
+    # match_frames: collect_*_matches 回傳的欄式結果 (可含快照差異的 Status)
+    frames = [f for f in match_frames if len(f)]
+    for col in MATCH_CONSTANT_COLUMNS:
+        # 各來源的 categorical 先統一類別，合併後仍為 categorical
+        categories = pd.api.types.union_categoricals(
+            [f[col] for f in frames]).categories
+        frames = [
+            f.assign(**{col: f[col].cat.set_categories(categories)})
+            for f in frames
+        ]
+    final_df = pd.concat(frames, ignore_index=True)
+    # 與由 dict list 建表相同的型別推斷 (逐欄；整塊 infer_objects 遇混合欄會整塊保留 object)
+    for col in final_df.columns[final_df.dtypes == object]:
+        final_df[col] = final_df[col].infer_objects()
+
+    # 以整數鍵 (第幾份結果, 列內容 x 產品代碼) 去重；Status 在同一份結果內相同
+    keys = pd.DataFrame({
+        'part': np.repeat(np.arange(len(frames)), [len(f) for f in frames]),
+        'key': final_df.pop('_key').to_numpy()
+    })
+    if 'Match Score' in final_df.columns:
+        # 模糊比對：內容相同只保留最高分 (同分取先出現者)
+        order = final_df['Match Score'].sort_values(ascending=False,
+                                                    kind='stable').index
+        duplicated = keys.loc[order].duplicated().to_numpy()
+        final_df = final_df.loc[np.sort(order[~duplicated])]
+    else:
+        final_df = final_df[~keys.duplicated().to_numpy()]
+    if 'Status' in final_df.columns:
+        # 快照差異模式已預先標記狀態
+        final_df['Status'] = final_df['Status'].fillna("")
+    else:
+        final_df['Status'] = ""  # 預設為空
+    return final_df
+
+
+def _fingerprints(key_part1, key_part2):
+    # 指紋 Key: 去除空白並轉大寫，整欄一次處理
+    part1 = key_part1.astype(object).map(str).str.strip().str.upper()
+    part2 = key_part2.astype(object).map(str).str.strip().str.upper()
+    return part1 + "|" + part2
+
+
+def load_history_fingerprints(history_file):
+    # 只讀 Summary_Match 分頁 (若無則讀第一頁) 中組成指紋所需的欄位
+    if hasattr(history_file, "read"):
+        history_file.seek(0)
+        data = history_file.read()
+    else:
+        with open(history_file, "rb") as f:
+            data = f.read()
+
+    xls = pd.ExcelFile(io.BytesIO(data))
+    sheet = 'Summary_Match' if 'Summary_Match' in xls.sheet_names else 0
+    columns = list(xls.parse(sheet, nrows=0).columns)
+
+    # 如果沒有 SPT 欄位，則改用第一欄 (產品名稱) + 雜質名稱
+    spt_col_name = next((c for c in columns if 'spt' in str(c).lower()),
+                        None)
+    nitro_col_name = next((c for c in columns if 'nitrosamine' in str(
+        c).lower() and 'impurity' in str(c).lower()), None)
+    if not nitro_col_name:
+        return set()
+
+    key_col_name = spt_col_name if spt_col_name else columns[0]
+    usecols = list(dict.fromkeys([key_col_name, nitro_col_name]))
+    old_df = xls.parse(sheet, usecols=usecols)
+
+    return set(_fingerprints(old_df[key_col_name], old_df[nitro_col_name]))
+
+
+def mark_new_records(final_df, history_files):
+    # 可同時比對多份歷史報表，任何一份出現過的資料即不視為新資料
+    if not isinstance(history_files, (list, tuple)):
+        history_files = [history_files]
+
+    old_fingerprints = set()
+    for history_file in history_files:
+        old_fingerprints |= load_history_fingerprints(history_file)
+    count_metric("history.fingerprints", len(old_fingerprints))
+
+    key_col = 'SPT Project num' if 'SPT Project num' in final_df.columns else 'ScinoPharm Product'
+    current = _fingerprints(final_df[key_col],
+                            final_df['Nitrosamine Impurity'])
+
+    is_new = ~current.isin(old_fingerprints)
+    final_df.loc[is_new, 'Status'] = "★ NEW"
+    return int(is_new.sum())
+
+
+def arrange_summary(final_df):
+    # 調整欄位順序 (Status 放最前)
+    cols_order = [c for c in SUMMARY_COLUMNS if c in final_df.columns]
+    final_df = final_df[cols_order]
+
+    # 根據 Status 排序，新發現的放前面
+    return final_df.sort_values(by=['Status', 'ScinoPharm Product'],
+                                ascending=[False, True])
+
+
+# ==========================================
+# 4. Excel 生成
+# ==========================================
+def generate_excel(match_df, fda_raw, ema_raw):
+    output = io.BytesIO()
+    with stage("export"):
+        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+            match_df.to_excel(writer, sheet_name='Summary_Match', index=False)
+            fda_raw.to_excel(writer, sheet_name='Raw_FDA_Data', index=False)
+            ema_raw.to_excel(writer, sheet_name='Raw_EMA_Data', index=False)
+
+            for sheet in writer.sheets.values():
+                sheet.set_column(0, 9, 20)
+
+    count_metric("export.bytes", output.tell())
+    return output.getvalue()
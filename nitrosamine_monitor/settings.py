@@ -0,0 +1,18 @@
+import os
+from urllib.parse import urlsplit
+
+# 所有磁碟快取的根目錄 (HTTP 回應、解析後表格等)
+CACHE_DIR = os.environ.get("SPT_CACHE_DIR",
+                           os.path.join(os.getcwd(), ".spt_cache"))
+
+# 來源網址覆寫 (本機替身伺服器 / 負載測試)：設定後
+# https://www.fda.gov/a/b 改連 {SPT_SOURCE_BASE_URL}/www.fda.gov/a/b
+SOURCE_BASE_URL = os.environ.get("SPT_SOURCE_BASE_URL", "").rstrip("/")
+
+
+def source_url(url):
+    if not SOURCE_BASE_URL or url.startswith(SOURCE_BASE_URL):
+        return url
+    parts = urlsplit(url)
+    query = f"?{parts.query}" if parts.query else ""
+    return f"{SOURCE_BASE_URL}/{parts.netloc}{parts.path}{query}"
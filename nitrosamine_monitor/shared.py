@@ -0,0 +1,112 @@
+import sys
+import threading
+import time
+
+import pandas as pd
+
+from .matching import build_row_index
+from .metrics import count_metric, stage
+
+# ==========================================
+# 共用快照 (Process-wide Shared Snapshot)
+# ==========================================
+# 解析後的 FDA / EMA 表格與表格端的比對前處理 (build_row_index) 每個行程只保留一份，
+# 所有 session 取用同一份參照；session 只保留自己的產品清單與比對結果。
+# 來源表格換了 (背景更新 / 快取過期後為不同物件) 才重建該來源的前處理。
+# 快照為唯讀：pandas 3 預設 Copy-on-Write，取用端修改表格只會複製自己的那一份。
+# requirements.txt 要求 pandas>=3；較舊版本 (2.x) 在此明確開啟 Copy-on-Write，
+# 否則 session 原地修改 (df.loc[...] = ...) 會改到所有 session 共用的表格。
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.options.mode.copy_on_write = True
+
+SHARED_SOURCES = {"FDA": 'fda_df', "EMA": 'ema_df'}
+
+
+def new_shared_cache():
+    # 行程內共用 (UI 以 st.cache_resource 保存)
+    return {'lock': threading.Lock(), 'snapshot': None, 'bytes': None}
+
+
+def share_snapshot(cache, data):
+    # data: fetch_regulatory_data 的結果；回傳加上 row_index 的快照 (只含參照)
+    with cache['lock']:
+        previous = cache['snapshot']
+        row_index = {}
+        rebuilt = False
+        for source, key in SHARED_SOURCES.items():
+            df = data[key]
+            if df.empty:
+                row_index[source] = None
+            elif previous is not None and previous[key] is df:
+                row_index[source] = previous['row_index'][source]
+                count_metric("shared.hits")
+            else:
+                with stage(f"row_index/{source}"):
+                    row_index[source] = build_row_index(df)
+                count_metric("shared.builds")
+                rebuilt = True
+
+        if not rebuilt and previous is not None and all(
+                previous[key] is data[key]
+                for key in SHARED_SOURCES.values()):
+            # 來源未變：沿用同一份快照，只更新本次的下載狀態
+            return dict(previous, fetch_status=data['fetch_status'])
+
+        snapshot = dict(data, row_index=row_index, built_at=time.time())
+        cache['snapshot'] = snapshot
+        cache['bytes'] = None
+        # 回傳淺複製：呼叫端可加入自己的結果欄位，不影響共用的 dict
+        return dict(snapshot)
+
+
+# ==========================================
+# 記憶體估計 (Memory Accounting)
+# ==========================================
+def object_bytes(obj, seen=None):
+    # 粗估物件 (含內含物件) 的記憶體；seen 中的物件視為已計算 (共用參照不重複計算)
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(
+            object_bytes(k, seen) + object_bytes(v, seen)
+            for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(object_bytes(v, seen) for v in obj)
+    return sys.getsizeof(obj)
+
+
+def _shared_ids(obj, seen):
+    # 只收集共用物件的 id (不量測內容)，供 session 計算時排除
+    if id(obj) in seen:
+        return
+    seen.add(id(obj))
+    if isinstance(obj, dict):
+        for v in obj.values():
+            _shared_ids(v, seen)
+    elif isinstance(obj, (list, tuple)):
+        for v in obj:
+            _shared_ids(v, seen)
+
+
+def shared_bytes(cache):
+    # 共用快照的大小 (快照重建後才重新計算)
+    with cache['lock']:
+        if cache['bytes'] is None and cache['snapshot'] is not None:
+            cache['bytes'] = object_bytes(cache['snapshot'])
+        return cache['bytes'] or 0
+
+
+def session_bytes(objects, shared=()):
+    # objects: session 自己持有的物件；shared: 共用物件 (引用到的部分不計入)
+    seen = set()
+    for obj in shared:
+        if obj is not None:
+            _shared_ids(obj, seen)
+    return object_bytes(objects, seen)
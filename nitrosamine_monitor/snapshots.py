@@ -0,0 +1,266 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+import pandas as pd
+
+from .matching import get_display_col
+from .settings import CACHE_DIR
+
+# 每次抓取的 FDA / EMA 表格快照 (含逐列 hash)，用於計算與上次執行所見表格的差異
+SNAPSHOT_DB = os.environ.get("SPT_SNAPSHOT_DB",
+                             os.path.join(CACHE_DIR, "snapshots.sqlite"))
+SNAPSHOTS_ENABLED = os.environ.get("SPT_SNAPSHOTS", "1") != "0"
+SNAPSHOT_KEEP = int(os.environ.get("SPT_SNAPSHOT_KEEP", "30"))
+
+# 列識別欄位 (雜質名稱)，同名列以出現順序區分
+KEY_COLUMNS = {
+    "FDA": ['Nitrosamine', 'nitrosamine', 'impurity'],
+    "EMA": ['name', 'nitrosamine', 'impurity']
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    source_date TEXT,
+    row_count INTEGER NOT NULL,
+    table_hash TEXT NOT NULL,
+    columns TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshot_rows (
+    snapshot_id INTEGER NOT NULL,
+    row_pos INTEGER NOT NULL,
+    row_key TEXT NOT NULL,
+    row_hash TEXT NOT NULL,
+    row_data TEXT NOT NULL,
+    PRIMARY KEY (snapshot_id, row_pos)
+);
+CREATE INDEX IF NOT EXISTS idx_snapshots_source ON snapshots (source, id);
+"""
+
+
+def _connect():
+    os.makedirs(os.path.dirname(SNAPSHOT_DB) or ".", exist_ok=True)
+    conn = sqlite3.connect(SNAPSHOT_DB, timeout=30)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def normalize_rows(df):
+    # 每格轉為去空白字串 (缺值為空字串)，整欄一次處理；欄位以位置編號 (表頭可能重複)
+    normalized = {}
+    for j in range(df.shape[1]):
+        values = df.iloc[:, j].astype(object)
+        normalized[j] = values.where(values.notna(), "").map(str).str.strip()
+    return pd.DataFrame(normalized, index=range(len(df)),
+                        columns=range(df.shape[1]))
+
+
+def row_hashes(normalized, columns):
+    hashes = []
+    for values in normalized.itertuples(index=False, name=None):
+        payload = "\x1f".join(f"{c}={v}" for c, v in zip(columns, values)
+                              if v)
+        hashes.append(hashlib.sha1(payload.encode("utf-8")).hexdigest())
+    return hashes
+
+
+def row_keys(source, names, normalized, hashes):
+    # 以 str() 後的欄名找識別欄 (表頭可能是數字)
+    key_col = get_display_col(names, KEY_COLUMNS.get(source, []))
+    if key_col is None:
+        return hashes
+
+    base = normalized[names.index(key_col)].str.upper()
+    ordinal = base.groupby(base).cumcount()
+    return [f"{k}#{n}" for k, n in zip(base, ordinal)]
+
+
+def _latest_snapshots(conn, source, limit=1):
+    return conn.execute(
+        "SELECT id, fetched_at, table_hash, source_date FROM snapshots "
+        "WHERE source = ? ORDER BY id DESC LIMIT ?",
+        (source, limit)).fetchall()
+
+
+def _columns(conn, snapshot_id):
+    row = conn.execute("SELECT columns FROM snapshots WHERE id = ?",
+                       (snapshot_id, )).fetchone()
+    return None if row is None else json.loads(row[0])
+
+
+def _row_values(data, names):
+    # 每列以欄位順序的 JSON list 儲存 (欄名可能重複或 str() 後相同)；
+    # 舊版以 {欄名: 值} 儲存的列依欄名取值
+    values = json.loads(data)
+    if isinstance(values, dict):
+        return [values.get(name, "") for name in names]
+    return values
+
+
+def _load_rows(conn, snapshot_id):
+    return {
+        key: (pos, row_hash, data)
+        for pos, key, row_hash, data in conn.execute(
+            "SELECT row_pos, row_key, row_hash, row_data FROM snapshot_rows "
+            "WHERE snapshot_id = ?", (snapshot_id, ))
+    }
+
+
+def diff_snapshots(conn, old_id, new_id):
+    new_rows = _load_rows(conn, new_id)
+    old_rows = _load_rows(conn, old_id) if old_id is not None else {}
+    old_names = _columns(conn, old_id) if old_rows else []
+
+    added = sorted(pos for key, (pos, _, _) in new_rows.items()
+                   if key not in old_rows)
+    changed = sorted(pos for key, (pos, row_hash, _) in new_rows.items()
+                     if key in old_rows and old_rows[key][1] != row_hash)
+    removed = [
+        _row_values(data, old_names)
+        for key, (_, _, data) in sorted(old_rows.items(),
+                                        key=lambda x: x[1][0])
+        if key not in new_rows
+    ]
+    return added, changed, removed
+
+
+def _prune(conn, source):
+    stale = [
+        row[0] for row in conn.execute(
+            "SELECT id FROM snapshots WHERE source = ? ORDER BY id DESC "
+            "LIMIT -1 OFFSET ?", (source, SNAPSHOT_KEEP))
+    ]
+    for snapshot_id in stale:
+        conn.execute("DELETE FROM snapshot_rows WHERE snapshot_id = ?",
+                     (snapshot_id, ))
+        conn.execute("DELETE FROM snapshots WHERE id = ?", (snapshot_id, ))
+
+
+def update_snapshot(source, df, source_date=None):
+    # 內容與最新快照 (上次執行所見) 不同時新增一筆快照，回傳兩者的逐列差異；
+    # 內容未變時 unchanged 為 True、差異為空 (上次執行已標記過這些列)
+    names = [str(c) for c in df.columns]
+    normalized = normalize_rows(df)
+    hashes = row_hashes(normalized, names)
+    keys = row_keys(source, names, normalized, hashes)
+    columns = json.dumps(names, ensure_ascii=False)
+    table_hash = hashlib.sha256(
+        (columns + "".join(hashes)).encode("utf-8")).hexdigest()
+
+    with closing(_connect()) as conn, conn:
+        latest = _latest_snapshots(conn, source)
+
+        unchanged = bool(latest) and latest[0][2] == table_hash
+        if unchanged:
+            snapshot_id = latest[0][0]
+            fetched_at = latest[0][1]
+            previous = latest[0]
+        else:
+            fetched_at = time.time()
+            cur = conn.execute(
+                "INSERT INTO snapshots (source, fetched_at, source_date, "
+                "row_count, table_hash, columns) VALUES (?, ?, ?, ?, ?, ?)",
+                (source, fetched_at, source_date, len(df), table_hash,
+                 columns))
+            snapshot_id = cur.lastrowid
+            conn.executemany(
+                "INSERT INTO snapshot_rows (snapshot_id, row_pos, row_key, "
+                "row_hash, row_data) VALUES (?, ?, ?, ?, ?)",
+                [(snapshot_id, pos, key, row_hash,
+                  json.dumps(list(values), ensure_ascii=False))
+                 for pos, (key, row_hash, values) in enumerate(
+                     zip(keys, hashes,
+                         normalized.itertuples(index=False, name=None)))])
+            previous = latest[0] if latest else None
+            _prune(conn, source)
+
+        if unchanged:
+            added, changed, removed = [], [], []
+        else:
+            added, changed, removed = diff_snapshots(
+                conn, previous[0] if previous else None, snapshot_id)
+
+    return {
+        'source': source,
+        'snapshot_id': snapshot_id,
+        'fetched_at': fetched_at,
+        'unchanged': unchanged,
+        'previous_id': previous[0] if previous else None,
+        'previous_fetched_at': previous[1] if previous else None,
+        'previous_source_date': previous[3] if previous else None,
+        'added': added,
+        'changed': changed,
+        'removed': removed
+    }
+
+
+def _format_time(ts):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts))
+
+
+def delta_basis(delta):
+    # 差異的比較基準：「#舊 -> #新」，來源內容未變時註明與上次執行相同、無差異
+    if delta['unchanged']:
+        return (f"#{delta['snapshot_id']} 未變 (來源自 "
+                f"{_format_time(delta['fetched_at'])} 起未更新，無新增或變動)")
+    if delta['previous_id'] is None:
+        return f"首次快照 #{delta['snapshot_id']}"
+    since = _format_time(delta['previous_fetched_at'])
+    return (f"#{delta['previous_id']} ({since}, "
+            f"{delta['previous_source_date'] or 'N/A'}) -> "
+            f"#{delta['snapshot_id']}")
+
+
+def snapshot_refs(deltas, fallbacks=None):
+    # 報表只引用快照時使用：每個來源的快照編號、列數、抓取時間與差異基準
+    # fallbacks: {來源: 原因}，要求只比對差異但沒有快照、改為完整比對的來源
+    refs = []
+    if deltas:
+        with closing(_connect()) as conn:
+            for source, delta in deltas.items():
+                row = conn.execute(
+                    "SELECT row_count, source_date, fetched_at FROM snapshots "
+                    "WHERE id = ?", (delta['snapshot_id'], )).fetchone()
+                if row is None:
+                    continue
+                refs.append({
+                    'Source': source,
+                    'Snapshot ID': delta['snapshot_id'],
+                    'Rows': row[0],
+                    'Source date': row[1],
+                    'Fetched at': _format_time(row[2]),
+                    'Delta': delta_basis(delta),
+                    'Snapshot DB': os.path.abspath(SNAPSHOT_DB)
+                })
+    for source, reason in (fallbacks or {}).items():
+        refs.append({
+            'Source': source,
+            'Delta': f"{reason}，改為完整比對 (未標記 ★ NEW / ★ CHANGED)"
+        })
+    return refs
+
+
+def load_snapshot(snapshot_id):
+    # 由快照還原原始表格 (儲存時已正規化為字串)
+    with closing(_connect()) as conn:
+        names = _columns(conn, snapshot_id)
+        if names is None:
+            return pd.DataFrame()
+        records = [
+            _row_values(data, names) for (data, ) in conn.execute(
+                "SELECT row_data FROM snapshot_rows WHERE snapshot_id = ? "
+                "ORDER BY row_pos", (snapshot_id, ))
+        ]
+    return pd.DataFrame(records, columns=names)
+
+
+def format_delta(delta):
+    return (f"📦 {delta['source']} 快照 {delta_basis(delta)}: "
+            f"新增 {len(delta['added'])}, 變動 {len(delta['changed'])}, "
+            f"移除 {len(delta['removed'])}")
@@ -0,0 +1,485 @@
+import io
+import json
+import re
+
+import numpy as np
+import pandas as pd
+import requests
+
+from .http_cache import cached_get
+from .metrics import count_metric, stage
+from .settings import source_url
+from .table_cache import load_cached_table, store_cached_table
+
+FDA_URL = "https://www.fda.gov/regulatory-information/search-fda-guidance-documents/cder-nitrosamine-impurity-acceptable-intake-limits"
+EMA_BASE_URL = "https://www.ema.europa.eu"
+EMA_PAGE_URL = "https://www.ema.europa.eu/en/human-regulatory-overview/post-authorisation/pharmacovigilance-post-authorisation/referral-procedures-human-medicines/nitrosamine-impurities/nitrosamine-impurities-guidance-marketing-authorisation-holders"
+
+# ==========================================
+# 2. 爬蟲函數: USFDA & EMA
+# ==========================================
+_HIDDEN_TEXT_TAGS = ("script", "style", "template", "rt", "rp")
+
+
+def _text_nodes_xpath():
+    # 與 BeautifulSoup get_text 相同的文字來源：略過 script/style/template/rt/rp 內容與註解
+    from lxml import etree
+
+    hidden = " or ".join(f"ancestor::{tag}" for tag in _HIDDEN_TEXT_TAGS)
+    return etree.XPath(f".//text()[not({hidden})]")
+
+
+def _stripped_text(text_nodes, el, separator=""):
+    # 等同 el.get_text(separator, strip=True)
+    return separator.join(
+        [t.strip() for t in text_nodes(el) if t.strip()])
+
+
+# 內嵌資料的起點：data: [ / "data": [ (不含 metadata: 等其他名稱)
+JSON_ANCHOR_RE = re.compile(r"""(?<![\w$])["']?data["']?\s*:\s*(?=\[)""")
+
+
+def find_json_blocks(raw_html):
+    # 從每個 data: 錨點只解碼一個 JSON 陣列 (raw_decode)，解出的區塊不再重複掃描
+    decoder = json.JSONDecoder()
+    blocks = []
+    skipped = []
+    pos = 0
+    while True:
+        m = JSON_ANCHOR_RE.search(raw_html, pos)
+        if not m:
+            break
+        try:
+            json_data, end = decoder.raw_decode(raw_html, m.end())
+        except ValueError as e:
+            skipped.append((m.start(), f"not JSON ({e.msg})"))
+            pos = m.end()
+            continue
+        if json_data and all(isinstance(item, dict) for item in json_data):
+            blocks.append((m.end(), end, json_data))
+        else:
+            skipped.append((m.start(), "not a list of records"))
+        pos = end
+    return blocks, skipped
+
+
+def _first_descendant(el, tag):
+    return next(el.iterdescendants(tag), None)
+
+
+def parse_fda_tables(root, text_nodes, logs):
+    # 單次解析樹上直接取出各表格的欄位陣列 (表頭去重、首列表頭、補齊/截斷列)
+    tables = []
+    for i, table in enumerate(root.iter("table")):
+        try:
+            headers_list = []
+            thead = _first_descendant(table, "thead")
+            if thead is not None:
+                headers_list = [
+                    _stripped_text(text_nodes, th)
+                    for th in thead.iterdescendants("th")
+                ]
+
+            if not headers_list:
+                first_row = _first_descendant(table, "tr")
+                if first_row is not None:
+                    headers_list = [
+                        _stripped_text(text_nodes, td)
+                        for td in first_row.iterdescendants("td", "th")
+                    ]
+
+            if headers_list:
+                headers_list = [
+                    h if h else f"Unnamed_{j}"
+                    for j, h in enumerate(headers_list)
+                ]
+                seen = set()
+                new_headers = []
+                for h in headers_list:
+                    c = h
+                    count = 1
+                    while c in seen:
+                        c = f"{h}_{count}"
+                        count += 1
+                    seen.add(c)
+                    new_headers.append(c)
+                headers_list = new_headers
+
+            tbody = _first_descendant(table, "tbody")
+            data_rows = (tbody if tbody is not None else
+                         table).iterdescendants("tr")
+            if thead is None:
+                next(data_rows, None)
+
+            max_len = len(headers_list)
+            columns = [[] for _ in headers_list]
+            row_count = 0
+            for row in data_rows:
+                cols = list(row.iterdescendants("td"))
+                if not cols:
+                    continue
+                row_count += 1
+                for j, column in enumerate(columns):
+                    column.append(
+                        _stripped_text(text_nodes, cols[j]
+                                       ) if j < len(cols) else None)
+
+            if headers_list and row_count:
+                df = pd.DataFrame(dict(zip(headers_list, columns)))
+                tables.append(df)
+                count_metric(f"rows/FDA/table_{i}", len(df))
+                logs.append(
+                    f"HTML Table {i} parsed successfully with {len(df)} rows."
+                )
+        except Exception as e:
+            logs.append(f"Manual parse failed for table {i}: {e}")
+    return tables
+
+
+def parse_fda_page(raw_html):
+    from lxml import etree
+
+    logs = []
+    found_date = "N/A"
+
+    # 整頁只解析一次 (lxml)，日期文字與表格共用同一棵樹
+    root = etree.HTML(raw_html.encode("utf-8"),
+                      etree.HTMLParser(encoding="utf-8"))
+    text_nodes = _text_nodes_xpath()
+    text_content = _stripped_text(text_nodes, root,
+                                  " ") if root is not None else ""
+
+    # 嘗試抓取 "Content current as of:"
+    date_match = re.search(r"Content current as of:.*?([\d]{2}/[\d]{2}/[\d]{4})", text_content, re.IGNORECASE)
+    if date_match:
+        found_date = date_match.group(1).strip()
+        logs.append(f"📅 FDA Updated Date Found: {found_date}")
+    else:
+        logs.append("⚠️ FDA Updated Date not found.")
+
+    all_tables_data = []
+
+    blocks, skipped = find_json_blocks(raw_html)
+    if blocks or skipped:
+        logs.append(
+            f"Strategy 1 (JSON Scan): Found {len(blocks)} JSON data blocks "
+            f"({len(skipped)} other 'data:' anchors skipped).")
+    for i, (start, end, json_data) in enumerate(blocks):
+        df = pd.DataFrame(json_data)
+        df = df.reset_index(drop=True)
+        all_tables_data.append(df)
+        count_metric(f"rows/FDA/json_block_{i}", len(df))
+        logs.append(
+            f"JSON Block {i} parsed: {len(df)} rows (chars {start}-{end}).")
+    for pos, reason in skipped:
+        logs.append(f"JSON anchor at char {pos} skipped: {reason}")
+
+    if root is not None:
+        all_tables_data += parse_fda_tables(root, text_nodes, logs)
+
+    valid_dfs = []
+    for df in all_tables_data:
+        df.columns = [
+            str(c).strip().replace('\n', ' ') for c in df.columns
+        ]
+
+        rename_map = {}
+        has_critical_data = False
+
+        for col in df.columns:
+            c_lower = col.lower()
+            if any(k in c_lower for k in ['nitrosamine', 'impurity']):
+                rename_map[col] = 'Nitrosamine'
+                has_critical_data = True
+            elif any(k in c_lower for k in ['limit', 'ai', 'intake']):
+                rename_map[col] = 'Limit'
+            elif any(k in c_lower for k in ['note', 'comment', 'remark']):
+                rename_map[col] = 'Notes'
+            elif any(k in c_lower
+                     for k in ['source', 'drug', 'product', 'api']):
+                rename_map[col] = 'Source'
+            elif any(k in c_lower for k in ['iupac', 'chemical']):
+                rename_map[col] = 'IUPAC'
+
+        if has_critical_data:
+            df = df.rename(columns=rename_map)
+            for req_col in [
+                    'Nitrosamine', 'Limit', 'Source', 'Notes', 'IUPAC'
+            ]:
+                if req_col not in df.columns:
+                    df[req_col] = pd.NA
+
+            df = df.reset_index(drop=True)
+            valid_dfs.append(df)
+
+    if valid_dfs:
+        target_dfs = valid_dfs[:2]
+        final_df = pd.concat(target_dfs, ignore_index=True)
+        final_df = final_df.reset_index(drop=True)
+        final_df = final_df.reset_index(drop=True)
+        return final_df, found_date, logs
+
+    return pd.DataFrame(), found_date, logs
+
+
+def get_fda_data():
+    url = FDA_URL
+
+    headers = {
+        "User-Agent":
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
+        "Accept":
+        "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8"
+    }
+
+    logs = []
+
+    try:
+        r = cached_get(source_url(url), headers=headers, timeout=30)
+        raw_html = r['text']
+        if r['from_cache']:
+            logs.append("♻️ FDA page not modified (304), using disk cache.")
+
+        cached = load_cached_table("fda", r['content'])
+        if cached is not None:
+            final_df, meta = cached
+            count_metric("rows/FDA", len(final_df))
+            logs.append("⚡ FDA tables unchanged, loaded from parsed-table cache.")
+            return final_df, meta['date'], logs + meta['logs']
+
+        with stage("parse/FDA"):
+            final_df, found_date, parse_logs = parse_fda_page(raw_html)
+        count_metric("rows/FDA", len(final_df))
+        store_cached_table("fda", r['content'], final_df, {
+            'date': found_date,
+            'logs': parse_logs
+        })
+        return final_df, found_date, logs + parse_logs
+
+    except requests.exceptions.RequestException:
+        # 網路錯誤交由 run_fetch_jobs 轉為結構化狀態 (kind / url / status_code)
+        raise
+    except Exception as e:
+        return pd.DataFrame(), "N/A", [f"General Error: {e}"]
+
+
+EMA_HEADER_KEYWORDS = [
+    "nitrosamine", "limit", "intake", "substance", "ng/day", "iupac",
+    "impurity", "structure", "cas", "source", "ai (ng/day)"
+]
+EMA_HEADER_SCAN_ROWS = 30
+EMA_SMALL_SHEET_ROWS = 5
+
+
+def _excel_cell_value(cell):
+    # 與 pandas openpyxl reader 相同的轉換：空白 -> ""、錯誤 -> NaN、整數值浮點 -> int
+    from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+
+    if cell.value is None:
+        return ""
+    if cell.data_type == TYPE_ERROR:
+        return np.nan
+    if cell.data_type == TYPE_NUMERIC:
+        val = int(cell.value)
+        if val == cell.value:
+            return val
+        return float(cell.value)
+    return cell.value
+
+
+def _sheet_rows(ws):
+    # 逐列串流 (read-only)，去掉每列尾端的空白儲存格
+    ws.reset_dimensions()
+    for row in ws.rows:
+        values = [_excel_cell_value(cell) for cell in row]
+        while values and values[-1] == "":
+            values.pop()
+        yield values
+
+
+def _header_score(values):
+    # read_excel 會把 "" 與 "N/A" 等字串轉成缺值，這些不列入表頭文字
+    from pandas._libs.parsers import STR_NA_VALUES
+
+    row_text = " ".join([
+        str(x).lower() for x in values
+        if not (isinstance(x, str) and x in STR_NA_VALUES) and pd.notna(x)
+    ])
+    return sum(1 for k in EMA_HEADER_KEYWORDS if k in row_text)
+
+
+def _rows_to_frame(rows):
+    # 補齊欄寬後交給 read_excel 相同的 TextParser，欄位型別推斷與原本一致
+    from pandas.io.parsers import TextParser
+
+    width = max(len(row) for row in rows)
+    for row in rows:
+        if len(row) < width:
+            row.extend([""] * (width - len(row)))
+    return TextParser(rows, header=None, skip_blank_lines=False).read()
+
+
+def parse_ema_workbook(xlsx_bytes):
+    # 逐分頁串流讀取：先看前 30 列找表頭，小且無關的分頁不整頁載入
+    import openpyxl
+
+    logs = []
+    all_sheets_data = []
+
+    wb = openpyxl.load_workbook(io.BytesIO(xlsx_bytes),
+                                read_only=True,
+                                data_only=True,
+                                keep_links=False)
+    try:
+        for ws in wb.worksheets:
+            sheet_name = ws.title
+            logs.append(f"Analyzing EMA Sheet: {sheet_name}")
+
+            rows_iter = _sheet_rows(ws)
+            rows = []
+            last_with_data = -1
+            best_idx = 0
+            max_score = 0
+
+            for values in rows_iter:
+                rows.append(values)
+                if values:
+                    last_with_data = len(rows) - 1
+                score = _header_score(values)
+                if score > max_score:
+                    max_score = score
+                    best_idx = len(rows) - 1
+                if len(rows) >= EMA_HEADER_SCAN_ROWS:
+                    break
+
+            if max_score == 0:
+                # 沒有表頭關鍵字時，只需確認是否至少有 5 列資料
+                while last_with_data < EMA_SMALL_SHEET_ROWS - 1:
+                    values = next(rows_iter, None)
+                    if values is None:
+                        break
+                    rows.append(values)
+                    if values:
+                        last_with_data = len(rows) - 1
+                if last_with_data < EMA_SMALL_SHEET_ROWS - 1:
+                    logs.append(
+                        f"  -> Skipping small/irrelevant sheet: {sheet_name}")
+                    continue
+
+            for values in rows_iter:
+                rows.append(values)
+                if values:
+                    last_with_data = len(rows) - 1
+            del rows[last_with_data + 1:]
+
+            temp_df = _rows_to_frame(rows)
+            del rows
+
+            new_header = temp_df.iloc[best_idx]
+            df = temp_df.iloc[best_idx + 1:].copy()
+            df.columns = new_header
+            df.columns = [
+                str(c).strip().replace('\n', ' ') for c in df.columns
+            ]
+
+            df = df.reset_index(drop=True)
+            all_sheets_data.append(df)
+            count_metric(f"rows/EMA/{sheet_name}", len(df))
+            logs.append(
+                f"  -> Added table from {sheet_name} with {len(df)} rows.")
+    finally:
+        wb.close()
+
+    if all_sheets_data:
+        final_df = pd.concat(all_sheets_data, ignore_index=True)
+        final_df = final_df.reset_index(drop=True)
+        return final_df, logs
+
+    return pd.DataFrame(), logs
+
+
+def get_ema_data():
+    base_url = EMA_BASE_URL
+    page_url = EMA_PAGE_URL
+
+    log_messages = []
+    found_date = "N/A"
+
+    try:
+        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
+        from bs4 import BeautifulSoup
+
+        r = cached_get(source_url(page_url),
+                       headers=headers,
+                       timeout=30,
+                       raise_for_status=False)
+        soup = BeautifulSoup(r['text'], 'html.parser')
+
+        # 嘗試抓取 EMA 日期
+        # 常見格式: "First published: 21/09/2020", "Last updated: 23/10/2023"
+        # 優先找 "Last updated" 所在的元素，找不到時搜尋整頁文字
+        last_updated_node = soup.find(
+            string=re.compile(r"Last updated", re.IGNORECASE))
+        if last_updated_node:
+            parent_text = last_updated_node.parent.get_text(strip=True)
+            m = re.search(r"(\d{2}/\d{2}/\d{4})", parent_text)
+            if m:
+                found_date = m.group(1)
+
+        if found_date == "N/A":
+            text_content = soup.get_text(" ", strip=True)
+            m = re.search(
+                r"(?:Last updated|First published).*?(\d{2}/\d{2}/\d{4})",
+                text_content, re.IGNORECASE)
+            if m:
+                found_date = m.group(1)
+
+        if found_date != "N/A":
+            log_messages.append(f"📅 EMA Date Found: {found_date}")
+        else:
+            log_messages.append("⚠️ EMA Date not found.")
+
+        target_link = None
+        for a in soup.find_all('a', href=True):
+            href = a['href']
+            text = a.get_text(strip=True).lower()
+            if "xlsx" in href and ("appendix" in text or "limit" in text):
+                target_link = href
+                break
+
+        if not target_link:
+            for a in soup.find_all('a', href=True):
+                if "xlsx" in a['href']:
+                    target_link = a['href']
+                    break
+
+        if target_link:
+            if not target_link.startswith("http"):
+                target_link = base_url + target_link
+            target_link = source_url(target_link)
+
+            file_resp = cached_get(target_link, headers=headers, timeout=60)
+            if file_resp['from_cache']:
+                log_messages.append(
+                    "♻️ EMA workbook not modified (304), using disk cache.")
+
+            cached = load_cached_table("ema", file_resp['content'])
+            if cached is not None:
+                final_df, meta = cached
+                count_metric("rows/EMA", len(final_df))
+                log_messages.append(
+                    "⚡ EMA workbook unchanged, loaded from parsed-table cache.")
+                return final_df, found_date, log_messages + meta['logs']
+
+            with stage("parse/EMA"):
+                final_df, sheet_logs = parse_ema_workbook(file_resp['content'])
+            count_metric("rows/EMA", len(final_df))
+            store_cached_table("ema", file_resp['content'], final_df,
+                               {'logs': sheet_logs})
+            return final_df, found_date, log_messages + sheet_logs
+
+        return pd.DataFrame(), found_date, ["No link found"]
+    except requests.exceptions.RequestException:
+        raise
+    except Exception as e:
+        return pd.DataFrame(), "N/A", [f"General Error: {e}"]
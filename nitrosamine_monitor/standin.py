@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from . import synthetic
+from .http_cache import HTTP_CACHE_DIR
+from .products import SCINOPHARM_PRODUCTS_URL
+from .sources import EMA_PAGE_URL, FDA_URL
+
+# ==========================================
+# 本機替身伺服器 (Stand-in Source Server)
+# ==========================================
+# 以合成資料 (或先前實際抓取後存在 HTTP 磁碟快取中的回應) 模擬
+# fda.gov / ema.europa.eu / scinopharm.com，供負載測試與離線開發使用。
+# 路徑為 /{host}{path}，搭配 SPT_SOURCE_BASE_URL=http://127.0.0.1:PORT 使用。
+#
+# 故障注入 (faults)：
+#   latency    每個回應固定延遲 (秒)
+#   jitter     額外隨機延遲 0 ~ jitter (秒)
+#   error_rate 回傳 503 的機率
+#   reset_rate 不回應直接中斷連線的機率
+#   stall_rate 延遲 stall 秒才回應的機率 (測試 read timeout)
+
+STANDIN_FAULTS = {
+    'latency': 0.0,
+    'jitter': 0.0,
+    'error_rate': 0.0,
+    'reset_rate': 0.0,
+    'stall_rate': 0.0,
+    'stall': 30.0
+}
+
+_CONTENT_TYPES = {
+    ".xlsx":
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".pdf": "application/pdf"
+}
+
+
+def site_path(url):
+    parts = urlsplit(url)
+    return f"/{parts.netloc}{parts.path}"
+
+
+def _content_type(path, body):
+    for ext, content_type in _CONTENT_TYPES.items():
+        if path.endswith(ext):
+            return content_type
+    if body.startswith(b"%PDF-"):
+        return "application/pdf"
+    if body.startswith(b"PK"):
+        return _CONTENT_TYPES[".xlsx"]
+    return "text/html; charset=utf-8"
+
+
+def synthetic_site(size=300, seed=0):
+    # {路徑: 內容}；法規表格中的藥名一半來自產品清單 (與 benchmark 相同)
+    names = synthetic.product_names(size, seed)
+    drugs = names[:max(1, size // 2)] + synthetic.product_names(
+        max(1, size // 2), seed + 1)
+    xlsx_path = ("/documents/other/appendix-1-acceptable-intakes-"
+                 "established-n-nitrosamines_en.xlsx")
+    ema_host = f"/{urlsplit(EMA_PAGE_URL).netloc}"
+    scino_host = f"/{urlsplit(SCINOPHARM_PRODUCTS_URL).netloc}"
+    pdf_paths = ["/tw/download/43/", "/tw/download/44/"]
+    pdf_names = [names[:len(names) // 2], names[len(names) // 2:]]
+
+    site = {
+        site_path(FDA_URL):
+        synthetic.make_fda_page(drugs, rows=size, seed=seed).encode("utf-8"),
+        site_path(EMA_PAGE_URL):
+        synthetic.make_ema_page(xlsx_path).encode("utf-8"),
+        ema_host + xlsx_path:
+        synthetic.make_ema_workbook(drugs, rows=size, seed=seed),
+        site_path(SCINOPHARM_PRODUCTS_URL):
+        synthetic.make_product_page(pdf_paths).encode("utf-8")
+    }
+    for path, pdf_names_part in zip(pdf_paths, pdf_names):
+        site[scino_host + path] = synthetic.make_product_pdf(pdf_names_part,
+                                                             seed=seed)
+    return site, names
+
+
+def recorded_site(cache_dir=None):
+    # 由 HTTP 磁碟快取 (實際抓取過的回應) 建立站台內容
+    cache_dir = cache_dir or HTTP_CACHE_DIR
+    site = {}
+    for name in sorted(os.listdir(cache_dir)):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(cache_dir, name), "r",
+                      encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(os.path.join(cache_dir, name[:-len(".json")] + ".body"),
+                      "rb") as f:
+                site[site_path(meta['url'])] = f.read()
+        except (OSError, ValueError, KeyError):
+            continue
+    return site
+
+
+def _make_handler(site, faults, stats):
+    etags = {
+        path: '"%s"' % hashlib.sha256(body).hexdigest()[:16]
+        for path, body in site.items()
+    }
+
+    class StandInHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            path = urlsplit(self.path).path
+            rng = random.random
+            with stats['lock']:
+                stats['requests'] += 1
+
+            delay = faults['latency'] + rng() * faults['jitter']
+            if rng() < faults['stall_rate']:
+                delay += faults['stall']
+            if delay:
+                time.sleep(delay)
+
+            if rng() < faults['reset_rate']:
+                with stats['lock']:
+                    stats['resets'] += 1
+                self.close_connection = True
+                try:
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                return
+
+            if rng() < faults['error_rate']:
+                with stats['lock']:
+                    stats['errors'] += 1
+                return self._send(503, b"Service Unavailable (injected)",
+                                  "text/plain")
+
+            body = site.get(path)
+            if body is None:
+                return self._send(404, b"Not Found", "text/plain")
+
+            etag = etags[path]
+            if self.headers.get("If-None-Match") == etag:
+                with stats['lock']:
+                    stats['not_modified'] += 1
+                return self._send(304, b"", None, etag)
+
+            with stats['lock']:
+                stats['bytes'] += len(body)
+            self._send(200, body, _content_type(path, body), etag)
+
+        def _send(self, code, body, content_type, etag=None):
+            self.send_response(code)
+            if content_type:
+                self.send_header("Content-Type", content_type)
+            if etag:
+                self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if body:
+                self.wfile.write(body)
+
+    return StandInHandler
+
+
+def start_standin(site, faults=None, host="127.0.0.1", port=0):
+    # 背景執行緒啟動伺服器；回傳狀態 {'server', 'base_url', 'stats', 'faults'}
+    faults = dict(STANDIN_FAULTS, **(faults or {}))
+    stats = {
+        'lock': threading.Lock(),
+        'requests': 0,
+        'errors': 0,
+        'resets': 0,
+        'not_modified': 0,
+        'bytes': 0
+    }
+    server = ThreadingHTTPServer((host, port),
+                                 _make_handler(site, faults, stats))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever,
+                              name="spt-standin",
+                              daemon=True)
+    thread.start()
+    return {
+        'server': server,
+        'thread': thread,
+        'base_url': f"http://{host}:{server.server_address[1]}",
+        'stats': stats,
+        'faults': faults
+    }
+
+
+def stop_standin(standin):
+    standin['server'].shutdown()
+    standin['server'].server_close()
+
+
+def standin_stats(standin):
+    with standin['stats']['lock']:
+        return {k: v for k, v in standin['stats'].items() if k != 'lock'}
@@ -0,0 +1,237 @@
+import io
+import json
+import random
+
+# ==========================================
+# 合成測試資料 (Synthetic Fixtures)
+# ==========================================
+# 離線產生與真實來源結構相同的 FDA 頁面、EMA 活頁簿、產品清單 PDF 與上傳檔，
+# 供 benchmark 與本機替身伺服器使用；同一 seed 產生的內容固定。
+
+_PREFIXES = [
+    "sita", "losa", "valsa", "irbe", "olme", "rani", "nizati", "vareni",
+    "rifa", "metfor", "dabi", "ebas", "cina", "erlo", "bor", "ente", "cape",
+    "gefi", "pemet", "azaci", "deci", "fulve", "lenal", "posa", "vori"
+]
+_MIDDLES = ["", "lo", "ra", "ti", "xa", "me", "do", "pi", "zo", "nu"]
+_SUFFIXES = [
+    "gliptin", "sartan", "tidine", "cline", "mpicin", "min", "gatran",
+    "stine", "calcet", "tinib", "tezomib", "cavir", "citabine", "trexed",
+    "strant", "lidomide", "conazole", "prazole", "vastatin", "olol"
+]
+_SALTS = ["", "", "", " Sodium", " Hydrochloride", " Mesylate", " Potassium"]
+_GRADES = ["", "", " (USP)", " (EP)", "®"]
+
+FDA_DATE = "03/14/2025"
+EMA_DATE = "21/09/2025"
+
+
+def product_names(count, seed=0):
+    rng = random.Random(seed)
+    names = []
+    seen = set()
+    while len(names) < count:
+        core = (rng.choice(_PREFIXES) + rng.choice(_MIDDLES) +
+                rng.choice(_SUFFIXES)).capitalize()
+        if len(names) > len(_PREFIXES) * len(_SUFFIXES) // 2:
+            core += rng.choice("abcdefghijklmnopqrstuvwxyz") * 2
+        name = core + rng.choice(_SALTS) + rng.choice(_GRADES)
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+    return names
+
+
+def _nitrosamine(rng, drug):
+    return rng.choice(["N-nitroso-", "N-nitroso-des-methyl-", "NDMA ("
+                       ]) + drug.split()[0].lower() + rng.choice(
+                           ["", " impurity", " (NNN)"])
+
+
+def make_product_csv(names, seed=0):
+    rng = random.Random(seed)
+    lines = ["Product 1,Product 2,SPT Project No,Remark"]
+    for i, name in enumerate(names):
+        second = rng.choice(["", "", "API", "Intermediate"])
+        lines.append(f'"{name}",{second},SPT-{1000 + i},')
+    # 重複列與雜訊列 (與真實匯出檔相同)
+    lines.append(f'"{names[0]}",,SPT-9999,dup')
+    lines.append('"Compound 12-A",,SPT-0001,')
+    lines.append(',,,')
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def make_product_xlsx(names, seed=0):
+    import pandas as pd
+
+    df = pd.read_csv(io.BytesIO(make_product_csv(names, seed)))
+    output = io.BytesIO()
+    df.to_excel(output, index=False)
+    return output.getvalue()
+
+
+def _pdf_escape(text):
+    text = text.encode("latin-1", "replace").decode("latin-1")
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_product_pdf(names, rows_per_page=40, seed=0):
+    # 極簡 PDF：奇數頁為有格線的表格，偶數頁為純文字行
+    rng = random.Random(seed)
+    objects = []
+
+    def add(data):
+        objects.append(data)
+        return len(objects)
+
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages = [
+        names[i:i + rows_per_page]
+        for i in range(0, len(names), rows_per_page)
+    ] or [[]]
+
+    content_ids = []
+    for page_no, page_names in enumerate(pages):
+        ops = ["BT /F1 12 Tf 50 770 Td (ScinoPharm Commercial API) Tj ET"]
+        y = 740
+        with_table = page_no % 2 == 0
+        if with_table:
+            ops.append(f"50 {y} 500 16 re S 300 {y} m 300 {y + 16} l S")
+            ops.append(f"BT /F1 10 Tf 55 {y + 4} Td (API Name) Tj ET")
+            ops.append(f"BT /F1 10 Tf 305 {y + 4} Td (Regulatory) Tj ET")
+            y -= 16
+        for name in page_names:
+            status = rng.choice(["US DMF", "EU CEP", "JP MF", "KR DMF"])
+            if with_table:
+                ops.append(f"50 {y} 500 16 re S 300 {y} m 300 {y + 16} l S")
+                ops.append(
+                    f"BT /F1 10 Tf 55 {y + 4} Td ({_pdf_escape(name)}) Tj ET")
+                ops.append(f"BT /F1 10 Tf 305 {y + 4} Td ({status}) Tj ET")
+                y -= 16
+            else:
+                ops.append(f"BT /F1 10 Tf 50 {y} Td ({_pdf_escape(name)}) Tj "
+                           f"250 0 Td ({status}) Tj ET")
+                y -= 14
+        ops.append(f"BT /F1 8 Tf 50 30 Td (Page {page_no + 1}) Tj ET")
+        data = "\n".join(ops).encode("latin-1")
+        content_ids.append(
+            add(b"<< /Length %d >>\nstream\n" % len(data) + data +
+                b"\nendstream"))
+
+    pages_id = len(objects) + len(content_ids) + 1
+    page_ids = [
+        add(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] "
+            b"/Contents %d 0 R /Resources << /Font << /F1 %d 0 R >> >> >>" %
+            (pages_id, content_id, font_id)) for content_id in content_ids
+    ]
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode()
+    add(b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(page_ids))
+    catalog_id = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for obj_id, data in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % obj_id + data + b"\nendobj\n"
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += (b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+               % (len(objects) + 1, catalog_id, xref))
+    return bytes(output)
+
+
+def make_product_page(pdf_paths):
+    links = "".join(f'<li><a href="{path}">{label}</a></li>'
+                    for path, label in zip(pdf_paths, ["下載產品清單", "下載藥物主檔申請列表"]))
+    return ("<html><head><title>ScinoPharm</title></head><body>"
+            f"<h1>商業化原料藥</h1><ul>{links}</ul></body></html>")
+
+
+def make_fda_page(drugs, rows=500, seed=0):
+    # 結構仿照 FDA 頁面：內嵌 data: [...] JSON、兩個 HTML 表格與頁尾日期
+    rng = random.Random(seed)
+    json_rows = [{
+        "Nitrosamine": _nitrosamine(rng, rng.choice(drugs)),
+        "AI Limit (ng/day)": rng.choice([26.5, 96, 400, 1500]),
+        "Source": rng.choice(drugs)
+    } for _ in range(max(1, rows // 10))]
+
+    def table(count, with_thead):
+        body = []
+        for _ in range(count):
+            drug = rng.choice(drugs)
+            body.append(
+                f"<tr><td>{_nitrosamine(rng, drug)}</td><td>{drug}</td>"
+                f"<td>{rng.choice([26.5, 96, 178, 400, 1500])}</td>"
+                f"<td>{rng.choice(['', 'Category 1', 'See footnote'])}</td>"
+                f"<td>{rng.choice(['', 'N-[(2S)-...]-N-nitrosamide'])}</td></tr>"
+            )
+        header = ("<th>Nitrosamine Impurity</th><th>Source drug(s)</th>"
+                  "<th>Recommended AI Limit (ng/day)</th><th>Note</th>"
+                  "<th>IUPAC name</th>")
+        if with_thead:
+            return (f"<table><thead><tr>{header}</tr></thead>"
+                    f"<tbody>{''.join(body)}</tbody></table>")
+        return f"<table><tr>{header}</tr>{''.join(body)}</table>"
+
+    filler = "".join(
+        f"<p>Guidance paragraph {i} on nitrosamine drug substance-related "
+        f"impurities (NDSRIs) and acceptable intake limits.</p>"
+        for i in range(50))
+    nav = "".join(f'<li><a href="/section-{i}">Section {i}</a></li>'
+                  for i in range(100))
+    return (
+        "<html><head><title>CDER Nitrosamine Impurity Acceptable Intake Limits"
+        "</title><script>window.settings = {page: 1, data: " +
+        json.dumps(json_rows) + "};</script></head><body><nav><ul>" + nav +
+        "</ul></nav><main>" + filler + table(rows // 2, True) +
+        table(rows - rows // 2, False) + "<table><tr><td>Revision</td><td>"
+        "Date</td></tr><tr><td>1</td><td>2023</td></tr></table>"
+        f"<p>Content current as of:</p><p>{FDA_DATE}</p></main></body></html>")
+
+
+def make_ema_page(xlsx_path="/documents/other/appendix-1-acceptable-intakes-"
+                  "established-n-nitrosamines_en.xlsx"):
+    return (
+        "<html><body><h1>Nitrosamine impurities</h1>"
+        f"<p>First published: 01/05/2020</p><p>Last updated: {EMA_DATE}</p>"
+        f'<a href="{xlsx_path}">Appendix 1: Acceptable intakes (AIs) '
+        "established for N-nitrosamines</a></body></html>")
+
+
+def make_ema_workbook(drugs, rows=1000, sheets=3, seed=0):
+    # 多分頁、表頭前有說明列與空白列，仿照 EMA Appendix 1
+    import openpyxl
+
+    rng = random.Random(seed)
+    wb = openpyxl.Workbook()
+    intro = wb.active
+    intro.title = "Read me"
+    intro.append(["Appendix 1 - Acceptable intakes"])
+    intro.append(["See guidance for details"])
+
+    per_sheet = max(1, rows // sheets)
+    for sheet_no in range(sheets):
+        ws = wb.create_sheet(f"Table {sheet_no + 1}")
+        ws.append([f"EMA/409815/2020 Rev.{sheet_no + 20}"])
+        ws.append([])
+        ws.append([None, "Version date", EMA_DATE])
+        ws.append([
+            "Name", "Source", "CAS number", "AI (ng/day)", "IUPAC name",
+            "Note", "Structure"
+        ])
+        for i in range(per_sheet):
+            drug = rng.choice(drugs)
+            ws.append([
+                _nitrosamine(rng, drug), drug,
+                f"{rng.randint(10, 99999)}-{rng.randint(10, 99)}-{i % 10}",
+                rng.choice([18, 26.5, 96, 1500, "1500*", None]),
+                rng.choice(["N-methyl-N-nitroso...", None]),
+                rng.choice([None, "Category 4", "See footnote 3"]), None
+            ])
+
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
@@ -0,0 +1,214 @@
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from .metrics import count_metric
+from .settings import CACHE_DIR
+
+TABLE_CACHE_DIR = os.path.join(CACHE_DIR, "tables")
+TABLE_CACHE_ENABLED = os.environ.get("SPT_TABLE_CACHE", "1") != "0"
+# 容量上限：超過時依最後使用時間 (LRU) 刪除，與 HTTP 快取相同
+TABLE_CACHE_MAX_BYTES = int(os.environ.get("SPT_TABLE_CACHE_MB",
+                                           "128")) * 1024 * 1024
+
+# 解析邏輯有變動時遞增對應版本，舊快取即失效
+TABLE_CACHE_VERSION = {"fda": 3, "ema": 1}
+
+_lock = threading.Lock()
+
+
+def content_key(source, raw_bytes):
+    h = hashlib.sha256(f"{source}:v{TABLE_CACHE_VERSION[source]}:".encode())
+    h.update(raw_bytes)
+    return h.hexdigest()
+
+
+def _entry_paths(source, raw_bytes):
+    key = content_key(source, raw_bytes)
+    base = os.path.join(TABLE_CACHE_DIR, f"{source}_{key}")
+    return base + ".parquet", base + ".json"
+
+
+# --- object 欄位編碼 ---
+# Parquet 無法存放混合型別的 object 欄位，因此逐格存成 (型別代碼, 文字)，
+# 讀回時還原為原本的 Python 型別，確保快取結果與重新解析完全相同。
+def _encode_value(val):
+    if val is None:
+        return "N", None
+    if val is pd.NA:
+        return "a", None
+    if val is pd.NaT:
+        return "T", None
+    if isinstance(val, (bool, np.bool_)):
+        return "b", str(bool(val))
+    if isinstance(val, (int, np.integer)):
+        return "i", str(int(val))
+    if isinstance(val, (float, np.floating)):
+        if val != val:
+            return "n", None
+        return "f", repr(float(val))
+    if isinstance(val, str):
+        return "s", val
+    if isinstance(val, pd.Timestamp):
+        return "p", val.isoformat()
+    if isinstance(val, datetime.datetime):
+        return "d", val.isoformat()
+    if isinstance(val, datetime.date):
+        return "D", val.isoformat()
+    if isinstance(val, datetime.time):
+        return "h", val.isoformat()
+    return "s", str(val)
+
+
+_DECODERS = {
+    "N": lambda text: None,
+    "a": lambda text: pd.NA,
+    "T": lambda text: pd.NaT,
+    "n": lambda text: np.nan,
+    "b": lambda text: text == "True",
+    "i": int,
+    "f": float,
+    "s": lambda text: text,
+    "p": pd.Timestamp,
+    "d": datetime.datetime.fromisoformat,
+    "D": datetime.date.fromisoformat,
+    "h": datetime.time.fromisoformat
+}
+
+
+def _encode_frame(df):
+    data = {}
+    kinds = {}
+    for j in range(df.shape[1]):
+        col = df.iloc[:, j]
+        if col.dtype == object:
+            pairs = [_encode_value(v) for v in col.tolist()]
+            data[f"c{j}"] = pd.Series([p[1] for p in pairs], dtype=object)
+            data[f"k{j}"] = pd.Series([p[0] for p in pairs], dtype=object)
+            kinds[j] = "object"
+        else:
+            data[f"c{j}"] = col.reset_index(drop=True)
+            kinds[j] = str(col.dtype)
+    return pd.DataFrame(data, index=range(len(df))), kinds
+
+
+def _decode_frame(stored, columns, kinds):
+    data = {}
+    for j in range(len(columns)):
+        if kinds[str(j)] == "object":
+            texts = stored[f"c{j}"].tolist()
+            codes = stored[f"k{j}"].tolist()
+            data[j] = pd.Series(
+                [_DECODERS[k](t) for k, t in zip(codes, texts)],
+                dtype=object)
+        else:
+            data[j] = stored[f"c{j}"].astype(kinds[str(j)])
+    df = pd.DataFrame(data, index=range(len(stored)))
+    df.columns = columns
+    return df
+
+
+def _write_meta(meta_path, meta):
+    tmp_path = f"{meta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_path, meta_path)
+
+
+def evict_table_cache(max_bytes=None):
+    # 舊版本 (TABLE_CACHE_VERSION 已遞增) 的項目不可能再命中，直接刪除
+    # (較新版本的項目可能屬於同時執行的新版程式，只依容量處理)；
+    # 其餘超過容量上限時依最後使用時間 (LRU) 刪除。回傳刪除的項目數
+    max_bytes = TABLE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    try:
+        names = os.listdir(TABLE_CACHE_DIR)
+    except OSError:
+        return 0
+
+    stale = []
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        meta_path = os.path.join(TABLE_CACHE_DIR, name)
+        parquet_path = meta_path[:-len(".json")] + ".parquet"
+        source = name.split("_", 1)[0]
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            size = os.path.getsize(parquet_path)
+        except (OSError, ValueError):
+            stale.append(meta_path)
+            continue
+        if meta.get("version", 0) < TABLE_CACHE_VERSION.get(source, 0):
+            stale.append(meta_path)
+        else:
+            entries.append((meta.get("last_used", 0), size, meta_path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, meta_path in sorted(entries):
+        if total <= max_bytes:
+            break
+        stale.append(meta_path)
+        total -= size
+
+    for meta_path in stale:
+        for path in (meta_path, meta_path[:-len(".json")] + ".parquet"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    count_metric("table_cache.evicted", len(stale))
+    return len(stale)
+
+
+def load_cached_table(source, raw_bytes):
+    # 命中時回傳 (DataFrame, meta)，否則 None
+    if not TABLE_CACHE_ENABLED:
+        return None
+    parquet_path, meta_path = _entry_paths(source, raw_bytes)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        stored = pd.read_parquet(parquet_path)
+        df = _decode_frame(stored, meta["columns"], meta["kinds"])
+    except (OSError, ValueError, KeyError, ImportError):
+        count_metric("table_cache.misses")
+        return None
+    count_metric("table_cache.hits")
+    try:
+        with _lock:
+            _write_meta(meta_path, dict(meta, last_used=time.time()))
+    except OSError:
+        pass
+    return df, meta
+
+
+def store_cached_table(source, raw_bytes, df, meta):
+    if not TABLE_CACHE_ENABLED:
+        return False
+    parquet_path, meta_path = _entry_paths(source, raw_bytes)
+    try:
+        stored, kinds = _encode_frame(df)
+        meta = dict(meta,
+                    columns=[str(c) for c in df.columns],
+                    kinds=kinds,
+                    version=TABLE_CACHE_VERSION[source],
+                    last_used=time.time())
+        with _lock:
+            os.makedirs(TABLE_CACHE_DIR, exist_ok=True)
+            tmp_path = f"{parquet_path}.{os.getpid()}.tmp"
+            stored.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, parquet_path)
+            _write_meta(meta_path, meta)
+            evict_table_cache()
+        return True
+    except (OSError, ValueError, TypeError, ImportError):
+        # 未安裝 pyarrow 或欄位無法序列化時略過快取
+        return False
@@ -0,0 +1,464 @@
+import io
+import json
+import re
+
+import pandas as pd
+
+from nitrosamine_monitor.matching import (FUZZY_MIN_LENGTH, STOP_WORDS,
+                                          WORD_TOKEN_RE, product_joins)
+
+# ==========================================
+# 原始實作 (Baseline Reference)
+# ==========================================
+# 取自重構前的 Nitrosamine_SPT_v2.py (逐列 / 逐產品、BeautifulSoup、read_excel、
+# extract_tables)，去掉網路與 Streamlit 部分，作為等價測試的標準答案。
+
+
+def is_valid_api_name(text):
+    if not text: return False
+    text = text.lower()
+    ignore = [
+        "api name", "regulatory", "therapeutic", "page", "scinopharm",
+        "download", "date", "status", "product"
+    ]
+    if any(x in text for x in ignore): return False
+    if len(text) < 3: return False
+    if not re.search(r'[a-zA-Z]', text): return False
+    return True
+
+
+def clean_api_name(text):
+    text = re.sub(r'\s*\(.*?\)', '', text)
+    text = text.replace('®', '').replace('™', '').replace('*', '')
+    return text.strip()
+
+
+# --- 產品清單 PDF ---
+def parse_pdf_pages(pdf_bytes):
+    # 每頁名稱清單 (product_dict 去重前)
+    import pdfplumber
+
+    pages = []
+    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+        for page in pdf.pages:
+            names = []
+            tables = page.extract_tables()
+            found_in_table = False
+            if tables:
+                for table in tables:
+                    for row in table:
+                        if row and len(row) > 0:
+                            val = str(row[0]).strip()
+                            if is_valid_api_name(val):
+                                names.append(clean_api_name(val))
+                                found_in_table = True
+
+            if not found_in_table:
+                text = page.extract_text()
+                if text:
+                    lines = text.split('\n')
+                    for line in lines:
+                        parts = re.split(r'\s{2,}', line.strip())
+                        if parts:
+                            candidate = parts[0]
+                            if is_valid_api_name(candidate):
+                                names.append(clean_api_name(candidate))
+            pages.append(names)
+    return pages
+
+
+# --- 上傳清單 ---
+def parse_uploaded_file(uploaded_file):
+    product_dict = {}
+
+    if uploaded_file.name.endswith('.csv'):
+        try:
+            df = pd.read_csv(uploaded_file)
+        except:
+            uploaded_file.seek(0)
+            df = pd.read_csv(uploaded_file, encoding='cp1252')
+    else:
+        df = pd.read_excel(uploaded_file)
+
+    spt_col = None
+    for col in df.columns:
+        if "spt" in str(col).lower():
+            spt_col = col
+            break
+
+    target_col = None
+    target_col_2 = None
+    possible_names = [
+        'product', 'api', 'name', 'drug', 'item', 'substance', '產品', '藥名',
+        '品項'
+    ]
+
+    for col in df.columns:
+        if any(p == str(col).lower() for p in possible_names):
+            target_col = col
+            break
+    if not target_col:
+        for col in df.columns:
+            if any(p in str(col).lower() for p in possible_names):
+                target_col = col
+                break
+
+    if target_col and "product" in str(target_col).lower():
+        for col in df.columns:
+            if str(col) != str(target_col) and "product" in str(
+                    col).lower() and ("1" in str(col) or "2" in str(col)):
+                target_col_2 = col
+                break
+
+    if not target_col:
+        target_col = df.columns[0]
+
+    for _, row in df.iterrows():
+        val1 = str(row[target_col]).strip()
+        name_str = val1
+
+        if target_col_2:
+            val2 = row[target_col_2]
+            if pd.notna(val2) and str(val2).strip() != '' and str(
+                    val2).strip().lower() != 'nan':
+                name_str = f"{val1} {str(val2).strip()}"
+
+        if name_str.lower() == 'nan' or not name_str:
+            continue
+
+        cleaned_name = clean_api_name(name_str)
+
+        is_generic_compound = False
+        if "compound" in cleaned_name.lower():
+            remain = cleaned_name.lower().replace("compound", "").strip()
+            if re.fullmatch(r'[a-z0-9\s\-\.]*', remain):
+                is_generic_compound = True
+
+        if is_generic_compound:
+            continue
+
+        if len(cleaned_name) > 2:
+            spt_val = "N/A"
+            if spt_col:
+                raw_spt = row[spt_col]
+                if pd.notna(raw_spt):
+                    spt_val = str(raw_spt).strip()
+
+            if cleaned_name not in product_dict:
+                product_dict[cleaned_name] = spt_val
+
+    result_list = [{'name': k, 'spt': v} for k, v in product_dict.items()]
+    return sorted(result_list, key=lambda x: x['name'])
+
+
+# --- FDA 頁面 ---
+def parse_fda_page(raw_html):
+    from bs4 import BeautifulSoup
+
+    found_date = "N/A"
+    soup = BeautifulSoup(raw_html, 'html.parser')
+    text_content = soup.get_text(" ", strip=True)
+
+    date_match = re.search(r"Content current as of:.*?([\d]{2}/[\d]{2}/[\d]{4})", text_content, re.IGNORECASE)
+    if date_match:
+        found_date = date_match.group(1).strip()
+
+    all_tables_data = []
+
+    json_pattern = re.compile(r'data\s*:\s*(\[\s*\{.*\}\s*\])', re.DOTALL)
+    matches = json_pattern.findall(raw_html)
+
+    for i, match in enumerate(matches):
+        try:
+            clean_match = match.strip()
+            json_data = json.loads(clean_match)
+            if isinstance(json_data, list) and len(json_data) > 0:
+                df = pd.DataFrame(json_data)
+                df = df.reset_index(drop=True)
+                all_tables_data.append(df)
+        except:
+            pass
+
+    tables = soup.find_all('table')
+
+    for i, table in enumerate(tables):
+        headers_list = []
+        thead = table.find('thead')
+        if thead:
+            headers_list = [
+                th.get_text(strip=True) for th in thead.find_all('th')
+            ]
+
+        if not headers_list:
+            first_row = table.find('tr')
+            if first_row:
+                headers_list = [
+                    td.get_text(strip=True)
+                    for td in first_row.find_all(['td', 'th'])
+                ]
+
+        if headers_list:
+            headers_list = [
+                h if h else f"Unnamed_{j}"
+                for j, h in enumerate(headers_list)
+            ]
+            seen = set()
+            new_headers = []
+            for h in headers_list:
+                c = h
+                count = 1
+                while c in seen:
+                    c = f"{h}_{count}"
+                    count += 1
+                seen.add(c)
+                new_headers.append(c)
+            headers_list = new_headers
+
+        rows_data = []
+        tbody = table.find('tbody')
+        data_rows = tbody.find_all('tr') if tbody else table.find_all('tr')
+
+        start_idx = 0
+        if not thead and data_rows:
+            start_idx = 1
+
+        for row in data_rows[start_idx:]:
+            cols = row.find_all('td')
+            if not cols: continue
+            rows_data.append([td.get_text(strip=True) for td in cols])
+
+        if headers_list and rows_data:
+            max_len = len(headers_list)
+            clean_rows = []
+            for row in rows_data:
+                if len(row) < max_len:
+                    row.extend([None] * (max_len - len(row)))
+                elif len(row) > max_len:
+                    row = row[:max_len]
+                clean_rows.append(row)
+
+            df = pd.DataFrame(clean_rows, columns=headers_list)
+            df = df.reset_index(drop=True)
+            all_tables_data.append(df)
+
+    valid_dfs = []
+    for df in all_tables_data:
+        df.columns = [str(c).strip().replace('\n', ' ') for c in df.columns]
+
+        rename_map = {}
+        has_critical_data = False
+
+        for col in df.columns:
+            c_lower = col.lower()
+            if any(k in c_lower for k in ['nitrosamine', 'impurity']):
+                rename_map[col] = 'Nitrosamine'
+                has_critical_data = True
+            elif any(k in c_lower for k in ['limit', 'ai', 'intake']):
+                rename_map[col] = 'Limit'
+            elif any(k in c_lower for k in ['note', 'comment', 'remark']):
+                rename_map[col] = 'Notes'
+            elif any(k in c_lower
+                     for k in ['source', 'drug', 'product', 'api']):
+                rename_map[col] = 'Source'
+            elif any(k in c_lower for k in ['iupac', 'chemical']):
+                rename_map[col] = 'IUPAC'
+
+        if has_critical_data:
+            df = df.rename(columns=rename_map)
+            for req_col in [
+                    'Nitrosamine', 'Limit', 'Source', 'Notes', 'IUPAC'
+            ]:
+                if req_col not in df.columns:
+                    df[req_col] = pd.NA
+
+            df = df.reset_index(drop=True)
+            valid_dfs.append(df)
+
+    if valid_dfs:
+        final_df = pd.concat(valid_dfs[:2], ignore_index=True)
+        return final_df.reset_index(drop=True), found_date
+
+    return pd.DataFrame(), found_date
+
+
+# --- EMA 活頁簿 ---
+def parse_ema_workbook(xlsx_bytes):
+    xls = pd.read_excel(io.BytesIO(xlsx_bytes), sheet_name=None, header=None)
+
+    all_sheets_data = []
+
+    for sheet_name, temp_df in xls.items():
+        best_idx = 0
+        max_score = 0
+        keywords = [
+            "nitrosamine", "limit", "intake", "substance", "ng/day", "iupac",
+            "impurity", "structure", "cas", "source", "ai (ng/day)"
+        ]
+
+        scan_rows = min(30, len(temp_df))
+        for idx in range(scan_rows):
+            row = temp_df.iloc[idx]
+            row_text = " ".join([str(x).lower() for x in row if pd.notna(x)])
+            score = sum(1 for k in keywords if k in row_text)
+            if score > max_score:
+                max_score = score
+                best_idx = idx
+
+        if max_score == 0 and len(temp_df) < 5:
+            continue
+
+        new_header = temp_df.iloc[best_idx]
+        df = temp_df.iloc[best_idx + 1:].copy()
+        df.columns = new_header
+        df.columns = [str(c).strip().replace('\n', ' ') for c in df.columns]
+
+        df = df.reset_index(drop=True)
+        all_sheets_data.append(df)
+
+    if all_sheets_data:
+        final_df = pd.concat(all_sheets_data, ignore_index=True)
+        return final_df.reset_index(drop=True)
+
+    return pd.DataFrame()
+
+
+# --- 比對 ---
+def smart_match(scino_api, row_series):
+    scino_clean = scino_api.upper().replace("-", " ").strip()
+    scino_tokens = set(scino_clean.split())
+    core_tokens = {
+        t
+        for t in scino_tokens if t not in STOP_WORDS and len(t) > 2
+    }
+
+    if not core_tokens:
+        if "COMPOUND" in scino_clean:
+            return False, ""
+        core_tokens = {scino_clean}
+
+    row_text = " ".join(
+        [str(val).upper() for val in row_series.values if pd.notna(val)])
+
+    for token in core_tokens:
+        pattern = r'\b' + re.escape(token) + r'\b'
+        if re.search(pattern, row_text):
+            return True, row_text
+
+    return False, ""
+
+
+def match_pairs(api_list, df):
+    # 原本的雙層迴圈：每列 x 每個產品
+    pairs = []
+    for row_idx, (_, row) in enumerate(df.iterrows()):
+        for product_idx, api_obj in enumerate(api_list):
+            if smart_match(api_obj['name'], row)[0]:
+                pairs.append((row_idx, product_idx))
+    return pairs
+
+
+def levenshtein(a, b):
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1,
+                           prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+
+def fuzzy_score(word, token, threshold):
+    # 完全相同 = 1.0；兩邊都夠長時，編輯距離在容許範圍內的相似度
+    if word == token:
+        return 1.0
+    if threshold >= 1 or min(len(word), len(token)) < FUZZY_MIN_LENGTH:
+        return None
+    longest = max(len(word), len(token))
+    dist = levenshtein(word, token)
+    if dist > int((1 - threshold) * longest + 1e-9):
+        return None
+    return round(1 - dist / longest, 3)
+
+
+def fuzzy_pairs(api_list, df, threshold):
+    # 每列的字 + 相鄰兩字合併 x 每個產品的單字 token + 相鄰字合併 (逐對計算)，
+    # 含符號的 token 以 \bTOKEN\b 比對 (分數 1.0)；同一 (列, 產品) 取最高分
+    products = []
+    for api_obj in api_list:
+        scino_clean = api_obj['name'].upper().replace("-", " ").strip()
+        core = {
+            t
+            for t in scino_clean.split() if t not in STOP_WORDS and len(t) > 2
+        }
+        if not core:
+            core = set() if "COMPOUND" in scino_clean else {scino_clean}
+        words = {t for t in core if WORD_TOKEN_RE.fullmatch(t)}
+        products.append(
+            (words | product_joins(api_obj['name']), core - words))
+
+    pairs = {}
+    for row_idx, (_, row) in enumerate(df.iterrows()):
+        row_text = " ".join(
+            [str(val).upper() for val in row.values if pd.notna(val)])
+        row_words = WORD_TOKEN_RE.findall(row_text)
+        row_words = set(row_words) | {
+            a + b
+            for a, b in zip(row_words, row_words[1:])
+        }
+        for product_idx, (words, phrases) in enumerate(products):
+            best = None
+            for word in row_words:
+                for token in words:
+                    score = fuzzy_score(word, token, threshold)
+                    if score is not None and (best is None or score > best):
+                        best = score
+            if any(
+                    re.search(r'\b' + re.escape(p) + r'\b', row_text)
+                    for p in phrases):
+                best = 1.0
+            if best is not None:
+                pairs[(row_idx, product_idx)] = best
+    return pairs
+
+
+# --- 歷史比對 ---
+def mark_new_records(final_df, history_file):
+    try:
+        old_df = pd.read_excel(history_file, sheet_name='Summary_Match')
+    except:
+        old_df = pd.read_excel(history_file)
+
+    old_fingerprints = set()
+
+    spt_col_name = None
+    for c in old_df.columns:
+        if 'spt' in c.lower():
+            spt_col_name = c
+            break
+
+    nitro_col_name = None
+    for c in old_df.columns:
+        if 'nitrosamine' in c.lower() and 'impurity' in c.lower():
+            nitro_col_name = c
+            break
+
+    if nitro_col_name:
+        for _, row in old_df.iterrows():
+            key_part1 = str(row[spt_col_name]).strip().upper(
+            ) if spt_col_name else str(row.iloc[0]).strip().upper()
+            key_part2 = str(row[nitro_col_name]).strip().upper()
+            old_fingerprints.add(f"{key_part1}|{key_part2}")
+
+    new_count = 0
+    for idx, row in final_df.iterrows():
+        key_part1 = str(row['SPT Project num']).strip().upper(
+        ) if 'SPT Project num' in row else str(
+            row['ScinoPharm Product']).strip().upper()
+        key_part2 = str(row['Nitrosamine Impurity']).strip().upper()
+        current_fp = f"{key_part1}|{key_part2}"
+
+        if current_fp not in old_fingerprints:
+            final_df.at[idx, 'Status'] = "★ NEW"
+            new_count += 1
+    return new_count
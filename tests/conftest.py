@@ -0,0 +1,51 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+# 測試期間所有磁碟快取寫到暫存目錄 (須在 import nitrosamine_monitor 前設定；
+# PDF 解析的子行程也依這個環境變數找逐頁快取)
+_CACHE_DIR = tempfile.mkdtemp(prefix="spt_tests_")
+os.environ["SPT_CACHE_DIR"] = _CACHE_DIR
+os.environ.pop("SPT_PDF_PAGE_CACHE_DB", None)
+os.environ.pop("SPT_SNAPSHOT_DB", None)
+os.environ.pop("SPT_SOURCE_BASE_URL", None)
+os.environ.pop("SPT_FUZZY_THRESHOLD", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nitrosamine_monitor import bench, synthetic  # noqa: E402
+from nitrosamine_monitor.loadtest import isolated_caches  # noqa: E402
+from nitrosamine_monitor.sources import (parse_ema_workbook,  # noqa: E402
+                                         parse_fda_page)
+
+FIXTURE_SIZES = [60, 250]
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_CACHE_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session", params=FIXTURE_SIZES, ids=lambda s: f"n{s}")
+def fixtures(request):
+    # bench 使用的合成輸入 (PDF、CSV/XLSX、FDA 頁面、EMA 活頁簿)
+    return bench.build_fixtures(request.param, seed=request.param)
+
+
+@pytest.fixture
+def caches():
+    # 每個測試各自的空快取目錄
+    with isolated_caches() as cache_dir:
+        yield cache_dir
+
+
+@pytest.fixture
+def fetchers(fixtures):
+    # 取代網路下載：回傳合成 FDA / EMA 的解析結果 (每次呼叫各自一份副本)
+    fda_df, fda_date, _ = parse_fda_page(fixtures['fda_html'])
+    ema_df, _ = parse_ema_workbook(fixtures['ema_xlsx'])
+    return {
+        "FDA": lambda: (fda_df.copy(), fda_date, []),
+        "EMA": lambda: (ema_df.copy(), synthetic.EMA_DATE, [])
+    }
@@ -0,0 +1,74 @@
+import io
+
+import pandas as pd
+import pytest
+
+from nitrosamine_monitor.pipeline import (merge_portfolios, run_analysis,
+                                          run_batch)
+from nitrosamine_monitor.products import parse_uploaded_file
+
+
+def upload(data, name="p.csv"):
+    f = io.BytesIO(data)
+    f.name = name
+    api_list, _ = parse_uploaded_file(f)
+    return api_list
+
+
+@pytest.fixture
+def portfolios(fixtures):
+    # 三份清單：完整清單、與其重疊的子集 (含清單內重複名稱)、沒有任何命中的清單
+    full = upload(fixtures['csv'])
+    subset = full[::3] + full[:2]
+    return {
+        "full": full,
+        "subset": subset,
+        "none": [{'name': "Zorbinase", 'spt': "SPT-X"}]
+    }
+
+
+def test_merge_portfolios_dedupes_names():
+    merged, id_maps = merge_portfolios({
+        "a": [{'name': "Losartan", 'spt': "1"}, {'name': "Valsartan"}],
+        "b": [{'name': "Valsartan", 'spt': "2"}, {'name': "Ebastine"}]
+    })
+    assert [p['name'] for p in merged] == ["Losartan", "Valsartan",
+                                           "Ebastine"]
+    assert id_maps["a"].tolist() == [0, 1] and id_maps["b"].tolist() == [1, 2]
+
+
+@pytest.mark.parametrize("match_mode", ["token", "regex", "fuzzy"])
+def test_batch_matches_separate_runs(portfolios, fetchers, caches,
+                                     match_mode):
+    result = run_batch(portfolios, match_mode=match_mode, fetchers=fetchers)
+    assert list(result['portfolios']) == list(portfolios)
+
+    for name, api_list in portfolios.items():
+        item = result['portfolios'][name]
+        expected = run_analysis(api_list,
+                                match_mode=match_mode,
+                                fetchers=fetchers)['summary']
+        assert item['products'] == len(api_list)
+        if expected is None:
+            assert item['summary'] is None and item['matches'] == 0
+        else:
+            pd.testing.assert_frame_equal(item['summary'], expected)
+            assert item['matches'] == len(expected)
+
+
+def test_batch_fetches_and_matches_once(portfolios, fetchers, caches):
+    calls = []
+    counted = {
+        source: (lambda fn=fn, source=source: calls.append(source) or fn())
+        for source, fn in fetchers.items()
+    }
+    result = run_batch(portfolios, fetchers=counted)
+    assert sorted(calls) == ["EMA", "FDA"]
+
+    run = result['metrics']
+    assert run['stages']['match']['calls'] == 1
+    for name in portfolios:
+        stage = run['stages'][f"portfolio/{name}"]
+        assert stage['calls'] == 1
+        assert result['portfolios'][name]['seconds'] == stage['wall']
+    assert set(result['timings']) == {"fetch", "snapshot", "match"}
@@ -0,0 +1,96 @@
+import datetime
+import io
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from nitrosamine_monitor.export import (EXPORT_FILES, EXPORT_FORMATS,
+                                        export_report, format_export_memory)
+from nitrosamine_monitor.metrics import collect
+from nitrosamine_monitor.report import generate_excel
+
+
+@pytest.fixture
+def frames():
+    # 文字、整數、浮點 (含 inf / 缺值)、日期、布林與空白表格
+    match_df = pd.DataFrame({
+        "API": ["Losartan", "Valsartan", "Ebastine"],
+        "Limit": [96.0, np.nan, np.inf],
+        "Count": [1, 2, 3],
+        "Found": [True, False, True],
+        "Date": [datetime.datetime(2024, 1, 2, 3, 4, 5)] * 3
+    })
+    fda_raw = pd.DataFrame([["NDMA", "Drug A", 96], ["NDEA", None, 26.5]],
+                           columns=["Nitrosamine", "Source", "Limit"])
+    return match_df, fda_raw, pd.DataFrame()
+
+
+def read_sheets(data):
+    return pd.read_excel(io.BytesIO(data), sheet_name=None)
+
+
+def test_stream_xlsx_matches_pandas_writer(frames):
+    expected = read_sheets(generate_excel(*frames))
+    result = read_sheets(export_report(*frames, fmt="xlsx_stream")['data'])
+    assert list(result) == list(expected)
+    for name, df in expected.items():
+        pd.testing.assert_frame_equal(result[name], df)
+
+
+@pytest.mark.parametrize("fmt", ["csv_zip", "parquet_zip"])
+def test_bundles_hold_every_table(frames, fmt):
+    export = export_report(*frames, fmt=fmt)
+    ext = "csv" if fmt == "csv_zip" else "parquet"
+    with zipfile.ZipFile(io.BytesIO(export['data'])) as zf:
+        assert zf.namelist() == [
+            f"{name}.{ext}" for name in ["summary", "raw_fda", "raw_ema"]
+        ]
+        with zf.open(f"raw_fda.{ext}") as f:
+            raw_fda = (pd.read_csv(f)
+                       if ext == "csv" else pd.read_parquet(f))
+    assert raw_fda["Nitrosamine"].tolist() == ["NDMA", "NDEA"]
+    assert export['file_name'] == EXPORT_FILES[fmt][0]
+
+
+def test_summary_only_references_snapshots(frames):
+    refs = [{'Source': "FDA", 'Snapshot ID': 3, 'Rows': 2}]
+    sheets = read_sheets(
+        export_report(*frames, fmt="summary_only", snapshot_refs=refs)['data'])
+    assert list(sheets) == ["Summary_Match", "Raw_Data_Ref"]
+    assert sheets["Raw_Data_Ref"]["Snapshot ID"].tolist() == [3]
+
+
+@pytest.mark.parametrize("fmt", sorted(EXPORT_FORMATS))
+def test_output_path_writes_file(frames, fmt, tmp_path):
+    path = tmp_path / EXPORT_FILES[fmt][0]
+    export = export_report(*frames, fmt=fmt, output=str(path))
+    assert export['data'] is None
+    assert export['output_bytes'] == path.stat().st_size > 0
+
+
+def test_memory_measured_by_default(frames):
+    with collect() as run:
+        first = export_report(*frames, fmt="xlsx")
+        second = export_report(*frames, fmt="csv_zip")
+    assert first['peak_bytes'] is None
+    assert first['output_bytes'] == len(first['data'])
+    assert 0 < first['peak_rss_bytes'] <= second['peak_rss_bytes']
+    assert first['rss_growth_bytes'] >= 0
+    # 峰值保留最大值，不因多次匯出而累加
+    assert run['counters']['export.peak_rss_bytes'] == second['peak_rss_bytes']
+    assert "高水位" in format_export_memory(second)
+
+
+def test_tracemalloc_peak_is_opt_in(frames):
+    with collect() as run:
+        export = export_report(*frames, fmt="xlsx", measure_memory=True)
+    assert export['peak_bytes'] > 0
+    assert run['counters']['export.peak_bytes'] == export['peak_bytes']
+    assert "tracemalloc" in format_export_memory(export)
+
+
+def test_unknown_format_rejected(frames):
+    with pytest.raises(ValueError):
+        export_report(*frames, fmt="pdf")
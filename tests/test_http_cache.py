@@ -0,0 +1,133 @@
+import json
+import os
+
+import pytest
+import requests
+
+from nitrosamine_monitor import http_cache
+from nitrosamine_monitor.http_cache import cached_get, evict_http_cache
+from nitrosamine_monitor.metrics import collect
+
+URL = "https://example.org/page"
+
+
+def make_response(status, content=b"", headers=None):
+    resp = requests.Response()
+    resp.status_code = status
+    resp._content = content
+    resp.headers.update(headers or {})
+    resp.encoding = "utf-8"
+    resp.url = URL
+    return resp
+
+
+@pytest.fixture
+def server(monkeypatch, caches):
+    # http_get 的替身：依序回傳 responses，並記錄每次請求的 headers
+    state = {'responses': [], 'requests': []}
+
+    def fake_get(url, headers=None, **kwargs):
+        state['requests'].append(dict(headers or {}))
+        return state['responses'].pop(0)
+
+    monkeypatch.setattr(http_cache, "http_get", fake_get)
+    return state
+
+
+def test_not_modified_served_from_disk(server):
+    server['responses'] = [
+        make_response(200, b"v1", {
+            "ETag": '"a"',
+            "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"
+        }),
+        make_response(304)
+    ]
+    first = cached_get(URL)
+    with collect() as run:
+        second = cached_get(URL)
+
+    assert not first['from_cache'] and first['content'] == b"v1"
+    assert second['from_cache'] and second['status'] == 200
+    assert second['content'] == b"v1" and second['text'] == "v1"
+    assert server['requests'][1]["If-None-Match"] == '"a"'
+    assert server['requests'][1]["If-Modified-Since"].startswith("Mon")
+    assert run['counters']['http_cache.hits'] == 1
+
+
+def test_body_lost_after_304_is_refetched(server, monkeypatch):
+    server['responses'] = [
+        make_response(200, b"v1", {"ETag": '"a"'}),
+        make_response(304),
+        make_response(200, b"v2", {"ETag": '"b"'})
+    ]
+    cached_get(URL)
+    body_path, _ = http_cache._entry_paths(URL)
+
+    real_load = http_cache._load_entry
+
+    def load_then_evict(url):
+        # 條件式請求送出前 meta 仍在，回應 304 之前內容已被刪除
+        meta = real_load(url)
+        os.remove(body_path)
+        return meta
+
+    monkeypatch.setattr(http_cache, "_load_entry", load_then_evict)
+    with collect() as run:
+        result = cached_get(URL)
+
+    assert result['content'] == b"v2" and not result['from_cache']
+    assert "If-None-Match" not in server['requests'][2]
+    assert run['counters']['http_cache.lost'] == 1
+    with open(body_path, "rb") as f:
+        assert f.read() == b"v2"
+
+
+def test_store_failure_still_returns_response(server, monkeypatch, tmp_path):
+    # 快取目錄無法建立 (路徑是檔案)：下載結果照常回傳，只記錄 metric
+    blocker = tmp_path / "not_a_dir"
+    blocker.write_text("x")
+    monkeypatch.setattr(http_cache, "HTTP_CACHE_DIR", str(blocker / "http"))
+    server['responses'] = [make_response(200, b"v1")]
+    with collect() as run:
+        result = cached_get(URL)
+    assert result['content'] == b"v1" and result['status'] == 200
+    assert run['counters']['http_cache.store_failed'] == 1
+
+
+def test_disabled_cache_sends_no_conditions(server, monkeypatch):
+    monkeypatch.setattr(http_cache, "HTTP_CACHE_ENABLED", False)
+    server['responses'] = [
+        make_response(200, b"v1", {"ETag": '"a"'}),
+        make_response(200, b"v1", {"ETag": '"a"'})
+    ]
+    cached_get(URL)
+    cached_get(URL)
+    assert "If-None-Match" not in server['requests'][1]
+    assert not os.path.exists(http_cache.HTTP_CACHE_DIR)
+
+
+def test_error_status_is_not_cached(server):
+    server['responses'] = [make_response(404, b"missing")]
+    with pytest.raises(requests.exceptions.HTTPError):
+        cached_get(URL)
+    server['responses'] = [make_response(404, b"missing")]
+    assert cached_get(URL, raise_for_status=False)['status'] == 404
+    assert http_cache._load_entry(URL) is None
+
+
+def test_eviction_drops_least_recently_used(server):
+    urls = [f"{URL}/{i}" for i in range(3)]
+    server['responses'] = [make_response(200, b"x" * 100) for _ in urls]
+    for url in urls:
+        cached_get(url)
+    # 第一個最近才使用過，最舊的是第二個
+    for url, last_used in zip(urls, [300, 100, 200]):
+        _, meta_path = http_cache._entry_paths(url)
+        meta = dict(http_cache._load_entry(url), last_used=last_used)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    assert evict_http_cache(max_bytes=250) == 1
+    assert http_cache._load_entry(urls[1]) is None
+    assert http_cache._load_entry(urls[0]) is not None
+    assert http_cache._load_entry(urls[2]) is not None
@@ -0,0 +1,146 @@
+import io
+import time
+
+import pytest
+import requests
+import urllib3
+from urllib3.exceptions import MaxRetryError
+
+from nitrosamine_monitor import http_client
+from nitrosamine_monitor.http_client import (DeadlineExceeded, DeadlineRetry,
+                                             DeadlineTimeout,
+                                             ResponseTooLarge, build_session,
+                                             describe_error, http_get,
+                                             read_capped, request_deadline)
+from nitrosamine_monitor.metrics import collect
+from nitrosamine_monitor.standin import start_standin, stop_standin
+
+BODY = b"<html>" + b"x" * 200_000 + b"</html>"
+
+
+@pytest.fixture
+def server():
+    standin = start_standin({"/example.org/page": BODY})
+    standin['url'] = standin['base_url'] + "/example.org/page"
+    yield standin
+    stop_standin(standin)
+
+
+@pytest.fixture
+def session(monkeypatch):
+    # 縮短退避時間；每個測試各自的連線池
+    monkeypatch.setattr(http_client, "HTTP_BACKOFF", 0.01)
+    monkeypatch.setattr(http_client, "HTTP_BACKOFF_JITTER", 0.0)
+    http = build_session()
+    yield http
+    http.close()
+
+
+def raw_response(body, headers=None):
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.raw = io.BytesIO(body)
+    resp.headers.update(headers or {})
+    resp.url = "https://example.org/page"
+    return resp
+
+
+def test_streamed_body_is_complete(server, session):
+    resp = http_get(server['url'], session=session)
+    assert resp.status_code == 200
+    assert resp.content == BODY and resp.text.endswith("</html>")
+
+
+def test_server_errors_are_retried(server, session):
+    server['faults']['error_rate'] = 1.0
+    with collect() as run:
+        resp = http_get(server['url'], session=session)
+    assert resp.status_code == 503
+    assert server['stats']['requests'] == http_client.HTTP_RETRIES + 1
+    assert run['counters']['http.retries'] == http_client.HTTP_RETRIES
+
+
+def test_deadline_stops_backoff(server, session):
+    # 退避等待會超過期限時立即放棄 (不等 5 秒後再試)，回傳最後一次的 503
+    server['faults']['error_rate'] = 1.0
+    session.adapters["http://"].max_retries.backoff_factor = 5
+    t0 = time.monotonic()
+    with collect() as run, request_deadline(2):
+        resp = http_get(server['url'], session=session)
+    assert time.monotonic() - t0 < 2
+    assert resp.status_code == 503
+    # 第一次重試不退避，第二次重試的等待 (5 秒) 超過期限
+    assert server['stats']['requests'] == 2
+    assert run['counters']['http.deadline_exceeded'] == 1
+    with pytest.raises(requests.exceptions.HTTPError):
+        resp.raise_for_status()
+
+
+def test_deadline_bounds_stalled_read(server, session):
+    server['faults'].update(stall_rate=1.0, stall=5.0)
+    t0 = time.monotonic()
+    with request_deadline(0.5):
+        with pytest.raises(requests.exceptions.RequestException) as info:
+            http_get(server['url'], timeout=30, session=session)
+    assert time.monotonic() - t0 < 2
+    assert describe_error(info.value)['kind'] == "timeout"
+
+
+def test_expired_deadline_sends_nothing(server, session):
+    with request_deadline(-1):
+        with pytest.raises(DeadlineExceeded):
+            http_get(server['url'], session=session)
+    assert server['stats']['requests'] == 0
+
+
+def test_deadline_timeout_shrinks_per_attempt():
+    timeout = DeadlineTimeout(10, 30, time.monotonic() + 2)
+    assert timeout.total <= 2
+    time.sleep(0.05)
+    clone = timeout.clone()
+    assert clone.total < timeout.total and clone.deadline == timeout.deadline
+    assert clone.connect_timeout <= clone.total
+    assert DeadlineTimeout(10, 30, time.monotonic() - 1).total == 0.001
+
+
+def test_retry_after_beyond_deadline_gives_up():
+    retry = DeadlineRetry(total=3,
+                          status_forcelist=[503],
+                          respect_retry_after_header=True)
+    response = urllib3.HTTPResponse(status=503,
+                                    headers={"Retry-After": "30"})
+    # 沒有期限時照常重試
+    assert retry.increment("GET", "/page", response=response).total == 2
+    with collect() as run, request_deadline(5):
+        with pytest.raises(MaxRetryError, match="deadline reached"):
+            retry.increment("GET", "/page", response=response)
+    assert run['counters']['http.deadline_exceeded'] == 1
+
+
+def test_read_capped_limits():
+    resp = raw_response(b"abc" * 10)
+    assert read_capped(resp, max_bytes=30) == b"abc" * 10
+    assert resp.content == b"abc" * 10
+
+    # Content-Length 已超過上限：不讀取內容
+    resp = raw_response(b"abc", {"Content-Length": "4096"})
+    with pytest.raises(ResponseTooLarge, match="Content-Length"):
+        read_capped(resp, max_bytes=100)
+    assert resp.raw.tell() == 0
+
+    # 沒有 Content-Length 時邊讀邊檢查
+    with pytest.raises(ResponseTooLarge) as info:
+        read_capped(raw_response(b"x" * 200_000), max_bytes=100_000)
+    assert describe_error(info.value)['kind'] == "too_large"
+
+
+def test_read_capped_stops_at_deadline():
+    with collect() as run, request_deadline(-1):
+        with pytest.raises(DeadlineExceeded):
+            read_capped(raw_response(b"x" * 10))
+    assert run['counters']['http.deadline_exceeded'] == 1
+
+
+def test_too_large_over_the_wire(server, session):
+    with pytest.raises(ResponseTooLarge):
+        http_get(server['url'], max_bytes=1000, session=session)
@@ -0,0 +1,144 @@
+import random
+
+import pandas as pd
+import pytest
+
+import baseline
+from nitrosamine_monitor.bench import build_fixtures
+from nitrosamine_monitor.matching import (build_match_index, edit_distance,
+                                          find_matches)
+from nitrosamine_monitor.sources import parse_ema_workbook, parse_fda_page
+
+# 含符號、空白、數字與非 ASCII 的產品名稱 (片語 token 與 \b 邊界)
+SYMBOL_PRODUCTS = [
+    "L-Dopa/Carbidopa", "Mg.Stearate", "2,4-D", "Vitamin B12 (cyano)",
+    "Sodium Chloride", "Ab", "Acid", "Compound 12-A", "Écarinase",
+    "Co-Q10", "N,N-Dimethyl Tryptamine", "C.I. Blue 15:3", "Sita Gliptin"
+]
+SYMBOL_ROWS = [
+    ["N-nitroso-dopa/carbidopa", "L-DOPA/CARBIDOPA tablets"],
+    ["xdopa/carbidopa", "dopa/carbidopax"],
+    ["Mg.Stearate.", "MG.STEARATES"],
+    ["2,4-D herbicide", "12,4-D"],
+    ["(cyano) B12", "vitamin b12(cyano)x"],
+    ["sodium chloride", None],
+    ["AB", "ab-cd", "abc"],
+    ["acid", "Compound 12-A"],
+    ["écarinase", "ÉCARINASES"],
+    ["CO-Q10", "q10"],
+    ["n,n-dimethyl", "tryptamine"],
+    ["C.I. BLUE 15:3", "blue 15:30"],
+    ["sitagliptin", "SITA-GLIPTIN", "sita gliptin"],
+    [1500, 26.5, None],
+]
+
+
+def as_pairs(frame):
+    return list(frame[['row', 'product']].itertuples(index=False, name=None))
+
+
+@pytest.fixture(scope="module")
+def symbol_case():
+    api_list = [{'name': name, 'spt': "N/A"} for name in SYMBOL_PRODUCTS]
+    df = pd.DataFrame(SYMBOL_ROWS)
+    return api_list, df
+
+
+def regulatory_frames(fixtures):
+    return [
+        parse_fda_page(fixtures['fda_html'])[0],
+        parse_ema_workbook(fixtures['ema_xlsx'])[0]
+    ]
+
+
+@pytest.mark.parametrize("mode", ["token", "regex"])
+def test_exact_modes_match_smart_match(fixtures, mode):
+    names = sorted({
+        name
+        for page in baseline.parse_pdf_pages(fixtures['pdf'])
+        for name in page
+    })
+    api_list = [{'name': name, 'spt': "N/A"} for name in names]
+    match_index = build_match_index(api_list)
+    for df in regulatory_frames(fixtures):
+        assert as_pairs(find_matches(match_index, df, mode)) == \
+            baseline.match_pairs(api_list, df)
+
+
+@pytest.mark.parametrize("mode", ["token", "regex"])
+def test_exact_modes_symbol_tokens(symbol_case, mode):
+    api_list, df = symbol_case
+    match_index = build_match_index(api_list)
+    pairs = as_pairs(find_matches(match_index, df, mode))
+    assert pairs == baseline.match_pairs(api_list, df)
+    assert pairs
+
+
+def typo_frame(names, seed=0):
+    # 產品名稱的第一個字加上單字元的增刪改、兩處修改、以及拆成兩個字，
+    # 每種各一列 (與原名不同列，分數不會被完全相同的字蓋過)
+    rng = random.Random(seed)
+    rows = []
+    for name in names:
+        word = name.split()[0]
+        pos = rng.randrange(len(word))
+        rows += [
+            [word[:pos] + word[pos + 1:]],
+            [word[:pos] + "x" + word[pos:]],
+            [word[:pos] + "q" + word[pos + 1:]],
+            [word[:pos] + "qq" + word[pos + 2:]],
+            [word[:len(word) // 2] + " " + word[len(word) // 2:]],
+            [name.replace(" ", "-")],
+        ]
+    return pd.DataFrame(rows)
+
+
+@pytest.mark.parametrize("threshold", [0.7, 0.85, 1.0])
+def test_fuzzy_matches_brute_force(threshold):
+    fixtures = build_fixtures(40, seed=3)
+    names = sorted({
+        name
+        for page in baseline.parse_pdf_pages(fixtures['pdf'])
+        for name in page
+    })
+    api_list = [{'name': name, 'spt': "N/A"} for name in names
+                ] + [{'name': name, 'spt': "N/A"} for name in SYMBOL_PRODUCTS]
+    frames = [
+        typo_frame(names),
+        pd.DataFrame(SYMBOL_ROWS),
+        parse_fda_page(fixtures['fda_html'])[0]
+    ]
+    match_index = build_match_index(api_list, fuzzy_threshold=threshold)
+    for df in frames:
+        found = find_matches(match_index, df, "fuzzy")
+        expected = baseline.fuzzy_pairs(api_list, df, threshold)
+        assert {(r, p): s
+                for r, p, s in found[['row', 'product', 'score']].itertuples(
+                    index=False, name=None)} == expected
+
+
+def test_fuzzy_index_built_on_first_use(symbol_case):
+    api_list, df = symbol_case
+    match_index = build_match_index(api_list)
+    find_matches(match_index, df, "token")
+    find_matches(match_index, df, "regex")
+    assert match_index['fuzzy_map'] is None
+    find_matches(match_index, df, "fuzzy")
+    assert match_index['fuzzy_map'] is not None
+
+
+def test_fuzzy_threshold_must_be_positive(symbol_case):
+    api_list, df = symbol_case
+    match_index = build_match_index(api_list, fuzzy_threshold=0)
+    with pytest.raises(ValueError):
+        find_matches(match_index, df, "fuzzy")
+
+
+def test_edit_distance_matches_dynamic_programming():
+    rng = random.Random(0)
+    for _ in range(3000):
+        a = "".join(rng.choice("abcÉ1") for _ in range(rng.randrange(0, 12)))
+        b = "".join(rng.choice("abcÉ1") for _ in range(rng.randrange(0, 12)))
+        limit = rng.randrange(0, 6)
+        assert edit_distance(a, b, limit) == min(baseline.levenshtein(a, b),
+                                                 limit + 1)
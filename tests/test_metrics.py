@@ -0,0 +1,101 @@
+import contextvars
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from nitrosamine_monitor.metrics import (METRICS_SCHEMA, collect,
+                                         count_metric, current_run,
+                                         metrics_rows, metrics_to_dict,
+                                         metrics_to_json, peak_metric, stage,
+                                         stage_wall_times)
+from nitrosamine_monitor.pipeline import run_analysis
+from nitrosamine_monitor.products import parse_uploaded_file
+
+
+def test_stages_and_counters_accumulate():
+    with collect() as run:
+        for _ in range(3):
+            with stage("match"):
+                with stage("match/FDA"):
+                    count_metric("match.pairs/FDA", 2)
+        count_metric("http.requests")
+        peak_metric("export.peak_bytes", 5)
+        peak_metric("export.peak_bytes", 3)
+    assert run['stages']['match']['calls'] == 3
+    assert run['stages']['match/FDA']['calls'] == 3
+    assert run['stages']['match']['wall'] >= run['stages']['match/FDA']['wall']
+    assert run['counters'] == {
+        'match.pairs/FDA': 6,
+        'http.requests': 1,
+        'export.peak_bytes': 5
+    }
+    assert run['finished'] is not None
+    assert list(stage_wall_times(run)) == ["match"]
+    assert list(stage_wall_times(run, top_level=False)) == [
+        "match/FDA", "match"
+    ]
+
+
+def test_outside_run_is_noop():
+    assert current_run() is None
+    with stage("fetch"):
+        count_metric("http.requests")
+        peak_metric("export.peak_bytes", 1)
+    assert current_run() is None
+
+
+def test_nested_collect_reuses_run():
+    with collect() as outer:
+        with collect() as inner:
+            count_metric("http.requests")
+        assert inner is outer and outer['finished'] is None
+    assert outer['counters']['http.requests'] == 1
+
+
+def test_worker_threads_need_copied_context():
+    with collect() as run:
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            pool.submit(contextvars.copy_context().run, count_metric,
+                        "copied").result()
+            pool.submit(count_metric, "plain").result()
+    assert run['counters'] == {'copied': 1}
+
+
+def test_json_schema():
+    with collect() as run:
+        with stage("fetch"):
+            count_metric("http.bytes_downloaded", 1024)
+    doc = json.loads(metrics_to_json(run))
+    assert doc == metrics_to_dict(run)
+    assert doc['schema'] == METRICS_SCHEMA == 1
+    assert set(doc) == {'schema', 'started', 'finished', 'stages', 'counters'}
+    [entry] = doc['stages']
+    assert set(entry) == {'stage', 'wall', 'cpu', 'calls'}
+    assert entry['stage'] == "fetch" and entry['calls'] == 1
+    assert doc['counters'] == {'http.bytes_downloaded': 1024}
+
+    rows = metrics_rows(run)
+    assert [row['Metric'] for row in rows] == ["fetch",
+                                               "http.bytes_downloaded"]
+    assert rows[1]['Calls / Value'] == 1024 and rows[1]['Wall (s)'] is None
+
+
+def test_analysis_run_records_pipeline(fixtures, fetchers, caches):
+    products = io.BytesIO(fixtures['csv'])
+    products.name = "p.csv"
+    api_list, _ = parse_uploaded_file(products)
+    result = run_analysis(api_list, fetchers=fetchers)
+    run = result['metrics']
+
+    for name in ("fetch", "fetch/FDA", "fetch/EMA", "snapshot", "match",
+                 "match/FDA", "match/EMA"):
+        assert run['stages'][name]['calls'] == 1, name
+    counters = run['counters']
+    assert counters['match.comparisons/FDA'] == (len(result['fda_df']) *
+                                                 len(api_list))
+    assert counters['match.comparisons/EMA'] == (len(result['ema_df']) *
+                                                 len(api_list))
+    assert counters['match.pairs/FDA'] + counters['match.pairs/EMA'] >= len(
+        result['summary'])
+    assert set(result['timings']) == {"fetch", "snapshot", "match"}
+    assert json.loads(metrics_to_json(run))['counters'] == counters
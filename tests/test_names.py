@@ -0,0 +1,203 @@
+import json
+import threading
+from collections import Counter
+
+import pandas as pd
+import pytest
+
+import baseline
+from nitrosamine_monitor import names, pdf_parse, synthetic
+from nitrosamine_monitor.metrics import collect
+from nitrosamine_monitor.names import (clean_api_name, clean_api_names,
+                                       memoized, memoized_many,
+                                       merge_name_memo, name_memo_stats,
+                                       record_new_entries, save_name_memo,
+                                       take_new_entries)
+from nitrosamine_monitor.pdf_parse import parse_product_pdfs
+
+
+def fresh_memo():
+    return {
+        'lock': threading.Lock(),
+        'tables': {},
+        'loaded': False,
+        'dirty': False,
+        'hits': Counter(),
+        'misses': Counter(),
+        'added': None
+    }
+
+
+@pytest.fixture
+def memo(monkeypatch, caches):
+    # 每個測試一份空的行程內快取 (磁碟檔案在 caches 的暫存目錄)
+    monkeypatch.setattr(names, "_memo", fresh_memo())
+    return monkeypatch
+
+
+def counting(fn):
+    calls = []
+
+    def wrapped(raw):
+        calls.append(raw)
+        return fn(raw)
+
+    wrapped.calls = calls
+    return wrapped
+
+
+def test_memoized_computes_once(memo):
+    upper = counting(str.upper)
+    with collect() as run:
+        assert [memoized("upper", raw, upper)
+                for raw in ["a", "b", "a", "a"]] == ["A", "B", "A", "A"]
+    assert upper.calls == ["a", "b"]
+    assert run['counters'] == {
+        'name_memo.misses/upper': 2,
+        'name_memo.hits/upper': 2
+    }
+    assert name_memo_stats()["upper"] == {
+        'size': 2,
+        'hits': 2,
+        'misses': 2,
+        'hit_rate': 0.5
+    }
+    # 非字串不快取
+    length = counting(len)
+    assert memoized("upper", ("x", ), length) == 1
+    assert memoized("upper", ("x", ), length) == 1
+    assert len(length.calls) == 2
+
+
+def test_lru_keeps_recently_used(memo):
+    memo.setattr(names, "NAME_MEMO_SIZE", 3)
+    for raw in "abc":
+        memoized("upper", raw, str.upper)
+    memoized("upper", "a", str.upper)
+    memoized_many("upper", ["d"], lambda raws: [r.upper() for r in raws])
+    assert list(names._memo['tables']["upper"]) == ["c", "a", "d"]
+
+
+def test_memoized_many_only_computes_missing(memo):
+    memoized("upper", "a", str.upper)
+    batches = []
+
+    def upper_many(raws):
+        batches.append(list(raws))
+        return [r.upper() for r in raws]
+
+    assert memoized_many("upper", ["a", "b", "c"], upper_many) == {
+        "a": "A",
+        "b": "B",
+        "c": "C"
+    }
+    assert memoized_many("upper", ["b", "c"], upper_many) == {
+        "b": "B",
+        "c": "C"
+    }
+    assert batches == [["b", "c"]]
+
+
+def test_saved_memo_is_reloaded(memo):
+    memoized("upper", "a", str.upper)
+    memoized("tokens", "b c", lambda raw: frozenset(raw.split()))
+    memoized("valid", "ab", lambda raw: False)
+    assert save_name_memo()
+    assert not save_name_memo()
+
+    # 下一次執行：不重新計算，值 (含 frozenset / bool) 與原本相同
+    memo.setattr(names, "_memo", fresh_memo())
+    fail = counting(lambda raw: pytest.fail(f"recomputed {raw}"))
+    assert memoized("upper", "a", fail) == "A"
+    assert memoized("tokens", "b c", fail) == frozenset({"b", "c"})
+    assert memoized("valid", "ab", fail) is False
+
+
+def test_reload_drops_old_version_and_trims(memo):
+    for raw in "abcd":
+        memoized("upper", raw, str.upper)
+    save_name_memo()
+
+    memo.setattr(names, "_memo", fresh_memo())
+    memo.setattr(names, "NAME_MEMO_SIZE", 2)
+    memoized("other", "x", str.upper)
+    assert list(names._memo['tables']["upper"]) == ["c", "d"]
+
+    with open(names.NAME_MEMO_PATH, "r", encoding="utf-8") as f:
+        saved = json.load(f)
+    saved['version'] = names.NAME_MEMO_VERSION + 1
+    with open(names.NAME_MEMO_PATH, "w", encoding="utf-8") as f:
+        json.dump(saved, f)
+    memo.setattr(names, "_memo", fresh_memo())
+    memoized("other", "x", str.upper)
+    assert "upper" not in names._memo['tables']
+
+
+def test_save_failure_keeps_entries_dirty(memo, tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("x")
+    memoized("upper", "a", str.upper)
+    assert not save_name_memo(str(blocker / "names.json"))
+    assert names._memo['dirty']
+    assert save_name_memo(str(tmp_path / "names.json"))
+
+
+def test_persist_disabled(memo):
+    memo.setattr(names, "NAME_MEMO_PERSIST", False)
+    memoized("upper", "a", str.upper)
+    assert not save_name_memo()
+
+
+def test_new_entries_merge_into_another_process(memo):
+    # 子行程：initializer 之後新增的項目由 take_new_entries 取回
+    memoized("upper", "a", str.upper)
+    assert take_new_entries() == {}
+    record_new_entries()
+    memoized("upper", "a", str.upper)
+    memoized("upper", "b", str.upper)
+    entries = take_new_entries()
+    assert entries == {"upper": {"b": "B"}}
+    assert take_new_entries() == {}
+
+    # 主行程：併入但不覆蓋已有的項目，也不計入命中率
+    memo.setattr(names, "_memo", fresh_memo())
+    memoized("upper", "b", lambda raw: "kept")
+    merge_name_memo({"upper": {"b": "B", "c": "C"}})
+    assert dict(names._memo['tables']["upper"]) == {"b": "kept", "c": "C"}
+    assert name_memo_stats()["upper"]['hits'] == 0
+    assert names._memo['dirty']
+
+
+def test_pdf_workers_return_their_entries(memo):
+    merged = []
+    memo.setattr(pdf_parse, "merge_name_memo",
+                 lambda entries: merged.append(entries) or
+                 merge_name_memo(entries))
+    pdf = synthetic.make_product_pdf(synthetic.product_names(90, 9137),
+                                     seed=9137)
+    [(pages, error)] = parse_product_pdfs([pdf], workers=2, use_cache=False)
+    assert error is None
+    # 子行程新增的項目經 take_new_entries 帶回主行程 (子行程自磁碟載入的項目不回傳)
+    returned = {
+        raw: value
+        for entries in merged for raw, value in entries.get("clean",
+                                                             {}).items()
+    }
+    assert returned
+    clean = names._memo['tables']["clean"]
+    assert all(clean[raw] == value for raw, value in returned.items())
+    assert set(returned.values()) <= {name for page in pages for name in page}
+
+
+def test_clean_api_names_matches_single_calls(memo):
+    raws = pd.Series([
+        "Losartan (USP)®", " Ebastine™ ", "Sitagliptin*", "Losartan (USP)®",
+        "Valsartan (a) (b)", ""
+    ])
+    assert clean_api_names(raws).tolist() == [
+        baseline.clean_api_name(raw) for raw in raws
+    ]
+    # 整欄版本存入的項目與單筆版本共用
+    fail = counting(lambda raw: pytest.fail(f"recomputed {raw}"))
+    assert memoized("clean", " Ebastine™ ", fail) == "Ebastine"
+    assert clean_api_name("Valsartan (a) (b)") == "Valsartan"
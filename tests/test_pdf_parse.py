@@ -0,0 +1,63 @@
+import io
+
+import pdfplumber
+import pytest
+
+import baseline
+from nitrosamine_monitor import synthetic
+from nitrosamine_monitor.metrics import collect
+from nitrosamine_monitor.pdf_parse import (first_column_cells,
+                                           parse_product_pdfs)
+
+
+def test_first_column_matches_extract_tables(fixtures):
+    with pdfplumber.open(io.BytesIO(fixtures['pdf'])) as pdf:
+        for page in pdf.pages:
+            assert first_column_cells(page) == [
+                row[0] for table in page.extract_tables() for row in table
+                if row
+            ]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_pdf_pages_match_baseline(fixtures, workers):
+    [(pages, error)] = parse_product_pdfs([fixtures['pdf']],
+                                          workers=workers,
+                                          use_cache=False)
+    assert error is None
+    assert pages == baseline.parse_pdf_pages(fixtures['pdf'])
+
+
+def test_pdf_workers_keep_input_order():
+    blobs = [
+        synthetic.make_product_pdf(synthetic.product_names(90, seed),
+                                   seed=seed) for seed in range(3)
+    ] + [b"%PDF-1.4 broken"]
+    serial = parse_product_pdfs(blobs, workers=1, use_cache=False)
+    assert parse_product_pdfs(blobs, workers=3, use_cache=False) == serial
+    assert [pages for pages, _ in serial[:3]] == [
+        baseline.parse_pdf_pages(blob) for blob in blobs[:3]
+    ]
+    assert serial[3][1]
+
+
+def test_pdf_page_cache_hits_match_parsing(caches):
+    names = synthetic.product_names(100, seed=5)
+    first = synthetic.make_product_pdf(names, seed=5)
+    # 只有最後一頁不同：其他頁以內容指紋命中
+    second = synthetic.make_product_pdf(names[:-1] + ["Zorbinase"], seed=5)
+
+    with collect() as run:
+        cold = parse_product_pdfs([first], workers=1)
+    assert run['counters']['pdf_cache.misses/page'] == 3
+
+    with collect() as run:
+        warm = parse_product_pdfs([first], workers=1)
+    assert run['counters']['pdf_cache.hits/document'] == 1
+    assert warm == cold == [(baseline.parse_pdf_pages(first), None)]
+
+    with collect() as run:
+        changed = parse_product_pdfs([second], workers=1)
+    assert run['counters']['pdf_cache.hits/page'] == 2
+    assert run['counters']['pdf_cache.misses/page'] == 1
+    assert changed == [(baseline.parse_pdf_pages(second), None)]
@@ -0,0 +1,76 @@
+import io
+
+import pytest
+
+import baseline
+from nitrosamine_monitor import products
+from nitrosamine_monitor.products import parse_uploaded_file
+
+# 各種欄位組合：副產品欄合併、找不到產品欄 (用第一欄)、全數值欄 (整列升為 float)、
+# 泛稱 compound、重複名稱、空白與缺值、分批讀取時後段才改變型別的欄位
+EDGE_CSVS = {
+    "merge": ("Product 1,Product 2,SPT No\n"
+              "Losartan,Potassium,SPT-1\n"
+              "Losartan,,SPT-2\n"
+              "Losartan Potassium,nan,\n"
+              "Compound 12-A,,SPT-3\n"
+              "Compound X-ray,,SPT-4\n"
+              ",API,SPT-5\n"
+              "Ab,,SPT-6\n"
+              "Valsartan (USP)®,Intermediate,7\n"),
+    "first_column": ("Code,Remark\n"
+                     "Sitagliptin*,a\n"
+                     "  Sitagliptin ,b\n"
+                     "Ebastine™,\n"),
+    "numeric": ("Item,SPT\n"
+                "101,1\n"
+                "102,\n"
+                "103,3\n"),
+    "empty": "Product,SPT\n",
+    "late_text": ("Product,SPT\n" +
+                  "".join(f"Drug{i},00{i}\n" for i in range(1, 9)) +
+                  "Drug9,SPT-9\n"),
+    "late_float": ("Item,SPT\n" + "".join(f"{100 + i},{i}\n"
+                                         for i in range(8)) + "200,\n" +
+                   "201,2.5\n"),
+    "late_name": ("Name,Remark\n" +
+                  "".join(f"{i}.50,x\n" for i in range(8)) + "Losartan,y\n")
+}
+
+
+def named_file(data, name):
+    # 模擬 Streamlit UploadedFile (需要 .name 判斷格式)
+    f = io.BytesIO(data)
+    f.name = name
+    return f
+
+
+def test_upload_csv_matches_baseline(fixtures, caches):
+    result, _ = parse_uploaded_file(named_file(fixtures['csv'], "p.csv"))
+    assert result == baseline.parse_uploaded_file(
+        named_file(fixtures['csv'], "p.csv"))
+    assert result
+
+
+def test_upload_xlsx_matches_csv_and_baseline(fixtures, caches):
+    result, _ = parse_uploaded_file(named_file(fixtures['xlsx'], "p.xlsx"))
+    assert result == baseline.parse_uploaded_file(
+        named_file(fixtures['xlsx'], "p.xlsx"))
+    assert result == parse_uploaded_file(named_file(fixtures['csv'],
+                                                    "p.csv"))[0]
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 3, 7, 100000])
+@pytest.mark.parametrize("case", sorted(EDGE_CSVS))
+def test_upload_edge_cases(case, chunk_rows, monkeypatch, caches):
+    monkeypatch.setattr(products, "UPLOAD_CHUNK_ROWS", chunk_rows)
+    data = EDGE_CSVS[case].encode("utf-8")
+    result, _ = parse_uploaded_file(named_file(data, "p.csv"))
+    assert result == baseline.parse_uploaded_file(named_file(data, "p.csv"))
+
+
+def test_upload_cp1252_fallback(caches):
+    data = "Product,SPT\nCafé Acid,SPT-1\nNaïve Base,SPT-2\n".encode("cp1252")
+    result, _ = parse_uploaded_file(named_file(data, "p.csv"))
+    assert result == baseline.parse_uploaded_file(named_file(data, "p.csv"))
+    assert [p['name'] for p in result] == ["Café Acid", "Naïve Base"]
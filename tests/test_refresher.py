@@ -0,0 +1,132 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from nitrosamine_monitor.pipeline import run_analysis
+from nitrosamine_monitor.refresher import (get_snapshot, refresher_fetchers,
+                                           refresher_status, request_refresh,
+                                           start_refresher, stop_refresher)
+
+
+def table(tag):
+    return (pd.DataFrame({"Nitrosamine": [f"NDMA {tag}"]}), tag, [tag])
+
+
+def scripted(outcomes):
+    # 依序回傳 / 拋出 outcomes，用完後重複最後一個
+    calls = []
+
+    def fetch():
+        calls.append(time.monotonic())
+        outcome = outcomes[min(len(calls), len(outcomes)) - 1]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    fetch.calls = calls
+    return fetch
+
+
+def wait_for(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def refresher():
+    states = []
+
+    def start(fetchers, **kwargs):
+        kwargs.setdefault('intervals', {name: 3600 for name in fetchers})
+        kwargs.setdefault('retry', 3600)
+        states.append(start_refresher(fetchers, **kwargs))
+        return states[-1]
+
+    yield start
+    for state in states:
+        stop_refresher(state, timeout=5)
+        assert not state['thread'].is_alive()
+
+
+def test_cold_start_waits_for_first_load(refresher):
+    gate = threading.Event()
+    v1 = table("v1")
+
+    def slow():
+        gate.wait(5)
+        return v1
+
+    state = refresher({"FDA": slow})
+    threading.Timer(0.05, gate.set).start()
+    assert get_snapshot(state, "FDA", wait=5) is v1
+    assert state['status']["FDA"]['refreshes'] == 1
+
+
+def test_refresh_swaps_whole_snapshot(refresher):
+    v1, v2 = table("v1"), table("v2")
+    state = refresher({"FDA": scripted([v1, v2])})
+    assert get_snapshot(state, "FDA") is v1
+
+    request_refresh(state)
+    wait_for(lambda: state['status']["FDA"]['refreshes'] == 2)
+    assert get_snapshot(state, "FDA") is v2
+    assert v1[0]["Nitrosamine"].tolist() == ["NDMA v1"]
+
+
+@pytest.mark.parametrize("failure", [
+    ConnectionError("reset by peer"),
+    (pd.DataFrame(), "N/A", ["General Error: boom"])
+])
+def test_failure_keeps_previous_and_retries(refresher, failure):
+    v1, v3 = table("v1"), table("v3")
+    fetch = scripted([v1, failure, v3])
+    state = refresher({"EMA": fetch}, retry=0.2)
+    assert get_snapshot(state, "EMA") is v1
+
+    request_refresh(state)
+    wait_for(lambda: state['status']["EMA"]['failures'] == 1)
+    status = state['status']["EMA"]
+    assert status['ok'] is False
+    assert ("reset by peer" if isinstance(failure, Exception) else
+            "General Error: boom") in status['message']
+    # 失敗期間仍提供上一份快照
+    assert get_snapshot(state, "EMA") is v1
+
+    # 不需手動觸發：retry 秒後自動重試
+    wait_for(lambda: state['status']["EMA"]['refreshes'] == 2)
+    assert get_snapshot(state, "EMA") is v3
+    assert fetch.calls[2] - fetch.calls[1] >= 0.2
+    assert state['status']["EMA"]['ok'] is True
+
+
+def test_no_snapshot_yet_raises(refresher):
+    state = refresher({"FDA": scripted([ValueError("bad page")])})
+    with pytest.raises(RuntimeError, match="bad page"):
+        get_snapshot(state, "FDA", wait=5)
+
+
+def test_sources_refresh_independently(refresher):
+    fda, ema = scripted([table("f1"), table("f2")]), scripted([table("e1")])
+    state = refresher({"FDA": fda, "EMA": ema})
+    get_snapshot(state, "FDA")
+    get_snapshot(state, "EMA")
+
+    request_refresh(state, ["FDA"])
+    wait_for(lambda: state['status']["FDA"]['refreshes'] == 2)
+    assert len(fda.calls) == 2 and len(ema.calls) == 1
+    rows = {row['Source']: row for row in refresher_status(state)}
+    assert rows["FDA"]['Status'] == rows["EMA"]['Status'] == "✅"
+    assert rows["EMA"]['Next refresh (min)'] > 59
+
+
+def test_analysis_reads_refresher_snapshots(refresher, fetchers, caches):
+    state = refresher(fetchers)
+    api_list = [{'name': "Zorbinase", 'spt': "N/A"}]
+    result = run_analysis(api_list, fetchers=refresher_fetchers(state))
+    assert result['fetch_status']["FDA"]['ok']
+    assert result['fda_df'] is get_snapshot(state, "FDA")[0]
+    assert result['ema_df'] is get_snapshot(state, "EMA")[0]
@@ -0,0 +1,114 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import baseline
+from nitrosamine_monitor.metrics import collect
+from nitrosamine_monitor.report import (generate_excel,
+                                        load_history_fingerprints,
+                                        mark_new_records)
+
+
+def summary(rows, spt=True):
+    columns = ["Status", "Source", "ScinoPharm Product"]
+    columns += ["SPT Project num"] if spt else []
+    columns += ["Nitrosamine Impurity", "Limit (AI)"]
+    return pd.DataFrame(
+        [row if spt else row[:3] + row[4:] for row in rows], columns=columns)
+
+
+CURRENT = [
+    ["", "FDA", "Losartan", "SPT-1", "NDMA", 96.0],
+    ["", "FDA", "Losartan", "SPT-1", "NDEA", 26.5],
+    ["", "EMA", "Valsartan", "SPT-2", " ndma ", 96.0],
+    ["", "EMA", "Ebastine", 7, "NMBA", np.nan],
+    ["", "FDA", "Sitagliptin", None, "NTTP", 37.0],
+]
+
+
+def history_workbook(rows, spt=True, raw_rows=0):
+    # 與匯出的報表相同：Summary_Match + 兩個原始資料分頁 (可放大以確認不被讀取)
+    raw = pd.DataFrame({"Nitrosamine": [f"N{i}" for i in range(raw_rows)]})
+    return io.BytesIO(generate_excel(summary(rows, spt), raw, raw))
+
+
+HISTORIES = {
+    "first_only": [CURRENT[0]],
+    "case_and_space": [["", "EMA", "Valsartan", "spt-2 ", "NDMA", 1.0]],
+    "numeric_spt": [CURRENT[3], CURRENT[4]],
+    "other_impurity": [["", "FDA", "Losartan", "SPT-1", "NNK", 1.0]],
+}
+
+
+@pytest.mark.parametrize("case", sorted(HISTORIES))
+def test_single_history_matches_baseline(case):
+    expected = summary(CURRENT)
+    expected_count = baseline.mark_new_records(
+        expected, history_workbook(HISTORIES[case]))
+    result = summary(CURRENT)
+    count = mark_new_records(result, history_workbook(HISTORIES[case]))
+    assert count == expected_count
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def baseline_status(rows):
+    marked = summary(CURRENT)
+    baseline.mark_new_records(marked, history_workbook(rows))
+    return marked['Status'].to_numpy()
+
+
+def test_several_histories_union():
+    # 任何一份歷史報表出現過即不是新資料 (baseline 逐份標記，全部判定為新才算新)
+    histories = [history_workbook(rows) for rows in HISTORIES.values()]
+    result = summary(CURRENT)
+    with collect() as run:
+        count = mark_new_records(result, histories)
+
+    still_new = np.logical_and.reduce([
+        baseline_status(rows) == "★ NEW" for rows in HISTORIES.values()
+    ])
+    expected = summary(CURRENT)
+    expected['Status'] = np.where(still_new, "★ NEW", "")
+    # 數值 SPT 與缺值讀回為浮點 ("7.0")，與原本相同仍視為新資料
+    assert count == int(still_new.sum()) == 3
+    pd.testing.assert_frame_equal(result, expected)
+    assert run['counters']['history.fingerprints'] == 5
+
+
+def test_history_without_spt_column_uses_product(tmp_path):
+    # 舊報表沒有 SPT 欄：以第一欄 (Status) + 雜質名稱組成指紋，與原本相同
+    rows = [["", "FDA", "Losartan", "SPT-1", "NDMA", 96.0]]
+    path = tmp_path / "old.xlsx"
+    path.write_bytes(history_workbook(rows, spt=False).getvalue())
+    expected = summary(CURRENT)
+    expected_count = baseline.mark_new_records(expected, str(path))
+    result = summary(CURRENT)
+    assert mark_new_records(result, [str(path)]) == expected_count
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_history_reads_only_summary_columns(monkeypatch):
+    # 原始資料分頁很大時也只讀 Summary_Match 的兩個欄位
+    parsed = []
+    real_parse = pd.ExcelFile.parse
+
+    def spy_parse(self, sheet_name=0, **kwargs):
+        parsed.append((sheet_name, kwargs.get('usecols')))
+        return real_parse(self, sheet_name, **kwargs)
+
+    monkeypatch.setattr(pd.ExcelFile, "parse", spy_parse)
+    fingerprints = load_history_fingerprints(
+        history_workbook(CURRENT, raw_rows=2000))
+    assert {sheet for sheet, _ in parsed} == {"Summary_Match"}
+    assert parsed[-1][1] == ["SPT Project num", "Nitrosamine Impurity"]
+    assert "SPT-1|NDMA" in fingerprints and len(fingerprints) == 5
+
+
+def test_history_without_impurity_column_marks_all():
+    old = io.BytesIO()
+    pd.DataFrame({"Product": ["Losartan"]}).to_excel(old, index=False)
+    result = summary(CURRENT)
+    assert mark_new_records(result, old) == len(CURRENT)
+    assert (result['Status'] == "★ NEW").all()
@@ -0,0 +1,123 @@
+import io
+import time
+
+import pandas as pd
+
+from nitrosamine_monitor.matching import build_row_index
+from nitrosamine_monitor.metrics import collect
+from nitrosamine_monitor.pipeline import fetch_regulatory_data, run_analysis
+from nitrosamine_monitor.products import parse_uploaded_file
+from nitrosamine_monitor.refresher import (refresher_fetchers,
+                                           request_refresh, start_refresher,
+                                           stop_refresher)
+from nitrosamine_monitor.shared import (new_shared_cache, object_bytes,
+                                        session_bytes, share_snapshot,
+                                        shared_bytes)
+
+
+def assert_row_index_equal(result, expected):
+    assert list(result) == list(expected)
+    for key in expected:
+        pd.testing.assert_series_equal(result[key], expected[key])
+
+
+def test_snapshot_reused_while_tables_unchanged(fetchers):
+    cache = new_shared_cache()
+    data = fetch_regulatory_data(fetchers)
+    with collect() as run:
+        first = share_snapshot(cache, data)
+    assert run['counters'] == {'shared.builds': 2}
+    assert_row_index_equal(first['row_index']["FDA"],
+                           build_row_index(data['fda_df']))
+
+    # 下一個 session：同一份表格物件 (背景更新尚未替換)，下載狀態不同
+    again = dict(data, fetch_status={"FDA": "later"})
+    with collect() as run:
+        second = share_snapshot(cache, again)
+    assert run['counters'] == {'shared.hits': 2}
+    assert second['row_index'] is cache['snapshot']['row_index']
+    assert second['fda_df'] is data['fda_df']
+    assert second['fetch_status'] == {"FDA": "later"}
+
+    # 回傳的是淺複製：session 加入的欄位不影響共用快照
+    second['summary'] = "session only"
+    assert 'summary' not in cache['snapshot']
+
+
+def test_only_replaced_source_is_rebuilt(fetchers):
+    cache = new_shared_cache()
+    data = fetch_regulatory_data(fetchers)
+    first = share_snapshot(cache, data)
+
+    replaced = dict(data, ema_df=data['ema_df'].copy(), fetch_status={})
+    with collect() as run:
+        second = share_snapshot(cache, replaced)
+    assert run['counters'] == {'shared.hits': 1, 'shared.builds': 1}
+    assert second['row_index']["FDA"] is first['row_index']["FDA"]
+    assert second['row_index']["EMA"] is not first['row_index']["EMA"]
+    assert cache['snapshot']['ema_df'] is replaced['ema_df']
+
+    empty = dict(data, fda_df=pd.DataFrame(), fetch_status={})
+    assert share_snapshot(cache, empty)['row_index']["FDA"] is None
+
+
+def test_shared_bytes_recomputed_after_rebuild(fetchers):
+    cache = new_shared_cache()
+    assert shared_bytes(cache) == 0
+    data = fetch_regulatory_data(fetchers)
+    share_snapshot(cache, data)
+    size = shared_bytes(cache)
+    assert size == object_bytes(cache['snapshot']) > object_bytes(
+        data['fda_df'])
+
+    share_snapshot(cache, dict(data, fda_df=data['fda_df'].head(5)))
+    assert shared_bytes(cache) < size
+
+
+def test_session_bytes_excludes_shared_snapshot(fetchers):
+    cache = new_shared_cache()
+    snapshot = share_snapshot(cache, fetch_regulatory_data(fetchers))
+    own = pd.DataFrame({"API": ["Losartan"] * 100})
+
+    alone = session_bytes([own])
+    with_refs = session_bytes([own, snapshot], [cache['snapshot']])
+    # 引用共用快照只多出 session 自己那份淺複製 dict 的大小
+    assert alone <= with_refs < alone + 2048
+    assert object_bytes([own, snapshot]) > with_refs + object_bytes(
+        snapshot['fda_df'])
+    assert session_bytes([own], [None]) == alone
+
+
+def test_sessions_share_one_snapshot(fixtures, fetchers, caches):
+    products = io.BytesIO(fixtures['csv'])
+    products.name = "p.csv"
+    api_list, _ = parse_uploaded_file(products)
+    expected = run_analysis(api_list, fetchers=fetchers)['summary']
+
+    refresher = start_refresher(fetchers, retry=3600)
+    try:
+        cache = new_shared_cache()
+        results = [
+            run_analysis(api_list,
+                         fetchers=refresher_fetchers(refresher),
+                         shared=cache) for _ in range(2)
+        ]
+        for result in results:
+            pd.testing.assert_frame_equal(result['summary'], expected)
+        assert results[0]['row_index'] is results[1]['row_index']
+        assert results[1]['metrics']['counters']['shared.hits'] == 2
+        assert 'shared.builds' not in results[1]['metrics']['counters']
+
+        # 背景更新換了表格：下一個 session 重建前處理
+        request_refresh(refresher)
+        deadline = time.monotonic() + 10
+        while refresher['status']["FDA"]['refreshes'] < 2:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        result = run_analysis(api_list,
+                              fetchers=refresher_fetchers(refresher),
+                              shared=cache)
+        assert result['metrics']['counters']['shared.builds'] >= 1
+        pd.testing.assert_frame_equal(result['summary'], expected)
+    finally:
+        stop_refresher(refresher, timeout=5)
@@ -0,0 +1,93 @@
+import json
+import sqlite3
+
+import pandas as pd
+
+from nitrosamine_monitor import snapshots
+from nitrosamine_monitor.snapshots import (load_snapshot, snapshot_refs,
+                                           update_snapshot)
+
+
+def fda_table(rows):
+    return pd.DataFrame(rows, columns=["Nitrosamine", "Source", "Limit"])
+
+
+BASE = [["NDMA", "Drug A", "96"], ["NDEA", "Drug B", "26.5"],
+        ["NDMA", "Drug C", "96"]]
+
+
+def test_first_snapshot_marks_every_row(caches):
+    delta = update_snapshot("FDA", fda_table(BASE), "01/01/2024")
+    assert delta['previous_id'] is None and not delta['unchanged']
+    assert delta['added'] == [0, 1, 2]
+    assert delta['changed'] == [] and delta['removed'] == []
+
+
+def test_added_changed_and_removed_rows(caches):
+    first = update_snapshot("FDA", fda_table(BASE), "01/01/2024")
+    # NDEA 改值、第二個 NDMA 移除、新增 NMBA
+    second = update_snapshot(
+        "FDA",
+        fda_table([["NDMA", "Drug A", "96"], ["NMBA", "Drug D", "96"],
+                   ["NDEA", "Drug B", "30"]]), "02/01/2024")
+    assert second['previous_id'] == first['snapshot_id']
+    assert second['previous_source_date'] == "01/01/2024"
+    assert second['added'] == [1] and second['changed'] == [2]
+    assert second['removed'] == [["NDMA", "Drug C", "96"]]
+
+
+def test_unchanged_source_gives_empty_delta(caches):
+    update_snapshot("FDA", fda_table(BASE))
+    changed = update_snapshot("FDA", fda_table(BASE[:2]))
+    assert changed['removed']
+
+    # 下一次 (例如隔天) 執行來源未更新：不再重複上次的差異
+    again = update_snapshot("FDA", fda_table(BASE[:2]))
+    assert again['unchanged']
+    assert again['snapshot_id'] == changed['snapshot_id']
+    assert again['added'] == again['changed'] == again['removed'] == []
+    assert "無新增或變動" in snapshots.format_delta(again)
+    [ref] = snapshot_refs({"FDA": again})
+    assert ref['Snapshot ID'] == changed['snapshot_id'] and ref['Rows'] == 2
+
+
+def test_duplicate_and_colliding_columns_round_trip(caches):
+    # 重複欄名、1 與 "1" 經 str() 後相同：每列以欄位順序保存所有值
+    df = pd.DataFrame([["NDMA", "a", "b", "x", "y"], ["NDEA", "", "c", "", "z"]],
+                      columns=["name", "Note", "Note", 1, "1"])
+    delta = update_snapshot("EMA", df)
+    restored = load_snapshot(delta['snapshot_id'])
+    assert list(restored.columns) == ["name", "Note", "Note", "1", "1"]
+    assert restored.values.tolist() == df.values.tolist()
+
+    removed = update_snapshot("EMA", df.iloc[:1])['removed']
+    assert removed == [["NDEA", "", "c", "", "z"]]
+
+
+def test_legacy_dict_rows_still_load(caches):
+    delta = update_snapshot("FDA", fda_table(BASE))
+    with sqlite3.connect(snapshots.SNAPSHOT_DB) as conn:
+        conn.execute(
+            "UPDATE snapshot_rows SET row_data = ? WHERE snapshot_id = ? "
+            "AND row_pos = 2",
+            (json.dumps({"Nitrosamine": "NDMA", "Limit": "96"}),
+             delta['snapshot_id']))
+    restored = load_snapshot(delta['snapshot_id'])
+    assert restored.values.tolist()[2] == ["NDMA", "", "96"]
+
+    removed = update_snapshot("FDA", fda_table(BASE[:2]))['removed']
+    assert removed == [["NDMA", "", "96"]]
+
+
+def test_prune_keeps_latest_snapshots(caches, monkeypatch):
+    monkeypatch.setattr(snapshots, "SNAPSHOT_KEEP", 2)
+    ids = [
+        update_snapshot("FDA", fda_table(BASE[:n]))['snapshot_id']
+        for n in (1, 2, 3)
+    ]
+    update_snapshot("EMA", fda_table(BASE))
+    assert load_snapshot(ids[0]).empty
+    assert len(load_snapshot(ids[1])) == 2 and len(load_snapshot(ids[2])) == 3
+    with sqlite3.connect(snapshots.SNAPSHOT_DB) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM snapshot_rows WHERE "
+                            "snapshot_id = ?", (ids[0], )).fetchone()[0] == 0
@@ -0,0 +1,128 @@
+import io
+
+import pandas as pd
+
+import baseline
+from nitrosamine_monitor import sources, synthetic
+from nitrosamine_monitor.sources import (find_json_blocks, parse_ema_workbook,
+                                         parse_fda_page)
+
+
+def test_fda_page_matches_baseline(fixtures):
+    df, date, _ = parse_fda_page(fixtures['fda_html'])
+    expected, expected_date = baseline.parse_fda_page(fixtures['fda_html'])
+    assert date == expected_date
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_fda_page_edge_cases():
+    # 表頭空白 / 重複、沒有 thead、列比表頭短或長、隱藏文字、巢狀標籤、缺日期
+    html = (
+        "<html><head><style>td {color: red}</style></head><body>"
+        "<table><tr><th>Nitrosamine</th><th></th><th>Limit</th><th>X</th>"
+        "<th>X</th></tr>"
+        "<tr><td>NDMA <b>(x)</b><script>var a = 1;</script></td><td>1</td>"
+        "</tr><tr><td>NDEA</td><td>2</td><td>26.5</td><td>3</td><td>4</td>"
+        "<td>5</td></tr><tr><th>only header cells</th></tr></table>"
+        "<table><thead><tr><th>Impurity\n name</th><th>Source drug</th>"
+        "</tr></thead><tbody><tr><td>N-nitroso-x</td><td>Drug X</td></tr>"
+        "</tbody></table>"
+        "<table><tr><td>Revision</td></tr></table>"
+        "</body></html>")
+    df, date, _ = parse_fda_page(html)
+    expected, expected_date = baseline.parse_fda_page(html)
+    assert date == expected_date == "N/A"
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_fda_json_blocks_skip_non_records():
+    html = ('metadata: [{"a": 1}] data: [1, 2] "data": [{"x": 1}, {"x": 2}] '
+            "data: [not json]")
+    blocks, skipped = find_json_blocks(html)
+    assert [block[2] for block in blocks] == [[{"x": 1}, {"x": 2}]]
+    assert len(skipped) == 2
+
+
+def test_ema_workbook_matches_baseline(fixtures):
+    df, _ = parse_ema_workbook(fixtures['ema_xlsx'])
+    pd.testing.assert_frame_equal(df, baseline.parse_ema_workbook(
+        fixtures['ema_xlsx']))
+
+
+def test_ema_workbook_edge_cases():
+    # 無關鍵字的小分頁 / 5 列以上的分頁、公式錯誤值、整數值浮點、
+    # 表格中間與尾端的空白列、空白分頁
+    import openpyxl
+
+    wb = openpyxl.Workbook()
+    wb.active.title = "Notes"
+    wb.active.append(["Read me"])
+    wb.active.append([None, "see below"])
+
+    plain = wb.create_sheet("Plain")
+    for i in range(6):
+        plain.append([f"row {i}", i * 1.0, None if i % 2 else "x"])
+
+    wb.create_sheet("Empty")
+
+    table = wb.create_sheet("Table")
+    table.append(["EMA/409815/2020"])
+    table.append([])
+    table.append(["Name", "Source", "AI (ng/day)", "N/A", "Note"])
+    table.append(["NDMA", "Drug A", 96.0, "#N/A", None])
+    table.append([])
+    table.append(["NDEA", "Drug B", 26.5, None, "see 3"])
+    table.append(["N-nitroso-x", "Drug C", "1500*", 7, None])
+    table["D4"] = "=1/0"
+    table.append([])
+    table.append([])
+
+    output = io.BytesIO()
+    wb.save(output)
+    data = output.getvalue()
+
+    df, _ = parse_ema_workbook(data)
+    pd.testing.assert_frame_equal(df, baseline.parse_ema_workbook(data))
+
+
+def fake_source(pages):
+    # cached_get 的替身：依網址回傳固定內容
+    def fake_get(url, **kwargs):
+        content = pages[url]
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        return {
+            'url': url,
+            'status': 200,
+            'content': content,
+            'text': content.decode("utf-8", errors="replace"),
+            'from_cache': False
+        }
+
+    return fake_get
+
+
+def test_ema_date_and_workbook(fixtures, monkeypatch, caches):
+    page = synthetic.make_ema_page("/files/appendix.xlsx")
+    monkeypatch.setattr(
+        sources, "cached_get",
+        fake_source({
+            sources.EMA_PAGE_URL: page,
+            sources.EMA_BASE_URL + "/files/appendix.xlsx":
+            fixtures['ema_xlsx']
+        }))
+    df, date, _ = sources.get_ema_data()
+    assert date == synthetic.EMA_DATE
+    pd.testing.assert_frame_equal(df, baseline.parse_ema_workbook(
+        fixtures['ema_xlsx']))
+
+
+def test_ema_date_falls_back_to_page_text(monkeypatch, caches):
+    # "Last updated" 所在元素沒有日期時，改由整頁文字找 "First published"
+    page = ("<html><body><p>Last updated</p><p>First published: 01/05/2020"
+            "</p></body></html>")
+    monkeypatch.setattr(sources, "cached_get",
+                        fake_source({sources.EMA_PAGE_URL: page}))
+    df, date, logs = sources.get_ema_data()
+    assert date == "01/05/2020"
+    assert df.empty and logs == ["No link found"]
@@ -0,0 +1,124 @@
+import datetime
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from nitrosamine_monitor import table_cache
+from nitrosamine_monitor.metrics import collect
+from nitrosamine_monitor.table_cache import (evict_table_cache,
+                                             load_cached_table,
+                                             store_cached_table)
+
+RAW = b"<html>fda page v1</html>"
+
+
+def mixed_frame():
+    # object 欄位混合各種型別；重複欄名；數值欄維持原 dtype
+    mixed = [
+        None, pd.NA, np.nan, True, 7, 2.5, "NDMA",
+        pd.Timestamp("2024-01-02 03:04:05"),
+        datetime.datetime(2024, 1, 2, 3, 4), datetime.date(2024, 1, 2),
+        datetime.time(3, 4), -0.0
+    ]
+    n = len(mixed)
+    df = pd.DataFrame({
+        0: pd.Series(mixed, dtype=object),
+        1: np.arange(n, dtype="int64"),
+        2: np.linspace(0, 1, n),
+        3: pd.Series([f"s{i}" for i in range(n)], dtype=object)
+    })
+    df.columns = ["Nitrosamine", "Rows", "Limit", "Limit"]
+    return df
+
+
+def meta_path(source, raw):
+    return table_cache._entry_paths(source, raw)[1]
+
+
+def set_last_used(source, raw, last_used):
+    path = meta_path(source, raw)
+    with open(path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    meta['last_used'] = last_used
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+
+def test_round_trip_restores_values_and_types(caches):
+    df = mixed_frame()
+    assert store_cached_table("fda", RAW, df, {'date': "01/02/2024",
+                                               'logs': ["parsed"]})
+    with collect() as run:
+        cached_df, meta = load_cached_table("fda", RAW)
+    pd.testing.assert_frame_equal(cached_df, df)
+    assert [type(v) for v in cached_df.iloc[:, 0]] == [
+        type(v) for v in df.iloc[:, 0]
+    ]
+    assert meta['date'] == "01/02/2024" and meta['logs'] == ["parsed"]
+    assert run['counters']['table_cache.hits'] == 1
+
+
+def test_other_content_or_source_misses(caches):
+    store_cached_table("fda", RAW, mixed_frame(), {})
+    with collect() as run:
+        assert load_cached_table("fda", RAW + b" ") is None
+        assert load_cached_table("ema", RAW) is None
+    assert run['counters']['table_cache.misses'] == 2
+
+
+def test_version_bump_invalidates_entries(caches, monkeypatch):
+    store_cached_table("fda", RAW, mixed_frame(), {})
+    store_cached_table("ema", RAW, mixed_frame(), {})
+    old_meta = meta_path("fda", RAW)
+
+    monkeypatch.setitem(table_cache.TABLE_CACHE_VERSION, "fda",
+                        table_cache.TABLE_CACHE_VERSION["fda"] + 1)
+    assert load_cached_table("fda", RAW) is None
+    assert load_cached_table("ema", RAW) is not None
+
+    # 舊版本項目不論容量都會刪除；其他來源不受影響
+    assert evict_table_cache() == 1
+    assert not os.path.exists(old_meta)
+    assert not os.path.exists(old_meta[:-len(".json")] + ".parquet")
+    assert os.path.exists(meta_path("ema", RAW))
+
+
+def test_newer_version_entries_are_kept(caches, monkeypatch):
+    # 同時執行的新版程式寫入的項目不是過期項目
+    monkeypatch.setitem(table_cache.TABLE_CACHE_VERSION, "fda",
+                        table_cache.TABLE_CACHE_VERSION["fda"] + 1)
+    store_cached_table("fda", RAW, mixed_frame(), {})
+    monkeypatch.undo()
+    assert evict_table_cache() == 0
+
+
+def test_eviction_drops_least_recently_used(caches):
+    raws = [RAW + bytes([i]) for i in range(3)]
+    for raw in raws:
+        store_cached_table("fda", raw, mixed_frame(), {})
+    for raw, last_used in zip(raws, [300, 100, 200]):
+        set_last_used("fda", raw, last_used)
+
+    size = os.path.getsize(table_cache._entry_paths("fda", raws[0])[0])
+    assert evict_table_cache(max_bytes=size * 2) == 1
+    assert load_cached_table("fda", raws[1]) is None
+    assert load_cached_table("fda", raws[0]) is not None
+    assert load_cached_table("fda", raws[2]) is not None
+
+
+def test_disabled_cache(caches, monkeypatch):
+    monkeypatch.setattr(table_cache, "TABLE_CACHE_ENABLED", False)
+    assert not store_cached_table("fda", RAW, mixed_frame(), {})
+    assert load_cached_table("fda", RAW) is None
+    assert not os.path.exists(table_cache.TABLE_CACHE_DIR)
+
+
+@pytest.mark.parametrize("source", ["fda", "ema"])
+def test_content_key_includes_version(source, monkeypatch):
+    key = table_cache.content_key(source, RAW)
+    monkeypatch.setitem(table_cache.TABLE_CACHE_VERSION, source,
+                        table_cache.TABLE_CACHE_VERSION[source] + 1)
+    assert table_cache.content_key(source, RAW) != key